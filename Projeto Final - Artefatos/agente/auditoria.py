@@ -0,0 +1,337 @@
+"""
+Auditoria pós-extração, pra um documento ou um lote inteiro.
+
+Faz o que o `enrich_and_validate_extraction` + `check_for_missing_data` do app
+mostram (preenche Cod. Operação / Cod. Tributário pela descrição via regex,
+converte o valor dos itens, confere soma dos itens x valor total, vê o que falta
+no cabeçalho) e devolve flags por item/documento em vez de mensagens prontas:
+quem mostra (tela, CLI) é que formata.
+
+Dois caminhos com o mesmo resultado:
+- `auditar_documento`: item a item nos dicts, pro documento que o app mostra (com
+  50 itens o custo fixo de montar colunas seria maior que a auditoria);
+- `auditar_documentos` / `auditar_colunas`: vetorizado (pandas/pyarrow) sobre um
+  DataFrame com os itens de todos os documentos. É o caminho de lote e do JSONL: as
+  colunas são montadas uma vez só pro lote (`montar_itens`), ou já vêm prontas
+  (ex.: Parquet do exportacao.py). Números em benchmarks.bench_auditoria.
+
+Também roda como CLI em cima do JSONL do lote.py / extrator.py:
+
+    python auditoria.py resultado.jsonl -o auditoria.csv
+"""
+import argparse
+import json
+import math
+import re
+import time
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from modelos import ItemDocumento
+
+COLUNAS_ITEM = list(ItemDocumento.model_fields)
+COLUNAS_NUMERICAS = ["quantidade", "valor_unitario", "valor_total", "valor_aprox_taxas"]
+COLUNAS_AUDITORIA = ["descricao", "valor_total", "codigo_operacao", "codigo_tributario"]
+# mesmos regex do app (\b(\d{4})\b e \b(0\d{2}|[1-9]\d{1,2})\b), escritos pro RE2 do pyarrow:
+# o \b do RE2 so conhece ASCII, entao a borda de palavra unicode ("ção5102" nao casa) e feita na mao
+_BORDA_INICIO = r"(?:^|[^\pL\pN_])"
+_BORDA_FIM = r"(?:$|[^\pL\pN_])"
+PADRAO_COD_OP = _BORDA_INICIO + r"(?P<codigo>\d{4})" + _BORDA_FIM  # cfop (4 digitos)
+PADRAO_COD_TRIB = _BORDA_INICIO + r"(?P<codigo>0\d{2}|[1-9]\d{1,2})" + _BORDA_FIM  # cst (2-3 digitos)
+TOLERANCIA = 0.01  # 1 centavo
+# o RE2 compila o padrao (tabelas unicode do \pL/\pN) a cada chamada, ~7ms fixos: com poucas
+# linhas pra preencher (um documento na tela) o re do python, ja compilado, sai bem mais barato
+LIMIAR_PYARROW = 2000
+REGEX_COD_OP = re.compile(r"\b(\d{4})\b")  # os do app, borda unicode nativa
+REGEX_COD_TRIB = re.compile(r"\b(0\d{2}|[1-9]\d{1,2})\b")
+# o dtype "str" do pandas 3 (pyarrow por baixo, nan de vazio): o auditar_itens le como array do
+# pyarrow sem copiar
+TEXTO = pd.StringDtype("pyarrow", na_value=np.nan)
+COLUNAS_POR_DOCUMENTO = ["n_itens", "soma_itens", "valores_invalidos", "cod_op_regex", "cod_trib_regex",
+                         "valor_total_nota", "diferenca", "consistente", "falta_remetente", "falta_receptor",
+                         "valor_zerado", "sem_itens"]
+
+
+# --- item a item (dicts) ---
+
+def _valor(valor) -> tuple:
+    """(float, inválido): texto de número vale, como no float() do app; lixo, None, nan e inf viram 0.0."""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return 0.0, True
+    return (numero, False) if math.isfinite(numero) else (0.0, True)
+
+
+def auditar_documento(documento: dict, preencher_codigos: bool = True,
+                      tolerancia: float = TOLERANCIA) -> tuple[dict, list]:
+    """
+    Audita um documento (dict no formato DocumentoProcessado) item a item, mexendo
+    nos próprios itens como o loop antigo do app: valor_total vira float (inválido
+    vira 0.0) e os códigos faltando são preenchidos pela descrição.
+
+    Devolve (resumo, preenchidos): as colunas de uma linha do `por_documento`
+    (COLUNAS_POR_DOCUMENTO) e [(posição do item, coluna), ...] dos códigos que
+    vieram do regex, na ordem dos itens.
+    """
+    preenchidos = []
+    soma_itens, invalidos, por_op, por_trib = 0.0, 0, 0, 0
+    isfinite, busca_op, busca_trib = math.isfinite, REGEX_COD_OP.search, REGEX_COD_TRIB.search
+    itens = documento.get("itens") or []
+    for posicao, item in enumerate(itens):
+        try:
+            valor = float(item.get("valor_total"))
+        except (TypeError, ValueError):
+            valor = math.nan
+        if not isfinite(valor):
+            valor = 0.0
+            invalidos += 1
+        item["valor_total"] = valor
+        soma_itens += valor
+        if not preencher_codigos:
+            continue
+
+        # mesmas regras do app: cod. op. com tamanho != 4 e cod. trib. com < 2 caracteres (ou vazios).
+        # codigo pode vir int do JSONL (5102 sem aspas): conta os digitos em vez de quebrar no len
+        codigo_op, codigo_trib = item.get("codigo_operacao"), item.get("codigo_tributario")
+        if type(codigo_op) is not str:
+            codigo_op = "" if codigo_op is None else str(codigo_op)
+        if type(codigo_trib) is not str:
+            codigo_trib = "" if codigo_trib is None else str(codigo_trib)
+        if len(codigo_op) == 4 and len(codigo_trib) >= 2:
+            continue
+        descricao = item.get("descricao")
+        descricao = descricao if isinstance(descricao, str) else ""
+        if len(codigo_op) != 4:
+            achado = busca_op(descricao)
+            if achado:
+                item["codigo_operacao"] = achado.group(1)
+                preenchidos.append((posicao, "codigo_operacao"))
+                por_op += 1
+        if len(codigo_trib) < 2:
+            achado = busca_trib(descricao)
+            if achado:
+                item["codigo_tributario"] = achado.group(1)
+                preenchidos.append((posicao, "codigo_tributario"))
+                por_trib += 1
+
+    total_nota, _ = _valor(documento.get("valor_total_nota", 0.0))
+    diferenca = soma_itens - total_nota
+    resumo = {"n_itens": len(itens), "soma_itens": soma_itens, "valores_invalidos": invalidos,
+              "cod_op_regex": por_op, "cod_trib_regex": por_trib, "valor_total_nota": total_nota,
+              "diferenca": diferenca, "consistente": abs(diferenca) <= tolerancia, **faltas_cabecalho(documento)}
+    return resumo, preenchidos
+
+
+# --- em colunas ---
+
+
+def montar_itens(documentos: list, colunas: list = None) -> pd.DataFrame:
+    """
+    Itens de todos os documentos num DataFrame só; a coluna `documento` é a posição na
+    lista. Por padrão só as colunas que a auditoria usa: passar 1 milhão de dicts pra
+    colunas é a parte cara, cada coluna a menos conta.
+    """
+    listas = [d.get("itens") or [] for d in documentos]
+    itens = list(chain.from_iterable(listas))
+    dados = {"documento": np.repeat(np.arange(len(listas)), [len(l) for l in listas])}
+    for col in colunas or COLUNAS_AUDITORIA:
+        try:
+            valores = list(map(itemgetter(col), itens))  # item validado tem todas as chaves
+        except KeyError:
+            valores = [item.get(col) for item in itens]
+        dados[col] = _coluna(valores, numerica=col in COLUNAS_NUMERICAS)
+    return pd.DataFrame(dados, copy=False)
+
+
+def _coluna(valores: list, numerica: bool) -> pd.Series:
+    """
+    Lista -> coluna já no tipo certo (float / TEXTO), construída pelo numpy/pyarrow:
+    deixar o pandas inferir o dtype custava mais que a auditoria. Tipos misturados
+    (valor "10,50", código int) ficam object e o `auditar_itens` resolve.
+    """
+    try:
+        if numerica:
+            return pd.Series(np.array(valores, dtype=float))  # texto de numero vale, como no float()
+        return pd.Series(pd.array(pa.array(valores, type=pa.string()), dtype=TEXTO))
+    except (TypeError, ValueError, pa.ArrowInvalid, pa.ArrowTypeError):
+        return pd.Series(valores, dtype=object)
+
+
+def auditar_documentos(documentos: list, preencher_codigos: bool = True,
+                       tolerancia: float = TOLERANCIA) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Auditoria de um lote de dicts: monta as colunas dos itens uma vez e roda o
+    `auditar_colunas`. Os dicts não são alterados; devolve (por_documento, itens)
+    com os itens corrigidos em colunas.
+    """
+    documentos = list(documentos)
+    return auditar_colunas(documentos, montar_itens(documentos), preencher_codigos, tolerancia)
+
+
+def _numerico(coluna: pd.Series) -> np.ndarray:
+    try:
+        # caminho rapido: tudo numero (ou texto de numero, igual ao float() do app); None vira nan
+        return np.array(coluna.to_numpy(), dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(coluna, errors="coerce").to_numpy(dtype=float, copy=True)
+
+
+def _comprimento(coluna: pd.Series) -> np.ndarray:
+    """len() de cada código (vazio/None = 0)."""
+    try:
+        # caminho rapido: coluna TEXTO (sem copia) ou object so com texto; o astype("string") custa o dobro
+        return pc.fill_null(pc.utf8_length(pa.array(coluna, type=pa.string(), from_pandas=True)), 0).to_numpy()
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # codigo int do JSONL (5102 sem aspas)
+        return coluna.astype("string").str.len().fillna(0).to_numpy()
+
+
+def _preencher_por_regex(df: pd.DataFrame, coluna: str, faltando: np.ndarray, padrao: str, regex) -> np.ndarray:
+    """Preenche `coluna` nas linhas `faltando` com o 1o match na descrição; devolve a flag de preenchido."""
+    linhas = np.flatnonzero(faltando)
+    preenchido = np.zeros(len(df), dtype=bool)
+    if len(linhas) < LIMIAR_PYARROW:
+        achados = [regex.search(d) if isinstance(d, str) else None for d in df["descricao"].iloc[linhas]]
+        casou = np.array([a is not None for a in achados], dtype=bool)
+        valores = [a.group(1) for a in achados if a is not None]
+    else:
+        descricoes = df["descricao"].iloc[linhas]
+        try:
+            descricoes = pa.array(descricoes, type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            descricoes = pa.array(descricoes.astype("str").array)
+        # regex no pyarrow (C++, sem loop python por linha)
+        achado = pc.struct_field(pc.extract_regex(descricoes, padrao), [0])
+        casou = pc.is_valid(achado).to_numpy(zero_copy_only=False)
+        valores = pc.filter(achado, casou).to_numpy(zero_copy_only=False)
+    preenchido[linhas[casou]] = True
+    if preenchido.any():
+        df.loc[preenchido, coluna] = valores
+    return preenchido
+
+
+def auditar_itens(df: pd.DataFrame, preencher_codigos: bool = True) -> pd.DataFrame:
+    """
+    Converte as colunas numéricas presentes (inválido vira 0.0) e, se `preencher_codigos`, completa
+    os códigos faltantes pela descrição. Mexe no próprio `df` e o devolve com as flags
+    `valor_total_invalido`, `cod_op_regex` e `cod_trib_regex`.
+    """
+    for col in COLUNAS_NUMERICAS:
+        if col not in df:
+            continue
+        valores = _numerico(df[col])
+        invalidos = ~np.isfinite(valores)
+        if col == "valor_total":
+            df["valor_total_invalido"] = invalidos
+        valores[invalidos] = 0.0
+        df[col] = valores
+
+    if preencher_codigos:
+        # mesmas regras do app: cod. op. com tamanho != 4 e cod. trib. com < 2 caracteres (ou vazios).
+        falta_op = _comprimento(df["codigo_operacao"]) != 4
+        df["cod_op_regex"] = _preencher_por_regex(df, "codigo_operacao", falta_op, PADRAO_COD_OP, REGEX_COD_OP)
+        falta_trib = _comprimento(df["codigo_tributario"]) < 2
+        df["cod_trib_regex"] = _preencher_por_regex(df, "codigo_tributario", falta_trib, PADRAO_COD_TRIB, REGEX_COD_TRIB)
+    else:
+        df["cod_op_regex"] = False
+        df["cod_trib_regex"] = False
+    return df
+
+
+def _participante_faltando(participante) -> bool:
+    participante = participante or {}
+    return not participante.get("id_fiscal") or not participante.get("nome_completo")
+
+
+def auditar_colunas(documentos: list, itens: pd.DataFrame, preencher_codigos: bool = True,
+                    tolerancia: float = TOLERANCIA) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Auditoria com os itens já em colunas (DataFrame com a coluna `documento` =
+    posição em `documentos`, do `montar_itens` ou lido de Parquet); os dicts dos
+    documentos só fornecem o cabeçalho.
+
+    Devolve (por_documento, itens): uma linha por documento (COLUNAS_POR_DOCUMENTO,
+    as mesmas do resumo do `auditar_documento`) e os itens corrigidos, com as flags
+    do `auditar_itens`.
+    """
+    documentos = list(documentos)
+    itens = auditar_itens(itens, preencher_codigos)
+
+    # agregado por documento com bincount: mesmo resultado do groupby, sem o custo fixo dele
+    # (que dominava a auditoria de um documento só na tela)
+    doc = itens["documento"].to_numpy()
+    n = len(documentos)
+
+    def contar(pesos=None):
+        return np.bincount(doc, weights=pesos, minlength=n)
+
+    n_itens = contar()
+    soma_itens = contar(itens["valor_total"].to_numpy(dtype=float))
+    # cabecalho: um valor por documento, comprehension aqui e barato
+    total_nota = np.array([_valor(d.get("valor_total_nota", 0.0))[0] for d in documentos], dtype=float)
+    diferenca = soma_itens - total_nota
+    # tudo num construtor so: cada coluna atribuida depois custa um realinhamento do pandas
+    por_doc = pd.DataFrame({
+        "n_itens": n_itens,
+        "soma_itens": soma_itens,
+        "valores_invalidos": contar(itens["valor_total_invalido"].to_numpy(dtype=float)).astype(np.int64),
+        "cod_op_regex": contar(itens["cod_op_regex"].to_numpy(dtype=float)).astype(np.int64),
+        "cod_trib_regex": contar(itens["cod_trib_regex"].to_numpy(dtype=float)).astype(np.int64),
+        "valor_total_nota": total_nota,
+        "diferenca": diferenca,
+        "consistente": np.abs(diferenca) <= tolerancia,
+        "falta_remetente": [_participante_faltando(d.get("remetente")) for d in documentos],
+        "falta_receptor": [_participante_faltando(d.get("receptor")) for d in documentos],
+        "valor_zerado": total_nota <= 0.0,
+        "sem_itens": n_itens == 0,
+    }, index=pd.RangeIndex(n, name="documento"))
+    return por_doc, itens
+
+
+def faltas_cabecalho(documento: dict) -> dict:
+    """As faltas do cabeçalho de um documento (as 4 últimas COLUNAS_POR_DOCUMENTO)."""
+    valor_total_nota, _ = _valor(documento.get("valor_total_nota", 0.0))
+    return {
+        "falta_remetente": _participante_faltando(documento.get("remetente")),
+        "falta_receptor": _participante_faltando(documento.get("receptor")),
+        "valor_zerado": valor_total_nota <= 0.0,
+        "sem_itens": not documento.get("itens"),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("entrada", help="JSONL do lote.py / extrator.py")
+    ap.add_argument("-o", "--saida", default="auditoria.csv", help="CSV com uma linha por documento")
+    args = ap.parse_args()
+
+    inicio = time.perf_counter()
+    arquivos, documentos = [], []
+    with open(args.entrada, encoding="utf-8") as f:
+        for linha in f:
+            registro = json.loads(linha)
+            if registro.get("documento"):
+                arquivos.append(registro.get("arquivo"))
+                documentos.append(registro["documento"])
+
+    por_doc, _ = auditar_documentos(documentos)
+    por_doc.insert(0, "arquivo", arquivos)
+    por_doc.round({"soma_itens": 2, "diferenca": 2}).to_csv(args.saida, sep=";", index=False, encoding="utf-8-sig")
+    duracao = time.perf_counter() - inicio
+
+    print(f"{len(documentos)} documentos / {int(por_doc['n_itens'].sum())} itens em {duracao:.1f}s -> {args.saida}")
+    print(f"inconsistentes (soma x total): {int((~por_doc['consistente']).sum())} | "
+          f"sem remetente: {int(por_doc['falta_remetente'].sum())} | sem receptor: {int(por_doc['falta_receptor'].sum())} | "
+          f"valor zerado: {int(por_doc['valor_zerado'].sum())} | sem itens: {int(por_doc['sem_itens'].sum())}")
+    print(f"códigos preenchidos por regex: {int(por_doc['cod_op_regex'].sum())} cod. op. / "
+          f"{int(por_doc['cod_trib_regex'].sum())} cod. trib.")
+
+
+if __name__ == "__main__":
+    main()
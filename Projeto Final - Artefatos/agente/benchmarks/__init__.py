@@ -0,0 +1 @@
+# Benchmarks do pipeline (rodar da pasta agente: python -m benchmarks.<script>)
@@ -0,0 +1,103 @@
+"""
+Copia congelada da auditoria antiga do main.py (loop item a item, antes do auditoria.py).
+Serve de referencia: a versao vetorizada tem que chegar no mesmo resultado.
+"""
+import re
+
+
+def formatar_valor_br(valor):
+    """Função auxiliar para formatar float como moeda brasileira (R$ X.XXX,XX)."""
+    if valor is None or valor == 0.0:
+        return "R$ 0,00"
+    try:
+        # gambiarra pra formatar BRL
+        return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except (TypeError, ValueError):
+        return "R$ 0,00"
+
+
+def enrich_and_validate_extraction_legado(parsed_data: dict, ocr_text: str) -> tuple[dict, list]:
+    """
+    1. Tenta arrumar dados faltantes com Regex.
+    2. Valida se a soma dos itens bate com o total.
+    """
+    enriched_data = parsed_data.copy()
+    itens_processados = []
+    total_itens_calculado = 0.0
+    messages = [] 
+
+    # Regex pra achar cfop (4 digitos) e cst (2-3 digitos)
+    cod_op_pattern = re.compile(r'\b(\d{4})\b')
+    cod_trib_pattern = re.compile(r'\b(0\d{2}|[1-9]\d{1,2})\b')
+
+    # 1. Fallback com Regex
+    if ocr_text:
+        messages.append(("info", "Iniciando enriquecimento heurístico para códigos (Cod. Operação, Cod. Tributário)."))
+
+        for item in enriched_data.get('itens', []):
+            item_desc_lower = item['descricao'].lower()
+
+            try:
+                item['valor_total'] = float(item['valor_total'])
+            except (TypeError, ValueError):
+                 item['valor_total'] = 0.0
+
+            total_itens_calculado += item['valor_total']
+
+            # se n achou cfop, tenta regex
+            if not item.get('codigo_operacao') or len(item['codigo_operacao']) != 4:
+                match = cod_op_pattern.search(item_desc_lower)
+                if match:
+                    item['codigo_operacao'] = match.group(1)
+                    messages.append(("success", f"✅ Cod. Operação do item '{item['descricao'][:20]}...' preenchido via Regex: **{item['codigo_operacao']}**"))
+
+            # se n achou cst, tenta regex
+            if not item.get('codigo_tributario') or len(item['codigo_tributario']) < 2:
+                match = cod_trib_pattern.search(item_desc_lower)
+                if match:
+                    item['codigo_tributario'] = match.group(1)
+                    messages.append(("success", f"✅ Cod. Tributário do item '{item['descricao'][:20]}...' preenchido via Regex: **{item['codigo_tributario']}**"))
+
+            itens_processados.append(item)
+
+        enriched_data['itens'] = itens_processados
+
+    # 2. Validação dos Totais
+    messages.append(("info", "Iniciando pós-validação de consistência de totais."))
+
+    valor_total_nota = enriched_data.get('valor_total_nota', 0.0)
+    tolerance = 0.01 # 1 centavo de tolerancia
+
+    soma_itens_formatada = formatar_valor_br(total_itens_calculado)
+    total_nf_formatado = formatar_valor_br(valor_total_nota)
+
+    # ve se a conta fecha (soma dos itens == total da nota)
+    if abs(total_itens_calculado - valor_total_nota) <= tolerance:
+        messages.append(("success", f"👍 **Consistência Aprovada!** O somatório dos itens é consistente com o Valor Total do Documento. Soma dos Itens: {soma_itens_formatada} | Total Doc: {total_nf_formatado}"))
+    else:
+        messages.append(("error", f"🚨 **ALERTA DE INCONSISTÊNCIA!** O somatório dos itens extraídos é diferente do Valor Total do Documento extraído. | Soma dos Itens: {soma_itens_formatada} | Total Doc: {total_nf_formatado} | Recomendação: Verifique a qualidade do OCR ou edite os valores manualmente."))
+
+    return enriched_data, messages
+
+
+def check_for_missing_data_legado(parsed_data: dict) -> list:
+    """Ve se ta faltando coisa importante (remetente, receptor, valor, itens)"""
+    warnings = []
+
+    remetente = parsed_data.get('remetente', {})
+    receptor = parsed_data.get('receptor', {})
+
+    if not remetente.get('id_fiscal') or not remetente.get('nome_completo'):
+        warnings.append("❌ Dados completos do Remetente estão faltando ou ilegíveis.")
+
+    if not receptor.get('id_fiscal') or not receptor.get('nome_completo'):
+        warnings.append("❌ Dados completos do Receptor estão faltando ou ilegíveis.")
+
+    valor_total_nota = parsed_data.get('valor_total_nota', 0.0)
+    if valor_total_nota <= 0.0:
+        warnings.append("❌ O 'Valor Total do Documento' está zerado (R$ 0,00).")
+
+    if not parsed_data.get('itens'):
+        warnings.append("❌ A lista de Itens/Produtos está vazia.")
+
+    return warnings
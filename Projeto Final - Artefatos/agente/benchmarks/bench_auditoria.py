@@ -0,0 +1,96 @@
+"""
+Auditoria pós-extração: loop item a item antigo do main.py x auditoria.py, num lote
+de documentos sintéticos. Mede o loop nos dicts do auditoria.py (o do documento na
+tela, aqui documento por documento), o lote em colunas (`auditar_documentos`, com a
+montagem das colunas) e as colunas já prontas (ex.: Parquet).
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_auditoria
+    python -m benchmarks.bench_auditoria --docs 20000 --itens 50    # 1 milhão de linhas
+"""
+import argparse
+import copy
+import gc
+import time
+
+import pandas as pd
+
+from auditoria import COLUNAS_POR_DOCUMENTO, auditar_colunas, auditar_documento, auditar_documentos, montar_itens
+from benchmarks.auditoria_legado import enrich_and_validate_extraction_legado, check_for_missing_data_legado
+from benchmarks.sintetico import gerar_documentos
+
+
+def _conferir(documentos, auditados, por_doc, por_doc_colunas, itens_colunas):
+    """Os dois caminhos têm que preencher os mesmos códigos e achar as mesmas inconsistências do legado."""
+    pd.testing.assert_frame_equal(por_doc, por_doc_colunas, check_dtype=False)
+    itens_colunas = itens_colunas.astype({"codigo_operacao": "string", "codigo_tributario": "string"})
+    for d, documento in enumerate(documentos[:200]):
+        legado, mensagens = enrich_and_validate_extraction_legado(copy.deepcopy(documento), "ocr")
+        linhas = itens_colunas[itens_colunas["documento"] == d]
+        for coluna in ("codigo_operacao", "codigo_tributario"):
+            esperado = [i[coluna] or "" for i in legado["itens"]]
+            assert [i[coluna] or "" for i in auditados[d]["itens"]] == esperado
+            assert linhas[coluna].fillna("").tolist() == esperado
+        assert por_doc.at[d, "consistente"] == (mensagens[-1][0] == "success"), f"documento {d}"
+        faltas = check_for_missing_data_legado(documento)
+        assert bool(por_doc.at[d, "falta_receptor"]) == any("Receptor" in f for f in faltas)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=2000)
+    ap.add_argument("--itens", type=int, default=50, help="Itens por documento")
+    args = ap.parse_args()
+
+    documentos = gerar_documentos(args.docs, args.itens)
+    linhas = args.docs * args.itens
+    # as copias grandes disparam o gc no meio de uma medicao qualquer: variava 2x entre rodadas
+    gc.disable()
+
+    # o legado mexe nos itens, entao cada um roda numa copia
+    copias = copy.deepcopy(documentos)
+    inicio = time.perf_counter()
+    for documento in copias:
+        enrich_and_validate_extraction_legado(documento, "ocr")
+        check_for_missing_data_legado(documento)
+    legado = time.perf_counter() - inicio
+
+    # o loop do auditoria.py corrige os itens nos proprios dicts
+    auditados = copy.deepcopy(documentos)
+    inicio = time.perf_counter()
+    resumos = [auditar_documento(documento)[0] for documento in auditados]
+    dicts = time.perf_counter() - inicio
+    por_doc = pd.DataFrame.from_records(resumos, columns=COLUNAS_POR_DOCUMENTO,
+                                        index=pd.RangeIndex(len(resumos), name="documento"))
+
+    inicio = time.perf_counter()
+    por_doc_colunas, itens_colunas = auditar_documentos(documentos)
+    lote = time.perf_counter() - inicio
+
+    colunar = montar_itens(documentos)
+    inicio = time.perf_counter()
+    auditar_colunas(documentos, colunar)
+    so_auditoria = time.perf_counter() - inicio
+
+    # um documento na tela: o custo fixo e o que conta
+    copias = [copy.deepcopy(documentos[0]) for _ in range(200)]
+    inicio = time.perf_counter()
+    for documento in copias:
+        auditar_documento(documento)
+    um_documento = (time.perf_counter() - inicio) / len(copias) * 1000
+
+    gc.enable()
+    _conferir(documentos, auditados, por_doc, por_doc_colunas, itens_colunas)
+    print(f"{args.docs} documentos / {linhas} itens")
+    print(f"loop (legado):        {legado:.2f}s ({linhas / legado:,.0f} itens/s)")
+    print(f"dicts (item a item):  {dicts:.2f}s ({linhas / dicts:,.0f} itens/s) | {legado / dicts:.1f}x o legado")
+    print(f"lote (colunas):       {lote:.2f}s ({linhas / lote:,.0f} itens/s) | {legado / lote:.1f}x o legado")
+    print(f"colunas (já prontas): {so_auditoria:.2f}s ({linhas / so_auditoria:,.0f} itens/s) | "
+          f"{legado / so_auditoria:.1f}x o legado")
+    print(f"um documento ({args.itens} itens): {um_documento:.2f} ms")
+    print(f"inconsistentes: {int((~por_doc['consistente']).sum())} | "
+          f"cod. op. por regex: {int(por_doc['cod_op_regex'].sum())} | cod. trib. por regex: {int(por_doc['cod_trib_regex'].sum())}")
+
+
+if __name__ == "__main__":
+    main()
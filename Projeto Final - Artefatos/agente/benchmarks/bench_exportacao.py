@@ -0,0 +1,98 @@
+"""
+Exportação de um lote grande (exportacao.py) contra o jeito antigo, tudo em memória:
+DataFrame com todos os itens + `.map(f"{x:.2f}")` por coluna + `to_csv` numa string só,
+e o `json.dumps(indent=4)` do resultado inteiro.
+
+Cada variante roda num processo novo (spawn) pra medir o pico de memória (ru_maxrss)
+dela sozinha. Os documentos são gerados em pedaços (benchmarks.sintetico) e a geração
+entra no tempo de todas as variantes igual ("só gerar" mostra quanto é).
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_exportacao
+    python -m benchmarks.bench_exportacao --docs 100000 --itens 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.sintetico import gerar_documentos
+
+PEDACO = 1000  # documentos gerados por vez
+
+
+def registros(n_docs: int, n_itens: int):
+    for inicio in range(0, n_docs, PEDACO):
+        for i, documento in enumerate(gerar_documentos(min(PEDACO, n_docs - inicio), n_itens, seed=inicio)):
+            yield {"arquivo": f"nota_{inicio + i}.xml", "status": "ok", "erro": None, "documento": documento}
+
+
+def _em_memoria_csv(n_docs: int, n_itens: int, pasta: str) -> int:
+    import pandas as pd
+
+    itens = [item for r in registros(n_docs, n_itens) for item in r["documento"]["itens"]]
+    df = pd.DataFrame(itens)
+    for col in ["quantidade", "valor_unitario", "valor_total", "valor_aprox_taxas"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0).astype(float)
+        df[col] = df[col].map(lambda x: f"{x:.2f}".replace('.', ','))
+    texto = df.to_csv(index=False, sep=";")
+    with open(os.path.join(pasta, "itens.csv"), "w", encoding="utf-8-sig") as f:
+        f.write(texto)
+    return os.path.getsize(os.path.join(pasta, "itens.csv"))
+
+
+def _em_memoria_json(n_docs: int, n_itens: int, pasta: str) -> int:
+    texto = json.dumps(list(registros(n_docs, n_itens)), ensure_ascii=False, indent=4)
+    with open(os.path.join(pasta, "resultado.json"), "w", encoding="utf-8") as f:
+        f.write(texto)
+    return os.path.getsize(os.path.join(pasta, "resultado.json"))
+
+
+def _streaming(formato: str, n_docs: int, n_itens: int, pasta: str) -> int:
+    from exportacao import caminhos_tabelas, gravar_tabelas
+
+    base = os.path.join(pasta, "resultado")
+    gravar_tabelas(registros(n_docs, n_itens), base, formato)
+    return sum(os.path.getsize(c) for c in caminhos_tabelas(base, formato).values())
+
+
+def _medir(variante: str, n_docs: int, n_itens: int) -> tuple:
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        if variante == "só gerar (referência)":
+            for _ in registros(n_docs, n_itens):
+                pass
+            tamanho = 0
+        elif variante == "memória: csv (map + to_csv)":
+            tamanho = _em_memoria_csv(n_docs, n_itens, pasta)
+        elif variante == "memória: json indent=4":
+            tamanho = _em_memoria_json(n_docs, n_itens, pasta)
+        else:
+            tamanho = _streaming(variante.split()[-1], n_docs, n_itens, pasta)
+        duracao = time.perf_counter() - inicio
+    return duracao, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, tamanho / 2 ** 20
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=20_000)
+    ap.add_argument("--itens", type=int, default=50, help="Itens por documento")
+    args = ap.parse_args()
+
+    variantes = ["só gerar (referência)", "memória: csv (map + to_csv)", "memória: json indent=4",
+                 "streaming: csv", "streaming: parquet", "streaming: arrow"]
+    contexto = multiprocessing.get_context("spawn")
+    print(f"{args.docs} documentos x {args.itens} itens = {args.docs * args.itens} linhas de item")
+    print(f"\n{'variante':<28} | {'tempo s':>8} | {'pico MB':>8} | {'arquivos MB':>11}")
+    for variante in variantes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+            duracao, pico, tamanho = pool.submit(_medir, variante, args.docs, args.itens).result()
+        print(f"{variante:<28} | {duracao:>8.2f} | {pico:>8.0f} | {tamanho:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Fila de processamento do app (fila.py) com uma "tarde de notas": N PDFs digitais
+de DANFE + alguns XMLs, com o ChatFalso na latência dada no lugar do Gemini.
+
+Mede, pra cada FILA_WORKERS:
+- tempo até o 1o documento pronto (o que a pessoa espera antes de poder abrir algo);
+- tempo até a fila acabar e vazão em arquivos/min;
+- cancelamento: cancela tudo no meio da fila e mede quanto tempo leva até todas as
+  tarefas pararem (as da fila saem na hora; as em andamento param na próxima etapa).
+
+Workers = 1 é o app antigo (um arquivo por vez), só que sem travar a tela.
+Cada rodada usa sementes próprias: nenhuma acerta o cache de outra.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_fila
+    python -m benchmarks.bench_fila --pdfs 40 --xmls 10 --workers 1 2 4 8 --latencia 2.0
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("EXTRATOR_CACHE_DIR", tempfile.mkdtemp(prefix="extrator_bench_fila_"))  # cache/repositorio vazios
+
+from benchmarks.sintetico import gerar_nfe_xml, gerar_pdf_danfe
+from fila import Fila
+from llm_falso import ChatFalso, documento_sintetico
+
+
+def arquivos(pdfs: int, xmls: int, itens: int, semente: int) -> list:
+    lista = [(f"danfe_{i}.pdf", gerar_pdf_danfe(itens, seed=semente + i, escaneado=False), "application/pdf")
+             for i in range(pdfs)]
+    lista += [(f"nfe_{i}.xml", gerar_nfe_xml(itens, seed=semente + pdfs + i), "text/xml") for i in range(xmls)]
+    return lista
+
+
+def rodar(lista: list, workers: int, client, cancelar_apos: float = None) -> dict:
+    fila = Fila(workers)
+    inicio = time.perf_counter()
+    tarefas = [fila.submeter(nome, conteudo, mime, client) for nome, conteudo, mime in lista]
+    primeiro = cancelado_em = None
+    while True:
+        agora = time.perf_counter() - inicio
+        if primeiro is None and any(t.status == "ok" for t in tarefas):
+            primeiro = agora
+        if cancelar_apos is not None and cancelado_em is None and agora >= cancelar_apos:
+            cancelado_em = agora
+            for tarefa in tarefas:
+                tarefa.cancelar()
+        if all(t.terminada for t in tarefas):
+            break
+        time.sleep(0.01)
+    total = time.perf_counter() - inicio
+    status = {}
+    for tarefa in tarefas:
+        status[tarefa.status] = status.get(tarefa.status, 0) + 1
+    return {"primeiro_s": primeiro, "total_s": total, "status": status,
+            "parar_s": None if cancelado_em is None else total - cancelado_em}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pdfs", type=int, default=20)
+    ap.add_argument("--xmls", type=int, default=5)
+    ap.add_argument("--itens", type=int, default=20, help="Itens por documento")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--latencia", type=float, default=1.0, help="Latência do modelo falso por chamada (s)")
+    args = ap.parse_args()
+
+    # resposta generica: o texto do PDF sintetico nao fecha nas regras, entao todo PDF chama o "Gemini"
+    client = ChatFalso(latencia_s=args.latencia, jitter_s=0.0, resposta=json.dumps(documento_sintetico(args.itens)))
+    total_arquivos = args.pdfs + args.xmls
+
+    print(f"{total_arquivos} arquivos ({args.pdfs} PDFs, {args.xmls} XMLs), LLM {args.latencia:.1f}s por chamada")
+    print(f"\n{'workers':>7} | {'1o pronto s':>11} | {'total s':>8} | {'arq/min':>8} | status")
+    for rodada, workers in enumerate(args.workers):
+        lista = arquivos(args.pdfs, args.xmls, args.itens, semente=10_000 * (rodada + 1))
+        r = rodar(lista, workers, client)
+        print(f"{workers:>7} | {r['primeiro_s']:>11.2f} | {r['total_s']:>8.2f} | "
+              f"{total_arquivos / r['total_s'] * 60:>8.0f} | {r['status']}")
+
+    workers = max(args.workers)
+    lista = arquivos(args.pdfs, args.xmls, args.itens, semente=99_000)
+    r = rodar(lista, workers, client, cancelar_apos=args.latencia * 1.5)
+    print(f"\ncancelar tudo com {workers} workers após {args.latencia * 1.5:.1f}s: "
+          f"todas paradas em {r['parar_s']:.2f}s | {r['status']}")
+
+
+if __name__ == "__main__":
+    main()
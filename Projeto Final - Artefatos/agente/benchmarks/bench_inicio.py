@@ -0,0 +1,55 @@
+"""
+Mede o custo de subir o app e de cada rerun do Streamlit (sem navegador, via AppTest).
+
+- partida a frio: processo novo, 1a execução do main.py (imports + montagem da tela);
+- rerun: execuções seguintes no mesmo processo (o que o usuário paga a cada clique).
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_inicio
+    python -m benchmarks.bench_inicio --processos 5 --reruns 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_MEDIR = r"""
+import json, os, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(os.path.abspath("main.py"))
+app.run(timeout=120)
+frio = time.perf_counter() - inicio
+reruns = []
+for _ in range(int(sys.argv[1])):
+    t = time.perf_counter()
+    app.run(timeout=60)
+    reruns.append(time.perf_counter() - t)
+print(json.dumps({"frio": frio, "reruns": reruns}))
+"""
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--processos", type=int, default=3, help="Quantas partidas a frio medir")
+    ap.add_argument("--reruns", type=int, default=10, help="Reruns por processo")
+    args = ap.parse_args()
+
+    # chave falsa: o app monta a tela como se o LLM estivesse disponivel (nao chama a API)
+    env = dict(os.environ, GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "chave-falsa-benchmark"))
+    frios, reruns = [], []
+    for _ in range(args.processos):
+        saida = subprocess.run([sys.executable, "-c", _MEDIR, str(args.reruns)], env=env,
+                               capture_output=True, text=True, check=True).stdout
+        medida = json.loads(saida.strip().splitlines()[-1])
+        frios.append(medida["frio"])
+        reruns.extend(medida["reruns"])
+
+    print(f"partida a frio: mediana {statistics.median(frios):.2f}s (min {min(frios):.2f}s)")
+    print(f"rerun:          mediana {statistics.median(reruns) * 1000:.0f}ms (min {min(reruns) * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
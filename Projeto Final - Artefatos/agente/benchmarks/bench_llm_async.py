@@ -0,0 +1,54 @@
+"""
+Teste de carga do agendador assíncrono do LLM com o ChatFalso (sem rede, sem cota).
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_llm_async
+    python -m benchmarks.bench_llm_async --docs 200 --latencia 1.0 --taxa-429 0.1 --rpm 600
+    python -m benchmarks.bench_llm_async --taxa-timeout 0.05 --taxa-json 0.1 --semente 42
+
+Com --semente as falhas e latências sorteadas se repetem em toda rodada (dá pra
+comparar retentativas/vazão entre versões do agendador).
+"""
+import argparse
+import time
+
+from llm_async import extrair_lote
+from llm_falso import ChatFalso
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=100)
+    ap.add_argument("--latencia", type=float, default=0.5, help="Latência média do modelo falso (s)")
+    ap.add_argument("--taxa-429", type=float, default=0.0, help="Fração de chamadas que devolvem 429")
+    ap.add_argument("--taxa-timeout", type=float, default=0.0, help="Fração de chamadas que estouram o prazo")
+    ap.add_argument("--taxa-json", type=float, default=0.0, help="Fração de respostas com o JSON cortado (vai pro reparo)")
+    ap.add_argument("--semente", type=int, default=None)
+    ap.add_argument("--rpm", type=float, default=6000)
+    ap.add_argument("--tpm", type=float, default=10_000_000)
+    ap.add_argument("--concorrencia", type=int, nargs="+", default=[1, 4, 16])
+    args = ap.parse_args()
+
+    textos = [f"DANFE SINTETICA {i}\nVALOR TOTAL DA NOTA 30,00" for i in range(args.docs)]
+
+    print(f"{'concorr.':>8} | {'docs/s':>7} | {'ok':>5} | {'erros':>5} | {'retentativas':>12} | {'reparos':>7} | "
+          f"{'tokens in/out':>15}")
+    for concorrencia in args.concorrencia:
+        # cliente novo por rodada: com semente, todas as rodadas recebem as mesmas falhas
+        client = ChatFalso(latencia_s=args.latencia, taxa_429=args.taxa_429, taxa_timeout=args.taxa_timeout,
+                           taxa_json_invalido=args.taxa_json, semente=args.semente)
+        inicio = time.perf_counter()
+        resultados = extrair_lote(textos, client, concorrencia=concorrencia, rpm=args.rpm, tpm=args.tpm,
+                                  usar_cache=False)
+        duracao = time.perf_counter() - inicio
+
+        ok = sum(r["status"] == "ok" for r in resultados)
+        retentativas = sum(r["tentativas"] - 1 for r in resultados)
+        tokens = f"{sum(r['tokens_entrada'] for r in resultados)}/{sum(r['tokens_saida'] for r in resultados)}"
+        reparos = sum(r["reparos"] for r in resultados)
+        print(f"{concorrencia:>8} | {args.docs / duracao:>7.1f} | {ok:>5} | {args.docs - ok:>5} | "
+              f"{retentativas:>12} | {reparos:>7} | {tokens:>15}")
+
+
+if __name__ == "__main__":
+    main()
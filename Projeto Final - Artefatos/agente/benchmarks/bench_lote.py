@@ -0,0 +1,46 @@
+"""
+Mede a escala do lote.py com o número de workers, num ZIP de NF-es sintéticas.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_lote
+    python -m benchmarks.bench_lote --docs 20000 --itens 30 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import zipfile
+
+from lote import processar_lote
+from benchmarks.sintetico import gerar_nfe_xml
+
+
+def montar_zip(caminho: str, n_docs: int, n_itens: int):
+    with zipfile.ZipFile(caminho, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i in range(n_docs):
+            zf.writestr(f"nfe_{i:06d}.xml", gerar_nfe_xml(n_itens, seed=i))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=5000)
+    ap.add_argument("--itens", type=int, default=20)
+    ap.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "lote.zip")
+        montar_zip(caminho, args.docs, args.itens)
+        print(f"ZIP com {args.docs} XMLs de {args.itens} itens ({os.path.getsize(caminho) / 1e6:.1f} MB)")
+
+        base = None
+        for workers in args.workers:
+            inicio = time.perf_counter()
+            total = sum(1 for _ in processar_lote(caminho, workers=workers))
+            duracao = time.perf_counter() - inicio
+            base = base or duracao
+            print(f"workers={workers:>3} | {total / duracao:>8.0f} docs/s | speedup {base / duracao:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
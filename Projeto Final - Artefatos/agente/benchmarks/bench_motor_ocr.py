@@ -0,0 +1,75 @@
+"""
+Motor de OCR subprocesso (um `tesseract` por página) x persistente (tesserocr com o
+modelo carregado), nas páginas sintéticas do benchmarks.sintetico: DANFEs grandes e
+cupons pequenos, onde a partida do processo pesa mais.
+
+Sem cache e sem pré-processamento (mede só o motor). Confere também se os dois
+devolvem o mesmo texto.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_motor_ocr
+    python -m benchmarks.bench_motor_ocr --repeticoes 20 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytesseract
+
+from motor_ocr import criar_motor
+from ocr import OCR_LANG, OCR_CONFIG
+from benchmarks.sintetico import gerar_paginas_imagem
+
+
+def _medir(motor, imagens: list, workers: int) -> tuple:
+    """(ms por página, textos). workers > 1 = várias páginas ao mesmo tempo, como no ocr_paginas."""
+    inicio = time.perf_counter()
+    if workers == 1:
+        textos = [motor.texto(img) for img in imagens]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            textos = list(pool.map(motor.texto, imagens))
+    return (time.perf_counter() - inicio) * 1000 / len(imagens), textos
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeticoes", type=int, default=10, help="Cópias de cada página por rodada")
+    ap.add_argument("--workers", type=int, default=4, help="Threads na rodada paralela")
+    args = ap.parse_args()
+
+    paginas = gerar_paginas_imagem()
+    motores = {}
+    for tipo in ("subprocesso", "persistente"):
+        try:
+            motor = criar_motor(OCR_LANG, OCR_CONFIG, tipo)
+            motor.texto(paginas[-1][1])  # aquece (e ve se o tesseract existe)
+            motores[tipo] = motor
+        except ImportError:
+            print(f"{tipo}: tesserocr não instalado (pip install tesserocr), pulando")
+        except pytesseract.TesseractNotFoundError:
+            print(f"{tipo}: Tesseract não encontrado, pulando")
+    if not motores:
+        return
+
+    grupos = {
+        "DANFE": [img for nome, img, _ in paginas if not nome.startswith("cupom")],
+        "cupom": [img for nome, img, _ in paginas if nome.startswith("cupom")],
+    }
+    print(f"{'páginas':<8} | {'workers':>7} | " + " | ".join(f"{t + ' (ms/pág)':>22}" for t in motores) + " | mesmo texto")
+    for grupo, imagens in grupos.items():
+        imagens = imagens * args.repeticoes
+        for workers in (1, args.workers):
+            tempos, textos = {}, {}
+            for tipo, motor in motores.items():
+                tempos[tipo], textos[tipo] = _medir(motor, imagens, workers)
+            iguais = len({tuple(t) for t in textos.values()}) == 1
+            print(f"{grupo:<8} | {workers:>7} | " + " | ".join(f"{tempos[t]:>22.1f}" for t in motores)
+                  + f" | {'sim' if iguais else 'NÃO'}")
+
+    for motor in motores.values():
+        motor.fechar()
+
+
+if __name__ == "__main__":
+    main()
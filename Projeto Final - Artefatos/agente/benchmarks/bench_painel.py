@@ -0,0 +1,58 @@
+"""
+Latência de interação no painel de resultados com um documento grande (via AppTest):
+trocar o gráfico no `chart_selector` e digitar um valor na edição manual.
+O AppTest reexecuta o script inteiro a cada interação (não só o fragmento), então
+os tempos são o pior caso; no navegador só o fragmento roda.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_painel
+    python -m benchmarks.bench_painel --itens 5000 --repeticoes 5
+"""
+import argparse
+import os
+import statistics
+import time
+
+GRAFICOS = ('Cod. Operação (Valor)', 'Proporção de Custos', 'Valor por Item')
+
+
+def _medir(acao, repeticoes):
+    tempos = []
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        acao(i)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--itens", type=int, default=5000)
+    ap.add_argument("--repeticoes", type=int, default=5)
+    args = ap.parse_args()
+
+    os.environ["BENCH_PAINEL_ITENS"] = str(args.itens)
+    os.environ.setdefault("GOOGLE_API_KEY", "chave-falsa-benchmark")
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "painel_app.py"))
+    inicio = time.perf_counter()
+    app.run(timeout=300)
+    primeira = time.perf_counter() - inicio
+    if app.exception:
+        raise SystemExit(app.exception[0].value)
+
+    def trocar_grafico(i):
+        app.radio(key="chart_selector").set_value(GRAFICOS[(i + 1) % len(GRAFICOS)]).run(timeout=300)
+
+    def editar_valor(i):
+        app.text_input(key="manual_val_princ_llm_ocr").input(f"{100 + i},50").run(timeout=300)
+
+    print(f"{args.itens} itens")
+    print(f"1a renderização:    {primeira * 1000:.0f}ms")
+    print(f"trocar gráfico:     {_medir(trocar_grafico, args.repeticoes) * 1000:.0f}ms (mediana)")
+    print(f"editar valor:       {_medir(editar_valor, args.repeticoes) * 1000:.0f}ms (mediana)")
+
+
+if __name__ == "__main__":
+    main()
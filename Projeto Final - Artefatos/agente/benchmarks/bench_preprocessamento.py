@@ -0,0 +1,91 @@
+"""
+OCR com e sem cada etapa do pré-processamento (preprocessamento.py) num corpus
+sintético de DANFEs "escaneadas" e cupons "fotografados" (benchmarks.sintetico).
+
+Pra cada configuração: tempo do pré-processamento, tempo do Tesseract e acerto de
+caracteres contra o texto verdadeiro (difflib, 1.0 = idêntico). Sem Tesseract
+instalado só os tempos do pré-processamento são medidos.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_preprocessamento
+    python -m benchmarks.bench_preprocessamento --pasta minhas_imagens/   # + imagens reais (sem gabarito: só tempo)
+"""
+import argparse
+import difflib
+import os
+import time
+
+import pytesseract
+from PIL import Image
+
+from ocr import OCR_LANG, OCR_CONFIG
+from preprocessamento import ETAPAS_SUGERIDAS, ORDEM_ETAPAS, etapas_configuradas, preprocessar
+from benchmarks.sintetico import gerar_paginas_imagem
+
+
+def _configuracoes() -> list:
+    # o OCR_PREPROCESSAMENTO do .env, ou (desligado, o padrao) as etapas sugeridas pra scan
+    nome, base = ("configuradas", etapas_configuradas()) if etapas_configuradas() else ("sugeridas", ETAPAS_SUGERIDAS)
+    configs = [("nenhuma", ()), (nome, base), ("todas", ORDEM_ETAPAS)]
+    for etapa in ORDEM_ETAPAS:
+        configs.append((f"só {etapa}", (etapa,)))
+    for etapa in base:
+        configs.append((f"{nome} - {etapa}", tuple(e for e in base if e != etapa)))
+    return configs
+
+
+def _normalizar(texto: str) -> str:
+    return " ".join(texto.split())
+
+
+def acerto_caracteres(ocr: str, verdadeiro: str) -> float:
+    return difflib.SequenceMatcher(None, _normalizar(ocr), _normalizar(verdadeiro), autojunk=False).ratio()
+
+
+def _carregar_pasta(pasta: str) -> list:
+    corpus = []
+    for nome in sorted(os.listdir(pasta)):
+        if nome.lower().endswith((".png", ".jpg", ".jpeg", ".tif", ".tiff")):
+            corpus.append((nome, Image.open(os.path.join(pasta, nome)), None))
+    return corpus
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pasta", help="Pasta com imagens reais pra somar ao corpus sintético")
+    args = ap.parse_args()
+
+    corpus = gerar_paginas_imagem()
+    if args.pasta:
+        corpus += _carregar_pasta(args.pasta)
+
+    try:
+        pytesseract.get_tesseract_version()
+        tem_tesseract = True
+    except pytesseract.TesseractNotFoundError:
+        tem_tesseract = False
+        print("Tesseract não encontrado: medindo só o pré-processamento.\n")
+
+    print(f"{'configuração':<22} | {'pré (ms)':>9} | {'tesseract (ms)':>14} | {'acerto DANFE':>12} | {'acerto cupom':>12}")
+    for nome_config, etapas in _configuracoes():
+        pre_ms = ocr_ms = 0.0
+        acertos = {"danfe": [], "cupom": []}
+        for nome, imagem, verdadeiro in corpus:
+            inicio = time.perf_counter()
+            processada, _ = preprocessar(imagem, etapas)
+            pre_ms += (time.perf_counter() - inicio) * 1000
+            if not tem_tesseract:
+                continue
+            inicio = time.perf_counter()
+            texto = pytesseract.image_to_string(processada, lang=OCR_LANG, config=OCR_CONFIG)
+            ocr_ms += (time.perf_counter() - inicio) * 1000
+            if verdadeiro is not None:
+                acertos["cupom" if nome.startswith("cupom") else "danfe"].append(acerto_caracteres(texto, verdadeiro))
+
+        media = {k: f"{sum(v) / len(v):.3f}" if v else "-" for k, v in acertos.items()}
+        ocr = f"{ocr_ms:.0f}" if tem_tesseract else "-"
+        print(f"{nome_config:<22} | {pre_ms:>9.0f} | {ocr:>14} | {media['danfe']:>12} | {media['cupom']:>12}")
+
+
+if __name__ == "__main__":
+    main()
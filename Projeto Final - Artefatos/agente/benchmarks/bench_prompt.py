@@ -0,0 +1,67 @@
+"""
+Tamanho do prompt do Gemini antes (schema completo do Pydantic + texto cru do OCR)
+e depois (schema enxuto + texto compactado).
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_prompt
+    python -m benchmarks.bench_prompt --paginas 1 3 10 --gemini   # chama a API de verdade (gasta cota)
+
+Sem --gemini os tokens são estimados (~4 caracteres/token). Com --gemini cada
+prompt é enviado uma vez e o `usage_metadata` + latência reais são mostrados.
+"""
+import argparse
+import os
+import time
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm import GEMINI_MODEL, GEMINI_TEMPERATURE, system_prompt, parser, estimar_tokens, preparar_prompt
+from benchmarks.sintetico import gerar_texto_ocr
+
+# o prompt como era antes da compactacao
+prompt_original = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        ("human", "Extraia os dados do documento no seguinte texto OCR. Retorne apenas o JSON. {format_instructions}\n\nTexto OCR:\n{text_to_analyze}"),
+    ]
+).partial(format_instructions=parser.get_format_instructions())
+
+
+def _chamar(client, texto_prompt):
+    inicio = time.perf_counter()
+    response = client.invoke(texto_prompt)
+    uso = response.usage_metadata or {}
+    return uso.get("input_tokens", 0), uso.get("output_tokens", 0), time.perf_counter() - inicio
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--paginas", type=int, nargs="+", default=[1, 3, 10])
+    ap.add_argument("--itens-por-pagina", type=int, default=25)
+    ap.add_argument("--gemini", action="store_true", help="Mede com a API real (precisa de GOOGLE_API_KEY)")
+    args = ap.parse_args()
+
+    client = None
+    if args.gemini:
+        from dotenv import load_dotenv
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        load_dotenv()
+        client = ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=os.getenv("GOOGLE_API_KEY"),
+                                        temperature=GEMINI_TEMPERATURE)
+
+    print(f"{'páginas':>7} | {'tokens antes':>12} | {'tokens depois':>13} | {'economia':>8}")
+    for n in args.paginas:
+        texto = gerar_texto_ocr(n, args.itens_por_pagina, seed=n)
+        antes = prompt_original.format(text_to_analyze=texto)
+        depois, metricas = preparar_prompt(texto)
+        t_antes, t_depois = estimar_tokens(antes), metricas["tokens_estimados"]
+        print(f"{n:>7} | {t_antes:>12} | {t_depois:>13} | {1 - t_depois / t_antes:>7.0%}")
+
+        if client is not None:
+            for rotulo, texto_prompt in (("antes", antes), ("depois", depois)):
+                entrada, saida, latencia = _chamar(client, texto_prompt)
+                print(f"{'':>7}   gemini {rotulo}: {entrada} entrada / {saida} saída em {latencia:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
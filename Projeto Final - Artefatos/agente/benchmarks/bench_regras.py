@@ -0,0 +1,121 @@
+"""
+Leitura por regras da DANFE (regras_danfe.py) contra o caminho só-LLM, com o corpus
+de textos de DANFE do benchmarks.sintetico (layouts padrao, fornecedor, sem_totais
+e chave_ilegivel, sempre as mesmas sementes).
+
+Mede:
+- latência do `extrair_por_regras` por tamanho de documento;
+- acerto por campo contra o documento que gerou o texto (só o que as regras
+  conferem: chave, data, total, CNPJs, nomes, IEs, natureza e itens) e quantas
+  leituras erradas passaram da confiança mínima (essas nem chegam no LLM);
+- quantos documentos saem sem LLM, quantos só complementam campos e quantos vão
+  inteiros pro LLM;
+- `interpretar_texto` com REGRAS_DANFE ligado x desligado, com o ChatFalso na
+  latência dada: tempo total, chamadas e tokens estimados.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_regras
+    python -m benchmarks.bench_regras --docs 200 --itens 10 100 --latencia 2.0
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("EXTRATOR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "extrator_bench"))  # nao suja o cache do app
+
+import numpy as np
+
+import regras_danfe
+from benchmarks.sintetico import LAYOUTS_DANFE, gerar_texto_danfe
+from extrator import interpretar_texto
+from llm_falso import ChatFalso, documento_sintetico
+
+CAMPOS = ("numero_controle", "data_emissao", "valor_total_nota", "tipo_operacao", "modelo_documento",
+          "remetente.id_fiscal", "remetente.nome_completo", "remetente.inscricao_estadual",
+          "receptor.id_fiscal", "receptor.nome_completo", "receptor.inscricao_estadual", "itens")
+
+
+def _campo(documento: dict, caminho: str):
+    for parte in caminho.split("."):
+        documento = documento[parte]
+    return documento
+
+
+def corpus(docs: int, itens: list) -> list:
+    """[(layout, texto, esperado)]: 70% padrao, 10% de cada um dos outros (proporção de uma caixa de entrada típica)."""
+    pesos = {"padrao": 7, "fornecedor": 1, "sem_totais": 1, "chave_ilegivel": 1}
+    sequencia = [layout for layout in LAYOUTS_DANFE for _ in range(pesos[layout])]
+    return [(sequencia[i % len(sequencia)],
+             *gerar_texto_danfe(itens[i % len(itens)], seed=i, layout=sequencia[i % len(sequencia)]))
+            for i in range(docs)]
+
+
+def latencias(itens: list, repeticoes: int):
+    print(f"{'itens':>6} | {'p50 ms':>8} | {'p95 ms':>8}")
+    for n in itens:
+        texto, _ = gerar_texto_danfe(n, seed=n)
+        regras_danfe.extrair_por_regras(texto)
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            regras_danfe.extrair_por_regras(texto)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        p50, p95 = np.percentile(tempos, [50, 95])
+        print(f"{n:>6} | {p50:>8.2f} | {p95:>8.2f}")
+
+
+def acerto(documentos: list):
+    # "aceito errado" e o que importa: leitura errada que passou da confianca minima e nao vai pro LLM
+    certos = {campo: 0 for campo in CAMPOS}
+    aceitos_errados = {campo: 0 for campo in CAMPOS}
+    destinos = {"regras": 0, "complemento": 0, "llm": 0}
+    for _, texto, esperado in documentos:
+        resultado = regras_danfe.extrair_por_regras(texto)
+        for campo in CAMPOS:
+            certo = _campo(resultado["documento"], campo) == _campo(esperado, campo)
+            certos[campo] += certo
+            aceitos_errados[campo] += not certo and campo.split(".")[0] not in resultado["faltando"]
+        campos = regras_danfe.campos_para_llm(resultado, texto)
+        destinos["regras" if campos == {} else "complemento" if campos else "llm"] += 1
+
+    print(f"\n{'campo':<30} | {'acerto':>7} | {'aceito errado':>13}")
+    for campo, n in certos.items():
+        print(f"{campo:<30} | {n / len(documentos):>7.1%} | {aceitos_errados[campo]:>13}")
+    print("\n" + " | ".join(f"{destino}: {n} ({n / len(documentos):.0%})" for destino, n in destinos.items()))
+
+
+def comparar(documentos: list, latencia: float):
+    resposta = json.dumps(documento_sintetico(10), ensure_ascii=False)
+    print(f"\n{'REGRAS_DANFE':>12} | {'total s':>8} | {'chamadas':>8} | {'tokens estimados':>16}")
+    for ligado in (False, True):
+        regras_danfe.REGRAS_DANFE = ligado
+        client = ChatFalso(latencia_s=latencia, jitter_s=0.0, resposta=resposta)
+        chamadas = tokens = 0
+        inicio = time.perf_counter()
+        for _, texto, _ in documentos:
+            resultado = interpretar_texto(texto, client, usar_cache=False)
+            if resultado["uso"]:
+                chamadas += resultado["uso"]["chamadas"]
+                tokens += resultado["uso"]["tokens_estimados"]
+        duracao = time.perf_counter() - inicio
+        print(f"{'ligado' if ligado else 'desligado':>12} | {duracao:>8.2f} | {chamadas:>8} | {tokens:>16}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=50)
+    ap.add_argument("--itens", type=int, nargs="+", default=[10, 30, 100], help="Itens por documento")
+    ap.add_argument("--latencia", type=float, default=0.2, help="Latência do modelo falso por chamada (s)")
+    ap.add_argument("--repeticoes", type=int, default=20)
+    args = ap.parse_args()
+
+    latencias(args.itens + [1000], args.repeticoes)
+    documentos = corpus(args.docs, args.itens)
+    acerto(documentos)
+    comparar(documentos, args.latencia)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Repositório de documentos (repositorio.py) com muitas notas: vazão da gravação em
+lote, latência das consultas filtradas e das checagens de duplicata.
+
+Corpus sintético: N documentos com chaves distintas, 1000 emitentes, 5000
+destinatários, datas espalhadas em 2 anos e 3 CFOPs nos itens.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_repositorio
+    python -m benchmarks.bench_repositorio --docs 300000 --itens 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from repositorio import Repositorio, hash_arquivo
+
+CFOPS = ("5102", "6102", "5405")
+VERSAO = "bench"
+
+
+def gerar(n_docs: int, n_itens: int, seed: int = 0):
+    """Gera (documento, origem, hash, nome, texto, versao) pro `salvar_lote`."""
+    rnd = random.Random(seed)
+    for d in range(n_docs):
+        itens = [{"descricao": f"PRODUTO {i}", "quantidade": 2.0, "valor_unitario": 5.0, "valor_total": 10.0,
+                  "codigo_operacao": rnd.choice(CFOPS), "codigo_tributario": "00", "valor_aprox_taxas": 0.0}
+                 for i in range(n_itens)]
+        documento = {
+            "numero_controle": f"35{d:042d}", "modelo_documento": "55",
+            "data_emissao": f"{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-{rnd.choice([2023, 2024])}",
+            "valor_total_nota": 10.0 * n_itens, "tipo_operacao": "VENDA",
+            "remetente": {"id_fiscal": f"{rnd.randrange(1000):014d}", "nome_completo": "EMITENTE LTDA",
+                          "endereco_completo": "", "inscricao_estadual": ""},
+            "receptor": {"id_fiscal": f"{rnd.randrange(5000):011d}", "nome_completo": "CLIENTE",
+                         "endereco_completo": "", "inscricao_estadual": ""},
+            "totais_valores": {}, "itens": itens,
+        }
+        yield documento, "XML", hash_arquivo(str(d).encode()), f"nota_{d}.xml", None, VERSAO
+
+
+def medir(funcao, repeticoes: int) -> tuple:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tuple(float(x) for x in np.percentile(tempos, [50, 95]))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=100_000)
+    ap.add_argument("--itens", type=int, default=10, help="Itens por documento")
+    ap.add_argument("--lote", type=int, default=1000, help="Documentos por transação")
+    ap.add_argument("--repeticoes", type=int, default=50)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        repo = Repositorio(os.path.join(pasta, "documentos.sqlite3"))
+        inicio = time.perf_counter()
+        lote = []
+        for registro in gerar(args.docs, args.itens):
+            lote.append(registro)
+            if len(lote) >= args.lote:
+                repo.salvar_lote(lote)
+                lote = []
+        if lote:
+            repo.salvar_lote(lote)
+        duracao = time.perf_counter() - inicio
+        tamanho = os.path.getsize(repo.caminho) / 2 ** 20
+        print(f"gravação: {args.docs} docs ({args.docs * args.itens} itens) em {duracao:.1f}s "
+              f"= {args.docs / duracao:.0f} docs/s | banco {tamanho:.0f} MB")
+
+        rnd = random.Random(1)
+        consultas = {
+            "por_chave (duplicata)": lambda: repo.por_chave(f"35{rnd.randrange(args.docs):042d}", VERSAO),
+            "por_arquivo (reenvio)": lambda: repo.por_arquivo(hash_arquivo(str(rnd.randrange(args.docs)).encode()), VERSAO),
+            "emitente": lambda: repo.buscar(emitente=f"{rnd.randrange(1000):014d}"),
+            "emitente + trimestre": lambda: repo.buscar(emitente=f"{rnd.randrange(1000):014d}",
+                                                        data_de="01-01-2024", data_ate="31-03-2024"),
+            "destinatario": lambda: repo.buscar(destinatario=f"{rnd.randrange(5000):011d}"),
+            "mês (1a página)": lambda: repo.buscar(data_de="01-06-2024", data_ate="30-06-2024"),
+            "cfop + emitente": lambda: repo.buscar(cfop="5405", emitente=f"{rnd.randrange(1000):014d}"),
+            "cfop (1a página)": lambda: repo.buscar(cfop=rnd.choice(CFOPS)),
+            "contar emitente": lambda: repo.contar(emitente=f"{rnd.randrange(1000):014d}"),
+            "contar cfop": lambda: repo.contar(cfop=rnd.choice(CFOPS)),
+        }
+        print(f"\n{'consulta':<24} | {'p50 ms':>8} | {'p95 ms':>8}")
+        for nome, consulta in consultas.items():
+            p50, p95 = medir(consulta, args.repeticoes)
+            print(f"{nome:<24} | {p50:>8.2f} | {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
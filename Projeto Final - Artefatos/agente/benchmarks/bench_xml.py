@@ -0,0 +1,40 @@
+"""
+Compara o extrator de XML novo (nfe_xml.py) com o antigo em NF-es sintéticas grandes.
+
+Uso (da pasta agente):
+    python -m benchmarks.bench_xml
+    python -m benchmarks.bench_xml --itens 10 200 2000 10000
+"""
+import argparse
+import timeit
+
+from nfe_xml import extrair_nfe
+from benchmarks.sintetico import gerar_nfe_xml
+from benchmarks.xml_legado import process_xml_content_legado
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--itens", type=int, nargs="+", default=[10, 200, 2000, 10000])
+    ap.add_argument("--repeticoes", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'itens':>7} | {'legado (ms)':>12} | {'novo (ms)':>10} | {'ganho':>6}")
+    for n in args.itens:
+        xml_bytes = gerar_nfe_xml(n, seed=n)
+
+        # antes de medir, garante que a saida e identica
+        legado = process_xml_content_legado(xml_bytes.decode('utf-8'))
+        novo = extrair_nfe(xml_bytes)
+        assert legado == novo, f"saida diferente com {n} itens"
+
+        numero = max(1, 2000 // max(n, 1))
+        t_legado = min(timeit.repeat(lambda: process_xml_content_legado(xml_bytes.decode('utf-8')),
+                                     number=numero, repeat=args.repeticoes)) / numero
+        t_novo = min(timeit.repeat(lambda: extrair_nfe(xml_bytes), number=numero, repeat=args.repeticoes)) / numero
+
+        print(f"{n:>7} | {t_legado * 1000:>12.2f} | {t_novo * 1000:>10.2f} | {t_legado / t_novo:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
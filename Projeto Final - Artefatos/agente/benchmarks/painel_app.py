@@ -0,0 +1,24 @@
+"""
+App mínimo pro bench_painel: mostra o painel do main.py com um documento sintético
+grande, sem precisar de upload. Não é pra rodar direto.
+"""
+import os
+
+import streamlit as st
+
+import main  # 1a execucao monta a tela do app; depois fica no sys.modules
+from llm_falso import documento_sintetico
+
+N_ITENS = int(os.getenv("BENCH_PAINEL_ITENS", "5000"))
+
+if "bench_doc" not in st.session_state:
+    doc = documento_sintetico(N_ITENS)
+    for i, item in enumerate(doc["itens"]):
+        item["descricao"] = f"PRODUTO SINTETICO {i % 700}"
+        item["codigo_operacao"] = ("5102", "6102", "5405", "")[i % 4]
+        item["valor_total"] = float(i % 97) + 0.5
+    doc["totais_valores"]["valor_total_principal"] = 0.0  # mostra a edicao manual
+    st.session_state["bench_doc"] = doc
+    st.session_state["bench_ocr"] = "\n".join(f"{i['descricao']} 5102 00 {i['valor_total']}" for i in doc["itens"])
+
+main.render_results_dashboard(st.session_state["bench_doc"], source="LLM/OCR", ocr_text=st.session_state["bench_ocr"])
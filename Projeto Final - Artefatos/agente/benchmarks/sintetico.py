@@ -0,0 +1,382 @@
+"""
+Gerador de documentos sintéticos pros benchmarks (nada aqui é dado real).
+"""
+import random
+
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+
+
+def gerar_nfe_xml(n_itens: int = 10, seed: int = 0) -> bytes:
+    """Monta um nfeProc (NF-e 4.00 + protocolo + assinatura) com `n_itens` dets."""
+    rnd = random.Random(seed)
+    chave = "".join(rnd.choice("0123456789") for _ in range(44))
+
+    dets = []
+    total = 0.0
+    for i in range(1, n_itens + 1):
+        qtd = rnd.randint(1, 20)
+        v_unit = round(rnd.uniform(1, 500), 2)
+        v_prod = round(qtd * v_unit, 2)
+        total += v_prod
+
+        # mistura regime normal (CST) e simples nacional (CSOSN)
+        if i % 3 == 0:
+            icms = "<ICMSSN102><orig>0</orig><CSOSN>102</CSOSN></ICMSSN102>"
+        else:
+            icms = (
+                f"<ICMS00><orig>0</orig><CST>00</CST><modBC>3</modBC><vBC>{v_prod:.2f}</vBC>"
+                f"<pICMS>18.00</pICMS><vICMS>{v_prod * 0.18:.2f}</vICMS></ICMS00>"
+            )
+
+        dets.append(
+            f'<det nItem="{i}"><prod><cProd>{i:05d}</cProd><cEAN>SEM GTIN</cEAN>'
+            f'<xProd>PRODUTO &amp; TESTE {i}</xProd><NCM>84713012</NCM>'
+            f'<CFOP>{rnd.choice(["5102", "6102", "5405"])}</CFOP>'
+            f'<uCom>UN</uCom><qCom>{qtd:.4f}</qCom><vUnCom>{v_unit:.10f}</vUnCom><vProd>{v_prod:.2f}</vProd>'
+            f'<cEANTrib>SEM GTIN</cEANTrib><uTrib>UN</uTrib><qTrib>{qtd:.4f}</qTrib>'
+            f'<vUnTrib>{v_unit:.10f}</vUnTrib><indTot>1</indTot></prod>'
+            f'<imposto><vTotTrib>{v_prod * 0.3:.2f}</vTotTrib><ICMS>{icms}</ICMS>'
+            f'<PIS><PISAliq><CST>01</CST><vBC>{v_prod:.2f}</vBC><pPIS>1.65</pPIS><vPIS>{v_prod * 0.0165:.2f}</vPIS></PISAliq></PIS>'
+            f'<COFINS><COFINSAliq><CST>01</CST><vBC>{v_prod:.2f}</vBC><pCOFINS>7.60</pCOFINS>'
+            f'<vCOFINS>{v_prod * 0.076:.2f}</vCOFINS></COFINSAliq></COFINS>'
+            f'</imposto></det>'
+        )
+
+    xml = (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<nfeProc xmlns="{NS_NFE}" versao="4.00"><NFe xmlns="{NS_NFE}"><infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><natOp>VENDA DE MERCADORIA</natOp><mod>55</mod><serie>1</serie><nNF>{seed + 1}</nNF>'
+        f'<dhEmi>2024-03-15T10:20:30-03:00</dhEmi><tpNF>1</tpNF></ide>'
+        f'<emit><CNPJ>12345678000199</CNPJ><xNome>EMPRESA EMITENTE LTDA</xNome><xFant>EMITENTE</xFant>'
+        f'<enderEmit><xLgr>RUA DAS FLORES</xLgr><nro>100</nro><xBairro>CENTRO</xBairro><cMun>3550308</cMun>'
+        f'<xMun>SAO PAULO</xMun><UF>SP</UF><CEP>01001000</CEP></enderEmit><IE>111222333444</IE><CRT>3</CRT></emit>'
+        f'<dest><CPF>12345678909</CPF><xNome>CLIENTE DA SILVA</xNome>'
+        f'<enderDest><xLgr>AV BRASIL</xLgr><nro>2000</nro><xBairro>JARDIM</xBairro><xMun>CAMPINAS</xMun>'
+        f'<UF>SP</UF></enderDest><indIEDest>9</indIEDest></dest>'
+        + "".join(dets) +
+        f'<total><ICMSTot><vBC>{total:.2f}</vBC><vICMS>{total * 0.18:.2f}</vICMS><vST>0.00</vST>'
+        f'<vProd>{total:.2f}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg><vDesc>0.00</vDesc><vIPI>0.00</vIPI>'
+        f'<vPIS>{total * 0.0165:.2f}</vPIS><vCOFINS>{total * 0.076:.2f}</vCOFINS><vOutro>0.00</vOutro>'
+        f'<vNF>{total:.2f}</vNF><vTotTrib>{total * 0.3:.2f}</vTotTrib></ICMSTot></total>'
+        f'</infNFe><Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo/>'
+        f'<SignatureValue>c2ludGV0aWNv</SignatureValue></Signature></NFe>'
+        f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><chNFe>{chave}</chNFe><nProt>135240000000001</nProt>'
+        f'</infProt></protNFe></nfeProc>'
+    )
+    return xml.encode("utf-8")
+
+
+def gerar_texto_ocr(n_paginas: int = 3, itens_por_pagina: int = 25, seed: int = 0) -> str:
+    """
+    Texto no formato do `montar_texto_ocr` imitando o Tesseract numa DANFE escaneada:
+    cabeçalho/rodapé repetidos em toda página, linhas vazias, lixo de borda e pontilhado.
+    """
+    from ocr import marcador_pagina  # import tardio: so esse gerador precisa do ocr
+
+    rnd = random.Random(seed)
+    chave = " ".join("".join(rnd.choice("0123456789") for _ in range(4)) for _ in range(11))
+    cabecalho = [
+        "EMPRESA EMITENTE LTDA", "RUA DAS FLORES, 100 - CENTRO - SAO PAULO/SP",
+        "DANFE   DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRONICA", f"CHAVE DE ACESSO  {chave}",
+        "|", "CODIGO   DESCRICAO DO PRODUTO   NCM   CST   CFOP   UN   QTD   V.UNIT   V.TOTAL", "_" * 60,
+    ]
+    paginas = []
+    item = 1
+    for p in range(1, n_paginas + 1):
+        linhas = list(cabecalho) + [""]
+        for _ in range(itens_por_pagina):
+            qtd = rnd.randint(1, 20)
+            v_unit = rnd.uniform(1, 500)
+            valores = f"{v_unit:.2f}   {qtd * v_unit:.2f}".replace(".", ",")
+            linhas.append(f"{item:05d}   PRODUTO TESTE {item} .......   84713012   000   5102   UN   {qtd},0000   {valores}")
+            linhas.append(rnd.choice(["", "", "~", "'", "| |"]))
+            item += 1
+        linhas += ["", "-" * 40, "DADOS ADICIONAIS   RESERVADO AO FISCO", f"FOLHA {p}/{n_paginas}", ""]
+        paginas.append(marcador_pagina(p) + "\n".join(linhas))
+    return "\n".join(paginas)
+
+
+def gerar_documentos(n_docs: int = 100, itens_por_doc: int = 50, seed: int = 0) -> list:
+    """
+    Documentos já no formato DocumentoProcessado, com os defeitos típicos da saída
+    do LLM: código vazio (às vezes escrito na descrição), valor em texto, total que não fecha.
+    """
+    rnd = random.Random(seed)
+    participante = {"id_fiscal": "12345678000199", "nome_completo": "EMPRESA SINTETICA LTDA",
+                    "endereco_completo": "RUA TESTE, 1 - CENTRO - SAO PAULO/SP", "inscricao_estadual": ""}
+    documentos = []
+    for d in range(n_docs):
+        itens = []
+        total = 0.0
+        for i in range(itens_por_doc):
+            qtd = rnd.randint(1, 20)
+            v_unit = round(rnd.uniform(1, 500), 2)
+            v_total = round(qtd * v_unit, 2)
+            total += v_total
+            cod_op, cod_trib, descricao = rnd.choice(["5102", "6102", "5405"]), rnd.choice(["00", "102", "60"]), f"PRODUTO {i}"
+            sorteio = rnd.random()
+            if sorteio < 0.1:
+                descricao, cod_op = f"PRODUTO {i} CFOP {rnd.choice(['5102', '6102'])}", ""
+            elif sorteio < 0.15:
+                descricao, cod_trib = f"PRODUTO {i} CST 060", ""
+            elif sorteio < 0.18:
+                cod_op = None
+            itens.append({"descricao": descricao, "quantidade": qtd, "valor_unitario": v_unit,
+                          "valor_total": str(v_total) if sorteio > 0.97 else v_total,
+                          "codigo_operacao": cod_op, "codigo_tributario": cod_trib,
+                          "valor_aprox_taxas": round(v_total * 0.3, 2)})
+        documentos.append({
+            "numero_controle": f"{d:044d}", "modelo_documento": "NF-e", "data_emissao": "15-03-2024",
+            "valor_total_nota": round(total, 2) if d % 10 else round(total + 1, 2),
+            "tipo_operacao": "VENDA DE MERCADORIA",
+            "remetente": participante, "receptor": dict(participante, nome_completo="" if d % 25 == 0 else "CLIENTE"),
+            "totais_valores": {}, "itens": itens,
+        })
+    return documentos
+
+
+def _linhas_danfe(rnd, n_itens: int) -> list:
+    chave = " ".join("".join(rnd.choice("0123456789") for _ in range(4)) for _ in range(11))
+    linhas = ["EMPRESA EMITENTE LTDA", "RUA DAS FLORES, 100 - CENTRO - SAO PAULO/SP",
+              "DANFE - DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRONICA", f"CHAVE DE ACESSO {chave}",
+              "CODIGO DESCRICAO DO PRODUTO NCM CST CFOP UN QTD V.UNIT V.TOTAL"]
+    for i in range(1, n_itens + 1):
+        qtd = rnd.randint(1, 20)
+        v_unit = rnd.uniform(1, 500)
+        valores = f"{v_unit:.2f} {qtd * v_unit:.2f}".replace(".", ",")
+        linhas.append(f"{i:05d} PRODUTO TESTE {i} 84713012 000 5102 UN {qtd},0000 {valores}")
+    linhas += ["VALOR TOTAL DA NOTA", "DADOS ADICIONAIS RESERVADO AO FISCO"]
+    return linhas
+
+
+def _linhas_cupom(rnd, n_itens: int) -> list:
+    linhas = ["MERCADO SINTETICO LTDA", "CNPJ 12.345.678/0001-99", "CUPOM FISCAL ELETRONICO - SAT"]
+    total = 0.0
+    for i in range(1, n_itens + 1):
+        valor = rnd.uniform(1, 80)
+        total += valor
+        linhas.append(f"{i:03d} ITEM {rnd.choice(['ARROZ', 'FEIJAO', 'CAFE', 'LEITE', 'PAO'])} 1 UN {valor:.2f}".replace(".", ","))
+    linhas.append(f"TOTAL R$ {total:.2f}".replace(".", ","))
+    return linhas
+
+
+def _desenhar(linhas: list, largura: int, altura_letra: int, margem: int):
+    from PIL import Image, ImageDraw, ImageFont
+
+    fonte = ImageFont.load_default(size=altura_letra)
+    passo = int(altura_letra * 1.6)
+    img = Image.new("L", (largura, margem * 2 + passo * len(linhas)), 255)
+    desenho = ImageDraw.Draw(img)
+    for i, linha in enumerate(linhas):
+        desenho.text((margem, margem + i * passo), linha, fill=0, font=fonte)
+    return img
+
+
+def _degradar(img, rnd, angulo: float, ruido: float, borda: int, sombra: bool):
+    """Imita scan/foto: gira, escurece a borda, sombra de um lado e ruído granulado."""
+    import numpy as np
+    from PIL import Image
+
+    img = img.rotate(angulo, expand=True, fillcolor=255, resample=Image.BICUBIC)
+    px = np.asarray(img, dtype=np.float32)
+    if sombra:
+        px = px * np.linspace(0.55, 1.0, px.shape[1])[None, :]
+    if ruido:
+        px = px + np.random.default_rng(rnd.randint(0, 2 ** 31)).normal(0, ruido, px.shape)
+    px = np.clip(px, 0, 255).astype(np.uint8)
+    if borda:
+        px = np.pad(px, borda, constant_values=20)  # faixa preta do scanner
+    return Image.fromarray(px)
+
+
+def gerar_paginas_imagem(seed: int = 0) -> list:
+    """
+    Corpus pro benchmark de pré-processamento: [(nome, imagem PIL, texto verdadeiro)].
+    DANFEs "escaneadas" (A4 a 200 DPI, tortas, com borda) e cupons "fotografados"
+    (estreitos, letra pequena, sombra e ruído).
+    """
+    rnd = random.Random(seed)
+    corpus = []
+    for n, (angulo, letra) in enumerate([(2.5, 22), (-1.5, 40)], start=1):
+        linhas = _linhas_danfe(rnd, 30)
+        img = _desenhar(linhas, 1654, letra, 80)
+        corpus.append((f"danfe_{n}", _degradar(img, rnd, angulo, ruido=12, borda=40, sombra=False), "\n".join(linhas)))
+    for n, (angulo, letra) in enumerate([(4.0, 11), (-3.0, 13)], start=1):
+        linhas = _linhas_cupom(rnd, 20)
+        img = _desenhar(linhas, 420, letra, 20)
+        corpus.append((f"cupom_{n}", _degradar(img, rnd, angulo, ruido=25, borda=0, sombra=True), "\n".join(linhas)))
+    return corpus
+
+
+def gerar_imagem_documento(tipo: str = "danfe", n_itens: int = 30, seed: int = 0):
+    """Uma página (imagem PIL "L") de DANFE escaneada ou cupom fotografado + o texto verdadeiro."""
+    rnd = random.Random(seed)
+    if tipo == "cupom":
+        linhas = _linhas_cupom(rnd, n_itens)
+        img = _degradar(_desenhar(linhas, 420, 13, 20), rnd, 3.0, ruido=25, borda=0, sombra=True)
+    else:
+        linhas = _linhas_danfe(rnd, n_itens)
+        img = _degradar(_desenhar(linhas, 1654, 22, 80), rnd, 1.5, ruido=12, borda=40, sombra=False)
+    return img, "\n".join(linhas)
+
+
+def gerar_pdf_danfe(n_itens: int = 30, seed: int = 0, escaneado: bool = True, itens_por_pagina: int = 40) -> bytes:
+    """
+    PDF A4 de DANFE com `n_itens` itens, várias páginas se precisar. Escaneado = cada
+    página é só uma imagem (vai pro OCR); senão a página tem camada de texto (PDF digital).
+    """
+    import io
+    import pymupdf
+
+    rnd = random.Random(seed)
+    linhas = _linhas_danfe(rnd, n_itens)
+    cabecalho, corpo = linhas[:5], linhas[5:]
+    paginas = [cabecalho + corpo[i:i + itens_por_pagina] for i in range(0, max(len(corpo), 1), itens_por_pagina)]
+    with pymupdf.open() as doc:
+        for linhas_pagina in paginas:
+            pagina = doc.new_page(width=595, height=842)
+            if escaneado:
+                img = _degradar(_desenhar(linhas_pagina, 1654, 22, 80), rnd, rnd.uniform(-2, 2), ruido=12, borda=0, sombra=False)
+                buf = io.BytesIO()
+                img.save(buf, format="JPEG", quality=80)  # scanner costuma gravar JPEG
+                pagina.insert_image(pagina.rect, stream=buf.getvalue(), keep_proportion=True)
+            else:
+                pagina.insert_text((36, 48), "\n".join(linhas_pagina), fontsize=8, fontname="helv")
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+LAYOUTS_DANFE = ("padrao", "fornecedor", "sem_totais", "chave_ilegivel")
+
+
+def _cnpj(rnd) -> str:
+    from regras_danfe import digitos_cnpj
+    base = "".join(rnd.choice("0123456789") for _ in range(8)) + "0001"
+    return base + digitos_cnpj(base)
+
+
+def _fmt_cnpj(c: str) -> str:
+    return f"{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}"
+
+
+def _br(valor: float) -> str:
+    return f"{valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def gerar_texto_danfe(n_itens: int = 30, seed: int = 0, layout: str = "padrao", itens_por_pagina: int = 40) -> tuple:
+    """
+    (texto no formato do `montar_texto_ocr`, documento esperado) de uma DANFE completa,
+    pra leitura por regras (regras_danfe.py). Layouts:
+    - padrao: o do manual da DANFE, quadros com os rótulos numa linha e os valores na de baixo;
+    - fornecedor: "RÓTULO: valor" na mesma linha, sem canhoto nem quadro de impostos;
+    - sem_totais: padrao sem o quadro "CÁLCULO DO IMPOSTO" (total e itens ficam pro LLM);
+    - chave_ilegivel: padrao com um dígito da chave trocado (DV não confere).
+    """
+    from regras_danfe import digito_chave
+    from ocr import marcador_pagina
+
+    if layout not in LAYOUTS_DANFE:
+        raise ValueError(f"layout desconhecido: {layout}")
+    rnd = random.Random(seed)
+    emitente = rnd.choice(["DISTRIBUIDORA ALFA LTDA", "COMÉRCIO DE PEÇAS BETA EIRELI", "INDÚSTRIA GAMA S.A."])
+    cliente = rnd.choice(["MERCADO SÃO JOÃO LTDA", "PADARIA BOA VISTA ME", "OFICINA DELTA LTDA"])
+    cnpj_emit, cnpj_dest = _cnpj(rnd), _cnpj(rnd)
+    ie_emit, ie_dest = (str(rnd.randint(10 ** 11, 10 ** 12 - 1)) for _ in range(2))
+    dia, mes, ano = rnd.randint(1, 28), rnd.randint(1, 12), rnd.choice([2023, 2024])
+    data = f"{dia:02d}/{mes:02d}/{ano}"
+    base = f"35{ano % 100:02d}{mes:02d}{cnpj_emit}55001{rnd.randint(1, 999999999):09d}1{rnd.randint(0, 10 ** 8 - 1):08d}"
+    chave = base + digito_chave(base)
+    impressa = chave
+    if layout == "chave_ilegivel":
+        pos = rnd.randrange(44)
+        impressa = chave[:pos] + str((int(chave[pos]) + 1) % 10) + chave[pos + 1:]
+    chave_grupos = " ".join(impressa[i:i + 4] for i in range(0, 44, 4))
+
+    itens, linhas_itens = [], []
+    for i in range(1, n_itens + 1):
+        qtd = rnd.randint(1, 20)
+        unit = round(rnd.uniform(1, 500), 2)
+        total = round(qtd * unit, 2)
+        cfop, cst = rnd.choice(["5102", "6102", "5405"]), rnd.choice(["000", "060", "102"])
+        descricao = f"PRODUTO {rnd.choice(['PARAFUSO', 'ARRUELA', 'CABO', 'FILTRO'])} {i}"
+        itens.append({"descricao": descricao, "quantidade": float(qtd), "valor_unitario": unit, "valor_total": total,
+                      "codigo_operacao": cfop, "codigo_tributario": cst, "valor_aprox_taxas": 0.0})
+        linhas_itens.append(f"{i:06d}   {descricao}   84713012   {cst}   {cfop}   UN   {qtd},0000   {_br(unit)}   "
+                            f"{_br(total)}   0,00   0,00   0,00   0,00   0,00")
+    produtos = round(sum(item["valor_total"] for item in itens), 2)
+    frete = round(rnd.choice([0.0, rnd.uniform(10, 200)]), 2)
+    ipi = round(produtos * 0.05, 2)
+    base_icms, icms = produtos, round(produtos * 0.18, 2)
+    total_nota = round(produtos + frete + ipi, 2)
+
+    endereco_emit, endereco_dest = "RUA DAS INDÚSTRIAS, 1500 - DISTRITO INDUSTRIAL", "AVENIDA BRASIL, 200"
+    if layout == "fornecedor":
+        cabecalho = [
+            emitente, endereco_emit, "CAMPINAS - SP", f"CNPJ: {_fmt_cnpj(cnpj_emit)}   IE: {ie_emit}",
+            f"DANFE - NF-e Nº {base[25:34]} SÉRIE 001", f"CHAVE DE ACESSO: {chave_grupos}",
+            "NATUREZA DA OPERAÇÃO: VENDA DE MERCADORIA", f"DATA DE EMISSÃO: {data}",
+            "DESTINATÁRIO", f"NOME/RAZÃO SOCIAL: {cliente}", f"CNPJ/CPF: {_fmt_cnpj(cnpj_dest)}",
+            f"ENDEREÇO: {endereco_dest}", "MUNICÍPIO: SÃO PAULO   UF: SP", f"INSCRIÇÃO ESTADUAL: {ie_dest}",
+            "ITENS DA NOTA",
+            "CÓDIGO   DESCRIÇÃO   NCM   CST   CFOP   UN   QTD   V.UNIT   V.TOTAL   BC ICMS   V.ICMS   V.IPI   %ICMS   %IPI",
+        ]
+        rodape = [f"VALOR TOTAL DOS PRODUTOS: {_br(produtos)}", f"VALOR DO FRETE: {_br(frete)}",
+                  f"VALOR DO IPI: {_br(ipi)}", f"VALOR TOTAL DA NOTA: {_br(total_nota)}"]
+    else:
+        cabecalho = [
+            f"RECEBEMOS DE {emitente} OS PRODUTOS/SERVIÇOS CONSTANTES DA NOTA FISCAL INDICADA AO LADO",
+            f"DATA DE RECEBIMENTO   IDENTIFICAÇÃO E ASSINATURA DO RECEBEDOR   NF-e Nº {base[25:34]} SÉRIE 001",
+            emitente, endereco_emit, "CAMPINAS - SP   CEP 13000-000",
+            "DANFE   DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRÔNICA   0 - ENTRADA   1 - SAÍDA   1",
+            "CHAVE DE ACESSO", chave_grupos,
+            "NATUREZA DA OPERAÇÃO   PROTOCOLO DE AUTORIZAÇÃO DE USO",
+            f"VENDA DE MERCADORIA   1352400{rnd.randint(10 ** 7, 10 ** 8 - 1)} {data} 10:22:11",
+            "INSCRIÇÃO ESTADUAL   INSC. ESTADUAL DO SUBST. TRIBUT.   CNPJ",
+            f"{ie_emit}   {_fmt_cnpj(cnpj_emit)}",
+            "DESTINATÁRIO / REMETENTE",
+            "NOME / RAZÃO SOCIAL   CNPJ / CPF   DATA DA EMISSÃO",
+            f"{cliente}   {_fmt_cnpj(cnpj_dest)}   {data}",
+            "ENDEREÇO   BAIRRO / DISTRITO   CEP   DATA DA SAÍDA/ENTRADA",
+            f"{endereco_dest}   CENTRO   01000-000   {data}",
+            "MUNICÍPIO   FONE / FAX   UF   INSCRIÇÃO ESTADUAL   HORA DA SAÍDA",
+            f"SÃO PAULO   (11) 5555-1234   SP   {ie_dest}   10:30:00",
+        ]
+        if layout != "sem_totais":
+            cabecalho += [
+                "CÁLCULO DO IMPOSTO",
+                "BASE DE CÁLC. DO ICMS   VALOR DO ICMS   BASE DE CÁLC. ICMS S.T.   VALOR DO ICMS SUBST.   V. TOTAL PRODUTOS",
+                f"{_br(base_icms)}   {_br(icms)}   0,00   0,00   {_br(produtos)}",
+                "VALOR DO FRETE   VALOR DO SEGURO   DESCONTO   OUTRAS DESPESAS   VALOR TOTAL IPI   VALOR TOTAL DA NOTA",
+                f"{_br(frete)}   0,00   0,00   0,00   {_br(ipi)}   {_br(total_nota)}",
+            ]
+        cabecalho += [
+            "TRANSPORTADOR / VOLUMES TRANSPORTADOS",
+            "RAZÃO SOCIAL   FRETE POR CONTA   CNPJ / CPF",
+            f"TRANSPORTES RÁPIDOS LTDA   0 - EMITENTE   {_fmt_cnpj(_cnpj(rnd))}",
+            "DADOS DOS PRODUTOS / SERVIÇOS",
+            "CÓDIGO   DESCRIÇÃO DO PRODUTO / SERVIÇO   NCM/SH   O/CST   CFOP   UN   QUANT   VALOR UNIT   VALOR TOTAL   "
+            "BC ICMS   VALOR ICMS   VALOR IPI   ALÍQ. ICMS   ALÍQ. IPI",
+        ]
+        rodape = []
+    rodape += ["DADOS ADICIONAIS", "INFORMAÇÕES COMPLEMENTARES   RESERVADO AO FISCO"]
+
+    paginas = []
+    blocos = [linhas_itens[i:i + itens_por_pagina] for i in range(0, max(len(linhas_itens), 1), itens_por_pagina)]
+    for p, bloco in enumerate(blocos, start=1):
+        # pagina 2+ repete o cabecalho da DANFE (a compactacao do llm.py tira), como no impresso
+        linhas = cabecalho + [""] + bloco + (rodape if p == len(blocos) else []) + [f"FOLHA {p}/{len(blocos)}"]
+        paginas.append(marcador_pagina(p) + "\n".join(linhas))
+
+    participante = lambda nome, cnpj, endereco, ie: {"id_fiscal": cnpj, "nome_completo": nome,
+                                                     "endereco_completo": endereco, "inscricao_estadual": ie}
+    esperado = {
+        "numero_controle": chave, "modelo_documento": "NF-e", "data_emissao": data.replace("/", "-"),
+        "valor_total_nota": total_nota, "tipo_operacao": "VENDA DE MERCADORIA",
+        "remetente": participante(emitente, cnpj_emit, endereco_emit, ie_emit),
+        "receptor": participante(cliente, cnpj_dest, f"{endereco_dest} - SÃO PAULO/SP", ie_dest),
+        "totais_valores": {"base_calculo_principal": base_icms, "valor_total_principal": icms,
+                           "valor_total_adicional": ipi, "valor_total_contribuicao_a": 0.0,
+                           "valor_total_contribuicao_b": 0.0, "valor_outras_despesas": 0.0,
+                           "valor_aprox_taxas_total": 0.0},
+        "itens": itens,
+    }
+    return "\n".join(paginas), esperado
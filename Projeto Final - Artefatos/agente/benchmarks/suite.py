@@ -0,0 +1,244 @@
+"""
+Suíte de benchmark do pipeline, etapa por etapa, com corpus sintético reproduzível
+(benchmarks.sintetico, sempre as mesmas sementes).
+
+Etapas (as mesmas funções que o app chama):
+- xml:          process_xml_content em NF-es com N itens;
+- rasterizacao: renderizar_pagina de todas as páginas de um PDF escaneado;
+- ocr:          run_ocr_on_file em PDF digital, PDF escaneado e imagens de DANFE/cupom
+                (sem cache; sem Tesseract instalado só o PDF digital roda);
+- prompt:       preparar_prompt (compactação + template) em textos de OCR de N páginas;
+- regras:       extrair_por_regras (leitura da DANFE sem LLM) em textos de DANFE com N itens;
+- llm:          interpretar_texto com o ChatFalso (sem rede, latência 0): saída JSON + validação;
+- auditoria:    enrich_and_validate_extraction em documentos com N itens;
+- exportacao:   tabela_itens (DataFrame) + csv_itens, como no download do painel.
+
+Pra cada caso: latência p50/p95/média (ms), vazão (docs/s e itens/s quando faz sentido)
+e pico de memória alocada (tracemalloc, numa rodada separada pra não distorcer o tempo).
+Sai em JSON; com --comparar aponta as regressões contra um resultado anterior e
+termina com código 1 se houver alguma.
+
+Uso (da pasta agente):
+    python -m benchmarks.suite -o base.json
+    python -m benchmarks.suite -o novo.json --comparar base.json --tolerancia 0.2
+    python -m benchmarks.suite --etapas xml auditoria --itens 10 1000 --repeticoes 50
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ["OCR_CACHE"] = "0"  # mede o OCR de verdade, nao o cache de paginas
+os.environ.setdefault("EXTRATOR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "extrator_suite"))  # nao suja o cache do app
+
+import numpy as np
+
+from benchmarks.sintetico import (gerar_documentos, gerar_imagem_documento, gerar_nfe_xml, gerar_pdf_danfe,
+                                  gerar_texto_danfe, gerar_texto_ocr)
+
+ETAPAS = ("xml", "rasterizacao", "ocr", "prompt", "regras", "llm", "auditoria", "exportacao")
+
+
+class Upload(io.BytesIO):
+    """Imita o UploadedFile do Streamlit (o run_ocr_on_file usa .type, .seek e .read)."""
+
+    def __init__(self, conteudo: bytes, tipo: str):
+        super().__init__(conteudo)
+        self.type = tipo
+
+
+def _app():
+    # o main.py e o script do streamlit: importado fora do `streamlit run` ele roda em
+    # "bare mode" (a tela vira no-op) e as funcoes ficam usaveis
+    logging.disable(logging.WARNING)  # bare mode avisa a cada st.* chamado
+    import main
+    return main
+
+
+def medir(funcao, entrada, repeticoes: int) -> dict:
+    """Latências (ms) de `funcao(entrada)` + pico de memória de uma rodada extra com tracemalloc."""
+    funcao(entrada)  # aquecimento (imports tardios, caches de modulo)
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(entrada)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    tracemalloc.start()
+    funcao(entrada)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95 = np.percentile(latencias, [50, 95])
+    media = float(np.mean(latencias))
+    return {"amostras": repeticoes, "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "media_ms": round(media, 3), "docs_por_s": round(1000 / media, 2) if media else None,
+            "pico_memoria_mb": round(pico / 2 ** 20, 2)}
+
+
+def casos(etapas: list, itens: list, paginas: list) -> list:
+    """[(etapa, caso, função, entrada, itens por documento)] na ordem do pipeline."""
+    app = _app()
+    lista = []
+
+    if "xml" in etapas:
+        for n in itens:
+            lista.append(("xml", f"nfe_{n}_itens", app.process_xml_content, gerar_nfe_xml(n, seed=n), n))
+
+    if "rasterizacao" in etapas:
+        import pymupdf
+        from ocr import renderizar_pagina
+
+        def rasterizar(pdf):
+            with pymupdf.open(stream=pdf, filetype="pdf") as doc:
+                return [renderizar_pagina(pagina) for pagina in doc]
+
+        for n in paginas:
+            lista.append(("rasterizacao", f"pdf_escaneado_{n}_paginas", rasterizar,
+                          gerar_pdf_danfe(40 * n, seed=n, escaneado=True), None))
+
+    if "ocr" in etapas:
+        def ocr(arquivo):
+            texto = app.run_ocr_on_file(Upload(*arquivo))
+            if texto.startswith("ERRO_"):
+                raise RuntimeError(texto)
+            return texto
+
+        for n in paginas:
+            lista.append(("ocr", f"pdf_digital_{n}_paginas", ocr,
+                          (gerar_pdf_danfe(40 * n, seed=n, escaneado=False), "application/pdf"), None))
+            lista.append(("ocr", f"pdf_escaneado_{n}_paginas", ocr,
+                          (gerar_pdf_danfe(40 * n, seed=n, escaneado=True), "application/pdf"), None))
+        for tipo in ("danfe", "cupom"):
+            img, _ = gerar_imagem_documento(tipo, 30 if tipo == "danfe" else 20)
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            lista.append(("ocr", f"png_{tipo}", ocr, (buf.getvalue(), "image/png"), None))
+
+    if "prompt" in etapas:
+        from llm import preparar_prompt
+        for n in paginas:
+            lista.append(("prompt", f"texto_ocr_{n}_paginas", preparar_prompt, gerar_texto_ocr(n, 25, seed=n), 25 * n))
+
+    if "regras" in etapas:
+        from regras_danfe import extrair_por_regras
+        for n in itens:
+            lista.append(("regras", f"danfe_{n}_itens", extrair_por_regras, gerar_texto_danfe(n, seed=n)[0], n))
+
+    if "llm" in etapas:
+        from extrator import interpretar_texto
+        from llm_falso import ChatFalso, documento_sintetico
+
+        texto = gerar_texto_ocr(1, 25)
+        for n in itens:
+            cliente = ChatFalso(latencia_s=0.0, jitter_s=0.0, resposta=json.dumps(documento_sintetico(n), ensure_ascii=False))
+            lista.append(("llm", f"resposta_{n}_itens",
+                          lambda t, c=cliente: interpretar_texto(t, c, usar_cache=False), texto, n))
+
+    if "auditoria" in etapas:
+        texto = gerar_texto_ocr(1, 25)
+        for n in itens:
+            doc = gerar_documentos(1, n, seed=n)[0]
+            lista.append(("auditoria", f"documento_{n}_itens",
+                          lambda d, t=texto: app.enrich_and_validate_extraction(d, t), doc, n))
+
+    if "exportacao" in etapas:
+        contador = iter(range(10 ** 9))
+
+        def exportar(itens_doc):
+            # chave nova a cada chamada: mede o 1o download (o painel guarda no cache depois)
+            chave = f"suite-{next(contador)}"
+            return app.csv_itens(chave, app.tabela_itens(chave, itens_doc))
+
+        for n in itens:
+            lista.append(("exportacao", f"csv_{n}_itens", exportar, gerar_documentos(1, n, seed=n)[0]["itens"], n))
+
+    return lista
+
+
+def _ambiente() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"python": sys.version.split()[0], "plataforma": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit, "data": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def _rss_max_mb():
+    try:
+        import resource  # so unix
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> list:
+    """Casos cujo p50 piorou mais que `tolerancia` (fração) em relação à base."""
+    anteriores = {(r["etapa"], r["caso"]): r for r in base["resultados"] if "p50_ms" in r}
+    regressoes = []
+    for r in atual["resultados"]:
+        anterior = anteriores.get((r["etapa"], r["caso"]))
+        if anterior and "p50_ms" in r and r["p50_ms"] > anterior["p50_ms"] * (1 + tolerancia):
+            regressoes.append({"etapa": r["etapa"], "caso": r["caso"], "p50_base_ms": anterior["p50_ms"],
+                               "p50_ms": r["p50_ms"], "variacao": round(r["p50_ms"] / anterior["p50_ms"] - 1, 3)})
+    return regressoes
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-o", "--saida", help="JSON com os resultados (sem isso vai pro stdout)")
+    ap.add_argument("--etapas", nargs="+", choices=ETAPAS, default=list(ETAPAS))
+    ap.add_argument("--itens", type=int, nargs="+", default=[10, 100, 1000], help="Itens por documento")
+    ap.add_argument("--paginas", type=int, nargs="+", default=[1, 3], help="Páginas por PDF / texto de OCR")
+    ap.add_argument("--repeticoes", type=int, default=20)
+    ap.add_argument("--comparar", help="JSON de uma rodada anterior pra apontar regressões")
+    ap.add_argument("--tolerancia", type=float, default=0.2, help="Piora aceita no p50 (0.2 = 20%%)")
+    args = ap.parse_args()
+
+    resultados = []
+    for etapa, caso, funcao, entrada, n_itens in casos(args.etapas, args.itens, args.paginas):
+        try:
+            r = {"etapa": etapa, "caso": caso, **medir(funcao, entrada, args.repeticoes)}
+        except Exception as e:
+            # ex.: OCR sem Tesseract instalado; o caso fica registrado como pulado
+            r = {"etapa": etapa, "caso": caso, "pulado": f"{type(e).__name__}: {e}"}
+            print(f"{etapa:<12} {caso:<26} pulado ({r['pulado'][:80]})", file=sys.stderr)
+            resultados.append(r)
+            continue
+        if n_itens and r["media_ms"]:
+            r["itens_por_s"] = round(n_itens * 1000 / r["media_ms"], 1)
+        resultados.append(r)
+        print(f"{etapa:<12} {caso:<26} p50 {r['p50_ms']:>10.2f}ms  p95 {r['p95_ms']:>10.2f}ms  "
+              f"{r['docs_por_s']:>9.1f} docs/s  pico {r['pico_memoria_mb']:>7.1f}MB", file=sys.stderr)
+
+    relatorio = {"ambiente": _ambiente(), "repeticoes": args.repeticoes, "resultados": resultados,
+                 "rss_max_mb": _rss_max_mb()}
+    codigo = 0
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            relatorio["regressoes"] = comparar(relatorio, json.load(f), args.tolerancia)
+        for reg in relatorio["regressoes"]:
+            print(f"REGRESSÃO {reg['etapa']}/{reg['caso']}: p50 {reg['p50_base_ms']}ms -> {reg['p50_ms']}ms "
+                  f"(+{reg['variacao']:.0%})", file=sys.stderr)
+        codigo = 1 if relatorio["regressoes"] else 0
+
+    saida = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida)
+    else:
+        print(saida)
+    sys.exit(codigo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Copia congelada do `process_xml_content` antigo (antes do nfe_xml.py).
+Serve de referencia: o extrator novo tem que devolver exatamente a mesma coisa.
+"""
+import xml.etree.ElementTree as ET
+
+
+def process_xml_content_legado(xml_content: str) -> dict:
+    """
+    Processa o conteúdo XML de um documento (ex: NF-e) e extrai os dados diretamente
+    para o formato de dicionário compatível com DocumentoProcessado.
+    """
+    # TIRA O NAMESPACE!! senao o find nao acha nada
+    xml_content = xml_content.replace('xmlns="http://www.portalfiscal.inf.br/nfe"', '')
+    root = ET.fromstring(xml_content)
+
+    # helper pra achar tag
+    def find_text(path, element=root, default=""):
+        node = element.find(path)
+        return node.text if node is not None else default
+
+    # helper pra converter float (ja ta la em cima, mas o xml usa outra)
+    def safe_float_xml(text):
+        try:
+            if isinstance(text, str):
+                 text = text.replace(',', '.')
+            return float(text)
+        except (ValueError, TypeError):
+            return 0.0
+
+    # --- Dados Principais (infNFe) ---
+    numero_controle = find_text('.//chNFe') or find_text('.//Id', default="").replace('NFe', '')
+    data_emissao_raw = find_text('.//dhEmi') or find_text('.//dEmi')
+    data_emissao = "" 
+    if data_emissao_raw:
+        data_emissao_iso = data_emissao_raw[:10] 
+        try:
+            # Tenta reformatar de AAAA-MM-DD para DD-MM-AAAA
+            parts = data_emissao_iso.split('-')
+            if len(parts) == 3:
+                data_emissao = f"{parts[2]}-{parts[1]}-{parts[0]}" 
+            else:
+                data_emissao = data_emissao_iso 
+        except Exception:
+            data_emissao = data_emissao_iso 
+
+    modelo_documento = find_text('.//mod')
+    valores_tot = root.find('.//ICMSTot') 
+    valor_total_nota = safe_float_xml(find_text('.//vNF', valores_tot))
+    tipo_operacao = find_text('.//natOp')
+
+    # --- Totais de Valores (imposto/ICMSTot) ---
+    totais_valores = {
+        'base_calculo_principal': safe_float_xml(find_text('.//vBC', valores_tot)),
+        'valor_total_principal': safe_float_xml(find_text('.//vICMS', valores_tot)),
+        'valor_total_adicional': safe_float_xml(find_text('.//vIPI', valores_tot)),
+        'valor_total_contribuicao_a': safe_float_xml(find_text('.//vPIS', valores_tot)),
+        'valor_total_contribuicao_b': safe_float_xml(find_text('.//vCOFINS', valores_tot)),
+        'valor_outras_despesas': safe_float_xml(find_text('.//vOutro', valores_tot)),
+        'valor_aprox_taxas_total': safe_float_xml(find_text('.//vTotTrib', valores_tot)),
+    }
+
+    # --- Remetente (emit) e Receptor (dest) ---
+    def extract_participante(element_tag):
+        element = root.find(f'.//{element_tag}')
+        if element is None: return {}
+
+        id_fiscal = find_text('.//CNPJ', element) or find_text('.//CPF', element)
+        ender = element.find('.//enderEmit') or element.find('.//enderDest')
+
+        endereco_completo = ""
+        if ender is not None:
+             logradouro = find_text('.//xLgr', ender)
+             numero = find_text('.//nro', ender)
+             bairro = find_text('.//xBairro', ender)
+             municipio = find_text('.//xMun', ender)
+             uf = find_text('.//UF', ender)
+             endereco_completo = f"{logradouro}, {numero} - {bairro} - {municipio}/{uf}".strip() if all([logradouro, numero, municipio, uf]) else ""
+
+        return {
+            'id_fiscal': id_fiscal,
+            'nome_completo': find_text('.//xNome', element),
+            'endereco_completo': endereco_completo,
+            'inscricao_estadual': find_text('.//IE', element),
+        }
+
+    remetente = extract_participante('emit') # pega os dados do emitente
+    receptor = extract_participante('dest') # pega os dados do destinatario
+
+    # --- Itens (det) ---
+    itens = []
+    for det in root.findall('.//det'):
+        prod = det.find('.//prod')
+        imposto = det.find('.//imposto')
+
+        codigo_tributario = ""
+        imposto_node = imposto.find('.//ICMS') 
+        if imposto_node is not None:
+            # Procura por qualquer nó que contenha CST ou CSOSN
+            for imposto_subnode in imposto_node:
+                if 'CST' in imposto_subnode.tag:
+                    codigo_tributario = find_text('.//CST', imposto_subnode)
+                    break
+                elif 'CSOSN' in imposto_subnode.tag:
+                    codigo_tributario = find_text('.//CSOSN', imposto_subnode)
+                    break
+
+        v_aprox_taxas = 0.0
+        if imposto.find('.//impostoTrib') is not None:
+             v_aprox_taxas = safe_float_xml(find_text('.//vTotTrib', imposto.find('.//impostoTrib')))
+
+        itens.append({
+            'descricao': find_text('.//xProd', prod),
+            'quantidade': safe_float_xml(find_text('.//qCom', prod)),
+            'valor_unitario': safe_float_xml(find_text('.//vUnCom', prod)),
+            'valor_total': safe_float_xml(find_text('.//vProd', prod)),
+            'codigo_operacao': find_text('.//CFOP', prod),
+            'codigo_tributario': codigo_tributario,
+            'valor_aprox_taxas': v_aprox_taxas,
+        })
+
+    # --- Montagem do Resultado Final ---
+    result = {
+        'numero_controle': numero_controle,
+        'modelo_documento': modelo_documento,
+        'data_emissao': data_emissao,
+        'valor_total_nota': valor_total_nota,
+        'tipo_operacao': tipo_operacao,
+        'remetente': remetente,
+        'receptor': receptor,
+        'totais_valores': totais_valores,
+        'itens': itens,
+    }
+
+    return result # devolve o dicionario pronto
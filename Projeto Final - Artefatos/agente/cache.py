@@ -0,0 +1,131 @@
+"""
+Cache persistente em disco (SQLite) pros resultados de extração.
+
+A chave é o SHA-256 dos bytes do arquivo + versão do pipeline + modelo, então
+dois arquivos com o mesmo nome/tamanho não colidem mais e o mesmo arquivo
+enviado por qualquer pessoa (ou qualquer processo) cai no mesmo registro.
+O banco usa WAL + busy timeout pra aguentar vários processos ao mesmo tempo e
+remove os registros menos acessados (LRU) quando passa do limite de tamanho.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# suba esse número quando mudar algo que altera o resultado (prompt, parser, regras...)
+VERSAO_PIPELINE = "2"  # 2: texto compactado, schema nativo com reparo, leitura por regras
+
+CACHE_DIR = os.getenv("EXTRATOR_CACHE_DIR", ".cache_extrator")
+CACHE_LIMITE_MB = float(os.getenv("EXTRATOR_CACHE_MB", "512"))
+
+
+def chave_documento(conteudo: bytes, modelo: str) -> str:
+    """Chave de conteúdo: sha256(arquivo) + versão do pipeline + modelo usado."""
+    digest = hashlib.sha256(conteudo).hexdigest()
+    return f"{digest}:{VERSAO_PIPELINE}:{modelo}"
+
+
+class CacheDisco:
+    """Mapa chave -> JSON guardado numa tabela SQLite, com despejo LRU por tamanho."""
+
+    def __init__(self, tabela: str, caminho: str = None, limite_mb: float = CACHE_LIMITE_MB,
+                 ttl_segundos: float = None):
+        if not tabela.isidentifier():
+            raise ValueError(f"Nome de tabela inválido: {tabela}")
+        self.tabela = tabela
+        self.caminho = caminho or os.path.join(CACHE_DIR, "cache.sqlite3")
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self.ttl_segundos = ttl_segundos  # None = nao expira
+        self._local = threading.local()  # sqlite3 nao gosta de conexao compartilhada entre threads
+        self._lock_contadores = threading.Lock()
+        self.acertos = 0  # contadores do processo atual (nao persistem)
+        self.faltas = 0
+        self._criar_tabela()
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # depois de um fork o filho precisa abrir a propria conexao
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _criar_tabela(self):
+        conn = self._conexao()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.tabela} ("
+            " chave TEXT PRIMARY KEY,"
+            " valor BLOB NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " criado REAL NOT NULL,"
+            " acessado REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.tabela}_acessado ON {self.tabela}(acessado)")
+
+    def get(self, chave: str):
+        conn = self._conexao()
+        row = conn.execute(f"SELECT valor, criado FROM {self.tabela} WHERE chave = ?", (chave,)).fetchone()
+        if row is not None and self.ttl_segundos is not None and time.time() - row[1] > self.ttl_segundos:
+            conn.execute(f"DELETE FROM {self.tabela} WHERE chave = ?", (chave,))
+            row = None  # expirou
+        with self._lock_contadores:
+            if row is None:
+                self.faltas += 1
+            else:
+                self.acertos += 1
+        if row is None:
+            return None
+        conn.execute(f"UPDATE {self.tabela} SET acessado = ? WHERE chave = ?", (time.time(), chave))
+        return json.loads(row[0])
+
+    def set(self, chave: str, valor):
+        dados = json.dumps(valor, ensure_ascii=False).encode("utf-8")
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.tabela} (chave, valor, tamanho, criado, acessado) VALUES (?, ?, ?, ?, ?)",
+            (chave, dados, len(dados), agora, agora),
+        )
+        self._despejar(conn)
+
+    def _despejar(self, conn):
+        total = conn.execute(f"SELECT COALESCE(SUM(tamanho), 0) FROM {self.tabela}").fetchone()[0]
+        if total <= self.limite_bytes:
+            return
+        # tira os menos acessados ate ficar em 90% do limite (folga pra nao despejar a cada set)
+        alvo = total - int(self.limite_bytes * 0.9)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removidos = 0
+            while removidos < alvo:
+                lote = conn.execute(
+                    f"SELECT chave, tamanho FROM {self.tabela} ORDER BY acessado ASC LIMIT 64"
+                ).fetchall()
+                if not lote:
+                    break
+                for chave, tamanho in lote:
+                    if removidos >= alvo:
+                        break
+                    conn.execute(f"DELETE FROM {self.tabela} WHERE chave = ?", (chave,))
+                    removidos += tamanho
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def estatisticas(self) -> dict:
+        """Acertos/faltas deste processo + tamanho atual da tabela."""
+        conn = self._conexao()
+        registros, tamanho = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM {self.tabela}"
+        ).fetchone()
+        return {"acertos": self.acertos, "faltas": self.faltas, "registros": registros, "bytes": tamanho}
+
+    def limpar(self):
+        self._conexao().execute(f"DELETE FROM {self.tabela}")
@@ -0,0 +1,358 @@
+"""
+Exportação dos resultados em tabelas colunares (Parquet, Arrow IPC) ou CSV no formato
+brasileiro, em streaming: os registros do lote.py / extrator.py (ou do JSONL deles)
+viram duas tabelas, uma linha por documento e uma por item, montadas direto em
+colunas do pyarrow a cada LOTE_EXPORTACAO documentos e gravadas conforme chegam.
+A memória fica no tamanho do lote, não do resultado inteiro.
+
+Valores monetários e quantidades saem em decimal com a precisão do leiaute da NF-e
+(vProd 15v2, qCom 15v4, vUnCom 21v10), sem o ruído do float; `numeros="float"`
+grava float64 pra ferramenta que não lê decimal. A data de emissão vira date32.
+
+O CSV é o do app: `;`, vírgula decimal, BOM utf-8 (Excel BR) e aspas só onde precisa.
+A formatação é feita por coluna (pyarrow.compute) e cada lote vira um bloco de bytes
+só, nada passa linha a linha pelo Python.
+
+Uso (da pasta agente):
+    python exportacao.py resultado.jsonl --formato parquet   # resultado.documentos.parquet + resultado.itens.parquet
+    python exportacao.py resultado.jsonl --formato csv -o planilhas/notas
+    python lote.py exportacao_sefaz.zip -o notas --formato parquet   # direto do lote, sem JSONL
+"""
+import argparse
+import codecs
+import io
+import json
+import os
+import time
+from itertools import chain
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from modelos import TotaisValores
+
+FORMATOS = ("parquet", "arrow", "csv")
+LOTE_EXPORTACAO = 2000  # documentos por lote gravado
+LOTE_ITENS = 200_000  # ...ou menos, se os itens deles passarem disso (nota com milhares de itens)
+BOM = codecs.BOM_UTF8  # o Excel so acerta os acentos do CSV com ele
+
+# (precisao, escala) do leiaute da NF-e
+DECIMAL_VALOR = (15, 2)
+DECIMAL_QUANTIDADE = (15, 4)
+DECIMAL_UNITARIO = (21, 10)
+
+COLUNAS_ITEM = [
+    ("descricao", "texto"),
+    ("quantidade", DECIMAL_QUANTIDADE),
+    ("valor_unitario", DECIMAL_UNITARIO),
+    ("valor_total", DECIMAL_VALOR),
+    ("codigo_operacao", "texto"),
+    ("codigo_tributario", "texto"),
+    ("valor_aprox_taxas", DECIMAL_VALOR),
+]
+# nome da coluna -> (caminho no documento, tipo)
+COLUNAS_DOCUMENTO = [
+    ("chave_acesso", ("numero_controle",), "texto"),
+    ("modelo_documento", ("modelo_documento",), "texto"),
+    ("data_emissao", ("data_emissao",), "data"),
+    ("tipo_operacao", ("tipo_operacao",), "texto"),
+    ("valor_total_nota", ("valor_total_nota",), DECIMAL_VALOR),
+    *[(f"{papel}_{campo}", (origem, campo), "texto")
+      for papel, origem in (("emitente", "remetente"), ("destinatario", "receptor"))
+      for campo in ("id_fiscal", "nome_completo", "inscricao_estadual", "endereco_completo")],
+    *[(campo, ("totais_valores", campo), DECIMAL_VALOR) for campo in TotaisValores.model_fields],
+]
+_CABECALHO_DOCUMENTO = [("documento", pa.int64()), ("arquivo", pa.string()), ("status", pa.string()),
+                        ("source", pa.string()), ("erro", pa.string()), ("qtd_itens", pa.int32())]
+_CABECALHO_ITEM = [("documento", pa.int64()), ("arquivo", pa.string()), ("indice", pa.int32())]
+_SEM_FLOAT = pa.scalar(None, pa.float64())
+_PRECISA_ASPAS = r'[;"\r\n]'  # o que faz o to_csv do pandas (QUOTE_MINIMAL) por aspas
+
+
+def _tipo(tipo, numeros: str):
+    if tipo == "texto":
+        return pa.string()
+    if tipo == "data":
+        return pa.date32()
+    return pa.decimal128(*tipo) if numeros == "decimal" else pa.float64()
+
+
+def esquema_documentos(numeros: str = "decimal") -> pa.Schema:
+    return pa.schema(_CABECALHO_DOCUMENTO + [(nome, _tipo(tipo, numeros)) for nome, _, tipo in COLUNAS_DOCUMENTO])
+
+
+def esquema_itens(numeros: str = "decimal") -> pa.Schema:
+    return pa.schema(_CABECALHO_ITEM + [(nome, _tipo(tipo, numeros)) for nome, tipo in COLUNAS_ITEM])
+
+
+# --- colunas ---
+
+def _para_float(valor):
+    try:
+        return float(str(valor).replace(",", ".").strip())  # texto de numero do LLM, igual ao safe_float do app
+    except ValueError:
+        return None
+
+
+def _texto(valores: list) -> pa.Array:
+    try:
+        return pa.array(valores, type=pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in valores], type=pa.string())
+
+
+def _numero(valores: list, tipo) -> pa.Array:
+    try:
+        coluna = pa.array(valores, type=pa.float64())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        coluna = pa.array([None if v is None else _para_float(v) for v in valores], type=pa.float64())
+    if pa.types.is_decimal(tipo):
+        # o que nao cabe na precisao (nan, lixo do LLM) vira nulo em vez de derrubar a exportacao
+        cabe = pc.and_(pc.is_finite(coluna), pc.less(pc.abs(coluna), 10.0 ** (tipo.precision - tipo.scale)))
+        # float -> decimal do arrow arredonda igual ao f"{x:.2f}"
+        coluna = pc.if_else(cabe, coluna, _SEM_FLOAT).cast(tipo, safe=False)
+    return coluna
+
+
+def _data(valores: list) -> pa.Array:
+    texto = pc.replace_substring(_texto(valores), "/", "-")  # DD-MM-AAAA (o LLM as vezes manda com /)
+    return pc.strptime(texto, format="%d-%m-%Y", unit="s", error_is_null=True).cast(pa.date32())
+
+
+def _coluna(valores: list, tipo) -> pa.Array:
+    if pa.types.is_string(tipo):
+        return _texto(valores)
+    if pa.types.is_date32(tipo):
+        return _data(valores)
+    return _numero(valores, tipo)
+
+
+def _campo(documento, caminho: tuple):
+    for parte in caminho:
+        if not isinstance(documento, dict):
+            return None
+        documento = documento.get(parte)
+    return documento
+
+
+def montar_lote(registros: list, inicio: int, esquemas: dict) -> tuple:
+    """
+    (documentos, itens) em RecordBatch. `registros` no formato do lote.py / extrator.py
+    ({"arquivo", "status", "erro", "documento", ...}); `inicio` é a posição do 1o deles
+    na tabela de documentos (a coluna `documento` dos itens aponta pra ela).
+    """
+    documentos = [r.get("documento") or {} for r in registros]
+    listas = [d.get("itens") or [] for d in documentos]
+    tamanhos = np.fromiter((len(l) for l in listas), dtype=np.int64, count=len(listas))
+    posicoes = np.arange(inicio, inicio + len(registros), dtype=np.int64)
+
+    esquema = esquemas["documentos"]
+    colunas = [pa.array(posicoes), _texto([r.get("arquivo") for r in registros]),
+               _texto([r.get("status") for r in registros]), _texto([r.get("source") for r in registros]),
+               _texto([r.get("erro") for r in registros]), pa.array(tamanhos, type=pa.int32())]
+    colunas += [_coluna([_campo(d, caminho) for d in documentos], esquema.field(nome).type)
+                for nome, caminho, _ in COLUNAS_DOCUMENTO]
+    lote_documentos = pa.RecordBatch.from_arrays(colunas, schema=esquema)
+
+    esquema = esquemas["itens"]
+    itens = list(chain.from_iterable(listas))
+    dono = np.repeat(np.arange(len(registros)), tamanhos)  # posicao do documento no lote, por item
+    # indice do item dentro do documento: 0..n-1 de cada um
+    indices = np.arange(len(itens), dtype=np.int64) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+    colunas = [pa.array(posicoes[dono]), colunas[1].take(pa.array(dono)), pa.array(indices, type=pa.int32())]
+    colunas += [_coluna([item.get(nome) for item in itens], esquema.field(nome).type) for nome, _ in COLUNAS_ITEM]
+    return lote_documentos, pa.RecordBatch.from_arrays(colunas, schema=esquema)
+
+
+# --- CSV (formato brasileiro) ---
+
+def _celulas_csv(coluna: pa.Array) -> pa.Array:
+    if pa.types.is_large_string(coluna.type):
+        coluna = coluna.cast(pa.string())  # coluna "string" do pandas; um lote nao passa de 2 GB
+    tipo = coluna.type
+    if pa.types.is_floating(tipo):
+        # float (ex.: DataFrame do painel) sai com 2 casas, como sempre saiu no download do app
+        cabe = pc.is_finite(coluna)
+        coluna = pc.if_else(cabe, coluna, pa.scalar(None, tipo)).cast(pa.decimal128(38, 2), safe=False)
+        tipo = coluna.type
+    if pa.types.is_decimal(tipo):
+        if tipo.scale > 2:
+            # 5.0000000000 -> 5.00 e 1.2345000000 -> 1.2345 (sem regex: o RE2 custava mais que o resto do lote)
+            duas_casas = coluna.cast(pa.decimal128(tipo.precision, 2), safe=False)
+            longo = coluna.cast(pa.string())
+            if pc.any(pc.match_substring(longo, "E")).as_py():
+                # abaixo de 1e-6 o arrow escreve em notacao cientifica (1E-7): raro, vai pelo Decimal do python
+                longo = pa.array([None if v is None else format(v, "f") for v in coluna.to_pylist()], pa.string())
+            texto = pc.if_else(pc.equal(duas_casas, coluna), duas_casas.cast(pa.string()), pc.utf8_rtrim(longo, "0"))
+        else:
+            texto = coluna.cast(pa.string())
+        texto = pc.replace_substring(texto, ".", ",")
+    elif pa.types.is_date32(tipo):
+        texto = pc.strftime(coluna, format="%d/%m/%Y")
+    elif pa.types.is_string(tipo):
+        precisa = pc.match_substring_regex(coluna, _PRECISA_ASPAS)
+        texto = coluna
+        if pc.any(precisa).as_py():
+            citado = pc.binary_join_element_wise('"', pc.replace_substring(coluna, '"', '""'), '"', "")
+            texto = pc.if_else(precisa, citado, coluna)
+    else:
+        texto = coluna.cast(pa.string())
+    return texto
+
+
+def cabecalho_csv(nomes: list) -> bytes:
+    return BOM + (";".join(nomes) + "\n").encode("utf-8")
+
+
+def linhas_csv(lote) -> bytes:
+    """Corpo do CSV (sem cabeçalho) de um RecordBatch/Table: uma linha por registro, `;` e vírgula decimal."""
+    if lote.num_rows == 0:
+        return b""
+    if isinstance(lote, pa.Table):
+        lote = lote.combine_chunks().to_batches()[0]
+    colunas = [_celulas_csv(coluna) for coluna in lote.columns]
+    linhas = pc.binary_join_element_wise(*colunas, ";", null_handling="replace", null_replacement="")
+    tudo = pc.binary_join(pa.ListArray.from_arrays(pa.array([0, len(linhas)], pa.int32()), linhas), "\n")
+    return tudo[0].as_buffer().to_pybytes() + b"\n"
+
+
+def csv_br(tabela: pa.Table, nomes: list = None) -> bytes:
+    """CSV inteiro (BOM + cabeçalho + linhas) de uma tabela pequena, ex.: os itens de um documento no app."""
+    return cabecalho_csv(nomes or tabela.column_names) + linhas_csv(tabela)
+
+
+# --- escritores incrementais ---
+
+class _EscritorParquet:
+    def __init__(self, destino, esquema: pa.Schema):
+        self._escritor = pq.ParquetWriter(destino, esquema, compression="zstd")
+
+    def escrever(self, lote: pa.RecordBatch):
+        self._escritor.write_batch(lote)
+
+    def fechar(self):
+        self._escritor.close()
+
+
+class _EscritorArrow:
+    """Arrow IPC em arquivo (o mesmo do Feather v2): lê com mmap, sem descompactar."""
+
+    def __init__(self, destino, esquema: pa.Schema):
+        self._arquivo = pa.OSFile(destino, "wb") if isinstance(destino, str) else None
+        self._escritor = pa.ipc.new_file(self._arquivo or destino, esquema)
+
+    def escrever(self, lote: pa.RecordBatch):
+        self._escritor.write_batch(lote)
+
+    def fechar(self):
+        self._escritor.close()
+        if self._arquivo is not None:
+            self._arquivo.close()
+
+
+class _EscritorCSV:
+    def __init__(self, destino, esquema: pa.Schema):
+        self._arquivo = open(destino, "wb") if isinstance(destino, str) else None
+        self._destino = self._arquivo or destino
+        self._destino.write(cabecalho_csv(esquema.names))
+
+    def escrever(self, lote: pa.RecordBatch):
+        self._destino.write(linhas_csv(lote))
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+
+
+_ESCRITORES = {"parquet": _EscritorParquet, "arrow": _EscritorArrow, "csv": _EscritorCSV}
+
+
+def _lotes(resultados, lote: int):
+    """Agrupa os registros em lotes de até `lote` documentos / LOTE_ITENS itens."""
+    pendentes, itens = [], 0
+    for resultado in resultados:
+        pendentes.append(resultado)
+        itens += len((resultado.get("documento") or {}).get("itens") or [])
+        if len(pendentes) >= lote or itens >= LOTE_ITENS:
+            yield pendentes
+            pendentes, itens = [], 0
+    if pendentes:
+        yield pendentes
+
+
+def caminhos_tabelas(base: str, formato: str) -> dict:
+    return {tabela: f"{base}.{tabela}.{formato}" for tabela in ("documentos", "itens")}
+
+
+def gravar_tabelas(resultados, base: str, formato: str = "parquet", numeros: str = "decimal",
+                   lote: int = LOTE_EXPORTACAO) -> dict:
+    """
+    Grava `base`.documentos.<formato> e `base`.itens.<formato> conforme os registros chegam
+    e devolve a contagem por status (igual ao `lote.gravar_jsonl`).
+    """
+    esquemas = {"documentos": esquema_documentos(numeros), "itens": esquema_itens(numeros)}
+    caminhos = caminhos_tabelas(base, formato)
+    escritores = {tabela: _ESCRITORES[formato](caminhos[tabela], esquema) for tabela, esquema in esquemas.items()}
+    contagem = {"ok": 0, "invalido": 0, "erro": 0}
+    inicio = 0
+    try:
+        for registros in _lotes(resultados, lote):
+            for registro in registros:
+                contagem[registro["status"]] += 1
+            documentos, itens = montar_lote(registros, inicio, esquemas)
+            escritores["documentos"].escrever(documentos)
+            escritores["itens"].escrever(itens)
+            inicio += len(registros)
+    finally:
+        for escritor in escritores.values():
+            escritor.fechar()
+    return contagem
+
+
+def em_bytes(resultados, tabela: str = "itens", formato: str = "parquet", numeros: str = "decimal") -> bytes:
+    """Uma das tabelas inteira em memória (download do app: um documento só)."""
+    esquemas = {"documentos": esquema_documentos(numeros), "itens": esquema_itens(numeros)}
+    buffer = io.BytesIO()
+    escritor = _ESCRITORES[formato](buffer, esquemas[tabela])
+    inicio = 0
+    for registros in _lotes(resultados, LOTE_EXPORTACAO):
+        documentos, itens = montar_lote(registros, inicio, esquemas)
+        escritor.escrever(itens if tabela == "itens" else documentos)
+        inicio += len(registros)
+    escritor.fechar()
+    return buffer.getvalue()
+
+
+def ler_jsonl(caminho: str):
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            if linha.strip():
+                yield json.loads(linha)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("entrada", help="JSONL do lote.py / extrator.py")
+    ap.add_argument("-o", "--saida", default=None, help="Prefixo dos arquivos (padrão: o nome da entrada sem .jsonl)")
+    ap.add_argument("--formato", choices=FORMATOS, default="parquet")
+    ap.add_argument("--float", action="store_true", help="Valores em float64 em vez de decimal")
+    ap.add_argument("--lote", type=int, default=LOTE_EXPORTACAO, help="Documentos por lote gravado")
+    args = ap.parse_args()
+
+    base = args.saida or os.path.splitext(args.entrada)[0]
+    inicio = time.perf_counter()
+    contagem = gravar_tabelas(ler_jsonl(args.entrada), base, args.formato, "float" if args.float else "decimal",
+                              args.lote)
+    duracao = time.perf_counter() - inicio
+
+    total = sum(contagem.values())
+    print(f"{total} documentos em {duracao:.1f}s ->")
+    for caminho in caminhos_tabelas(base, args.formato).values():
+        print(f"  {caminho} ({os.path.getsize(caminho) / 2 ** 20:.1f} MB)")
+    print(f"ok: {contagem['ok']} | inválidos: {contagem['invalido']} | erros: {contagem['erro']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Núcleo da extração, sem Streamlit: bytes do arquivo + tipo -> DocumentoProcessado.
+
+É o mesmo pipeline do app (XML direto; PDF/imagem -> texto nativo/OCR -> Gemini
+com compactação, blocos e reparo, com os caches em disco), só que importável em
+qualquer script. O main.py usa estas funções e só cuida da tela.
+
+Também roda como CLI pra processar uma pasta inteira (PDFs, imagens e XMLs) com
+um pool de workers, gravando um JSONL com um registro por arquivo:
+
+    python extrator.py pasta_documentos/ -o resultado.jsonl --workers 4
+    python extrator.py pasta_documentos/ -o resultado --formato parquet   # tabelas do exportacao.py
+"""
+import argparse
+import io
+import mimetypes
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree.ElementTree import ParseError
+
+from pydantic import ValidationError
+
+from cache import CacheDisco, chave_documento
+from llm import (BACKENDS_LLM, BACKENDS_OFFLINE, GEMINI_MODEL, GEMINI_TEMPERATURE, LLM_BACKEND, chave_llm, get_cache_llm,
+                 medir_prompt, modelo_backend, pode_cachear, preparar_prompt, registrar_uso)
+from metricas import contar, etapa, medido
+from modelos import DocumentoProcessado
+from nfe_xml import extrair_nfe
+
+# OCR (pymupdf, pytesseract, PIL) e LLM (langchain) sao importados dentro das funcoes
+# que usam: quem so processa XML nao paga esses imports
+
+EXTENSOES = (".pdf", ".png", ".jpg", ".jpeg", ".xml")
+
+
+class ErroExtracao(Exception):
+    """Falha antes do LLM (arquivo ilegível, OCR, XML quebrado). `codigo` = ERRO_*."""
+
+    def __init__(self, codigo: str, mensagem: str):
+        super().__init__(f"{codigo}: {mensagem}")
+        self.codigo = codigo
+
+
+def tipo_arquivo(nome: str) -> str:
+    """MIME pelo nome do arquivo (o app recebe isso pronto do upload)."""
+    if nome.lower().endswith(".xml"):
+        return "text/xml"
+    return mimetypes.guess_type(nome)[0] or "application/octet-stream"
+
+
+def criar_cliente_gemini(google_api_key: str = None, backend: str = LLM_BACKEND):
+    """
+    ChatGoogleGenerativeAI com a config do app (chave do argumento ou do GOOGLE_API_KEY).
+    Com LLM_BACKEND falso/reproduzir devolve o substituto offline do llm_falso.py (sem
+    chave nem rede) e com "gravar" o Gemini embrulhado gravando cada resposta.
+    """
+    if backend not in BACKENDS_LLM:
+        raise ValueError(f"LLM_BACKEND desconhecido: {backend}. Use: {', '.join(BACKENDS_LLM)}")
+    if backend in BACKENDS_OFFLINE:
+        from llm_falso import cliente_do_ambiente
+        return cliente_do_ambiente(backend)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    google_api_key = google_api_key or os.getenv("GOOGLE_API_KEY")
+    if not google_api_key:
+        raise ErroExtracao("ERRO_CONFIG", "Chave da API do Google não encontrada (GOOGLE_API_KEY).")
+    cliente = ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=google_api_key, temperature=GEMINI_TEMPERATURE)
+    if backend == "gravar":
+        from llm_falso import cliente_do_ambiente
+        return cliente_do_ambiente(backend, cliente)
+    return cliente
+
+
+@medido("leitura_texto")
+def ler_texto(conteudo: bytes, mime: str, ocr_workers: int = None) -> dict:
+    """
+    Texto de um PDF ou imagem (camada nativa do PDF quando tem, OCR no resto).
+    Devolve {"texto", "preview", "paginas_texto_nativo": (nativas, total) ou None,
+    "tempos_ocr": {etapa do pré-processamento / "tesseract": ms somados nas páginas}}.
+    Levanta `ErroExtracao` com os mesmos códigos ERRO_* que o app mostra.
+    """
+    import pytesseract
+    from PIL import Image
+    from ocr import ocr_paginas, montar_texto_ocr, processar_pdf
+    from preprocessamento import somar_tempos
+
+    tempos = []
+    if "pdf" in mime:
+        try:
+            # le o texto nativo do pdf; so as paginas sem texto (scan) vao pro OCR
+            resultados, preview, paginas_nativas = processar_pdf(conteudo, ocr_workers, tempos)
+        except pytesseract.TesseractNotFoundError:
+            raise ErroExtracao("ERRO_TESSERACT", "O Tesseract não está instalado ou configurado no PATH.")
+        except Exception as e:
+            raise ErroExtracao("ERRO_PDF", f"Falha ao ler o PDF. Detalhes: {e}")
+        if not resultados:
+            raise ErroExtracao("ERRO_CONVERSAO", "Não foi possível converter o PDF em imagem.")
+        paginas_texto_nativo = (paginas_nativas, len(resultados))
+
+    elif "image" in mime:
+        try:
+            preview = Image.open(io.BytesIO(conteudo))
+        except Exception as e:
+            raise ErroExtracao("ERRO_IMAGEM", f"Falha na abertura da imagem. Detalhes: {e}")
+        try:
+            # aqui q o tesseract le (paginas em paralelo, ordem mantida)
+            resultados = ocr_paginas([preview], ocr_workers, tempos=tempos)
+        except pytesseract.TesseractNotFoundError:
+            raise ErroExtracao("ERRO_TESSERACT", "O Tesseract não está instalado ou configurado no PATH.")
+        paginas_texto_nativo = None
+
+    else:
+        raise ErroExtracao("ERRO_TIPO_INVALIDO", "Tipo de arquivo não suportado (apenas PDF, PNG, JPG).")
+
+    erros = [erro for _, erro in resultados if erro is not None]
+    if len(erros) == len(resultados):
+        raise ErroExtracao("ERRO_PROCESSAMENTO", f"Falha no OCR ou pré-processamento. Detalhes: {erros[0]}")
+
+    # pagina com erro vai marcada so nela
+    return {"texto": montar_texto_ocr(resultados), "preview": preview, "paginas_texto_nativo": paginas_texto_nativo,
+            "tempos_ocr": somar_tempos(tempos)}
+
+
+@medido("llm")
+def interpretar_texto(text_to_analyze: str, client, usar_cache: bool = True) -> dict:
+    """
+    Texto OCR -> dados do documento pelo Gemini (cache de respostas, blocos pra
+    documento longo, saída JSON nativa com reparo). Antes do Gemini a DANFE passa
+    pela leitura por regras (regras_danfe.py): completa, nem chama o LLM ("uso" None);
+    parcial, só os campos que faltaram vão pro Gemini. Devolve {"documento", "uso",
+    "reparos", "blocos", "cache", "regras" (resultado da leitura por regras ou None),
+    "complemento" (campos pedidos ao LLM por cima das regras ou None)}.
+    Levanta `RespostaInvalida` se não validar.
+    """
+    from llm_blocos import precisa_blocos, extrair_em_blocos
+    from llm_reparo import complementar_estruturado, extrair_estruturado
+    from regras_danfe import campos_para_llm, ler_por_regras
+
+    modelo = getattr(client, "model", GEMINI_MODEL)
+    temperatura = getattr(client, "temperature", GEMINI_TEMPERATURE)
+    chave_resposta = chave_llm(text_to_analyze, modelo, temperatura)
+
+    # mesmo texto (normalizado) ja foi pro Gemini? usa a resposta validada
+    if usar_cache:
+        parsed_data = get_cache_llm().get(chave_resposta)
+        contar("llm_cache_acertos" if parsed_data is not None else "llm_cache_faltas")
+        if parsed_data is not None:
+            return {"documento": parsed_data, "uso": None, "reparos": 0, "blocos": 0, "cache": True,
+                    "regras": None, "complemento": None}
+
+    regras = ler_por_regras(text_to_analyze)
+    campos = campos_para_llm(regras, text_to_analyze)
+    if campos == {}:
+        # DANFE toda lida por regras com as checagens fechando: sem Gemini (nem cache, reler e mais barato)
+        contar("regras_completas")
+        return {"documento": regras["documento"], "uso": None, "reparos": 0, "blocos": 0, "cache": False,
+                "regras": regras, "complemento": None}
+
+    reparos = 0
+    if campos:
+        contar("regras_complementos")
+        metricas_prompt = medir_prompt(text_to_analyze)  # so o tamanho do texto: vai o prompt do complemento
+        extracao = complementar_estruturado(client, DocumentoProcessado, text_to_analyze, regras["documento"], campos)
+        uso = registrar_uso(metricas_prompt, extracao.respostas)
+        parsed_data = extracao.documento()
+        reparos = extracao.reparos
+    elif precisa_blocos(text_to_analyze):
+        # documento longo: cabecalho + blocos de itens em paralelo
+        parsed_data, uso = extrair_em_blocos(text_to_analyze, client)
+    else:
+        final_prompt, metricas_prompt = preparar_prompt(text_to_analyze)
+        extracao = extrair_estruturado(client, final_prompt, DocumentoProcessado, text_to_analyze)
+        uso = registrar_uso(metricas_prompt, extracao.respostas)
+        parsed_data = extracao.documento()
+        reparos = extracao.reparos
+
+    contar("llm_tokens_entrada", uso.get("tokens_entrada", 0))
+    contar("llm_tokens_saida", uso.get("tokens_saida", 0))
+    if usar_cache and pode_cachear(text_to_analyze):
+        get_cache_llm().set(chave_resposta, parsed_data)
+    return {"documento": parsed_data, "uso": uso, "reparos": reparos, "blocos": uso.get("blocos", 0), "cache": False,
+            "regras": regras, "complemento": list(campos) if campos else None}
+
+
+_cache_resultados = None
+
+
+def cache_resultados():
+    """Cache de resultados por arquivo (mesma tabela do app; um por processo)."""
+    global _cache_resultados
+    if _cache_resultados is None:
+        _cache_resultados = CacheDisco("resultados")
+    return _cache_resultados
+
+
+def _do_repositorio(registro: dict, texto: str = None) -> dict:
+    return {"documento": registro["documento"], "source": registro["origem"], "ocr_text": registro["texto"] or texto,
+            "uso": None, "cache": True, "repositorio": registro["id"], "leitura": None}
+
+
+def _sem_progresso(etapa_atual: str):
+    pass
+
+
+def extrair(conteudo: bytes, mime: str, client=None, usar_cache: bool = True, ocr_workers: int = None,
+            nome: str = None, progresso=None) -> dict:
+    """
+    Pipeline completo de um arquivo. Devolve {"documento" (dict), "source" ("XML" ou
+    "LLM/OCR"), "ocr_text", "uso", "cache", "repositorio" (id no repositorio.py ou None),
+    "leitura" (preview/paginas_texto_nativo/tempos_ocr do `ler_texto`, só quando rodou)}.
+    O documento de XML é devolvido mesmo se não validar no schema (igual ao app); o do
+    LLM sempre vem validado.
+
+    Com o repositório ligado, arquivo já recebido volta direto (sem OCR/LLM) e PDF/imagem
+    cuja chave de acesso já está lá (ex.: a NF-e veio antes em XML) não chama o LLM.
+    `usar_cache=False` ignora os dois e reprocessa. Com LLM_BACKEND falso/reproduzir o
+    PDF/imagem não passa pelo repositório (nem lê, nem grava).
+
+    `progresso(etapa)` é chamado antes de cada etapa ("xml", "leitura", "llm"); se ele
+    levantar, a extração para ali (é assim que a fila.py cancela um arquivo em andamento).
+    """
+    from repositorio import repositorio
+
+    progresso = progresso or _sem_progresso
+    eh_xml = "xml" in mime
+    chave = chave_documento(conteudo, "xml" if eh_xml else modelo_backend())
+    # sha256 do arquivo (o mesmo do repositorio.hash_arquivo) e versao do pipeline + modelo
+    digest, versao = chave.split(":", 1)
+    # igual as chaves do cache: documento falso/reproduzido nunca se mistura com o do Gemini
+    repo = repositorio() if eh_xml or LLM_BACKEND not in BACKENDS_OFFLINE else None
+    if usar_cache and repo is not None:
+        with etapa("repositorio"):
+            registro = repo.por_arquivo(digest, versao)
+        contar("repositorio_arquivo_acertos" if registro is not None else "repositorio_arquivo_faltas")
+        if registro is not None:
+            return _do_repositorio(registro)
+    if usar_cache:
+        cached = cache_resultados().get(chave)
+        contar("resultados_cache_acertos" if cached is not None else "resultados_cache_faltas")
+        if cached is not None:
+            return {"documento": cached["parsed_data"], "source": cached["source"],
+                    "ocr_text": cached.get("ocr_text"), "uso": None, "cache": True, "repositorio": None,
+                    "leitura": None}
+
+    if eh_xml:
+        progresso("xml")
+        try:
+            with etapa("xml"):
+                parsed_data = extrair_nfe(conteudo)  # bytes direto, o parser respeita o encoding do XML
+        except ParseError as e:
+            raise ErroExtracao("ERRO_XML", f"XML malformado: {e}")
+        resultado = {"documento": parsed_data, "source": "XML", "ocr_text": None, "uso": None, "cache": False,
+                     "repositorio": None, "leitura": None}
+        try:
+            with etapa("validacao"):
+                DocumentoProcessado.model_validate(parsed_data)
+            valido = True
+        except ValidationError:
+            contar("validacao_falhas")
+            valido = False  # vai pra tela/JSONL mesmo assim, mas nao entra no cache
+    else:
+        progresso("leitura")
+        lido = ler_texto(conteudo, mime, ocr_workers)
+        texto = lido.pop("texto")
+        duplicado = duplicata_por_chave(texto, digest, versao, nome) if usar_cache and repo is not None else None
+        if duplicado is not None:
+            return {**duplicado, "leitura": lido}
+        progresso("llm")
+        if client is None:
+            client = criar_cliente_gemini()
+        interpretado = interpretar_texto(texto, client, usar_cache)
+        resultado = {"documento": interpretado["documento"], "source": "LLM/OCR", "ocr_text": texto,
+                     "uso": interpretado["uso"], "cache": interpretado["cache"], "repositorio": None, "leitura": lido}
+        valido = True
+
+    if usar_cache and valido:
+        cache_resultados().set(chave, {"parsed_data": resultado["documento"], "source": resultado["source"],
+                                       "ocr_text": resultado["ocr_text"]})
+    if repo is not None and valido:
+        with etapa("repositorio"):
+            resultado["repositorio"] = repo.salvar(resultado["documento"], resultado["source"], digest, nome,
+                                                   resultado["ocr_text"], versao)
+    return resultado
+
+
+def duplicata_por_chave(texto: str, hash_conteudo: str, versao: str, nome: str = None) -> dict:
+    """
+    Se a chave de acesso do texto já está no repositório (do XML ou lida nesta `versao`
+    do pipeline), liga este arquivo ao documento de lá e devolve ele (no formato do
+    `extrair`), sem LLM. Senão None.
+    """
+    from regras_danfe import chave_no_texto
+    from repositorio import repositorio
+
+    repo = repositorio()
+    if repo is None:
+        return None
+    with etapa("repositorio"):
+        chave_nfe = chave_no_texto(texto)
+        registro = repo.por_chave(chave_nfe, versao) if chave_nfe else None
+        if registro is not None:
+            repo.vincular(hash_conteudo, registro["id"], nome, versao)
+    contar("repositorio_chave_acertos" if registro is not None else "repositorio_chave_faltas")
+    return _do_repositorio(registro, texto) if registro is not None else None
+
+
+def extract_document(conteudo: bytes, mime: str, client=None) -> DocumentoProcessado:
+    """
+    Arquivo (bytes + MIME) -> DocumentoProcessado validado. Sem `client`, cria o
+    Gemini pelo GOOGLE_API_KEY quando precisa (XML não usa LLM).
+    Levanta `ErroExtracao`, `RespostaInvalida` ou `ValidationError` (XML fora do schema).
+    """
+    return DocumentoProcessado.model_validate(extrair(conteudo, mime, client)["documento"])
+
+
+# --- CLI: pasta inteira -> JSONL ---
+
+def listar_documentos(origem: str):
+    """Caminhos (relativos) dos PDFs, imagens e XMLs da pasta, em ordem."""
+    for raiz, _, arquivos in os.walk(origem):
+        for nome in sorted(arquivos):
+            if nome.lower().endswith(EXTENSOES):
+                yield os.path.relpath(os.path.join(raiz, nome), origem)
+
+
+def processar_arquivo(origem: str, nome: str, client=None, ocr_workers: int = None) -> dict:
+    """Extrai um arquivo da pasta. Nunca levanta: o erro vai no próprio registro (formato do lote.py)."""
+    from llm_reparo import RespostaInvalida
+
+    registro = {"arquivo": nome, "status": "erro", "erro": None, "documento": None, "source": None, "uso": None,
+                "repositorio": None}
+    inicio = time.perf_counter()
+    try:
+        with open(os.path.join(origem, nome), "rb") as f:
+            conteudo = f.read()
+        resultado = extrair(conteudo, tipo_arquivo(nome), client, ocr_workers=ocr_workers, nome=nome)
+        registro.update(documento=resultado["documento"], source=resultado["source"], uso=resultado["uso"],
+                        repositorio=resultado["repositorio"])
+        try:
+            DocumentoProcessado.model_validate(resultado["documento"])
+            registro["status"] = "ok"
+        except ValidationError as ve:
+            registro.update(status="invalido", erro=str(ve))
+    except (ErroExtracao, RespostaInvalida, OSError) as e:
+        registro["erro"] = str(e)
+    except Exception as e:
+        registro["erro"] = f"{type(e).__name__}: {e}"
+    registro["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return registro
+
+
+def processar_pasta(origem: str, workers: int = 4, client=None):
+    """
+    Gera um registro por arquivo, na ordem da listagem. Pool de threads: o OCR roda
+    em subprocesso do tesseract e o Gemini é rede, então thread basta. O OCR de cada
+    arquivo fica com a sua fatia das CPUs pra não sobrecarregar a máquina.
+    """
+    from ocr import OCR_WORKERS
+
+    workers = max(1, workers)
+    ocr_workers = max(1, OCR_WORKERS // workers)
+    if client is None and (os.getenv("GOOGLE_API_KEY") or LLM_BACKEND in BACKENDS_OFFLINE):
+        client = criar_cliente_gemini()  # um so cliente (conexao reaproveitada) pra todos os arquivos
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pendentes = deque()
+        for nome in listar_documentos(origem):
+            pendentes.append(pool.submit(processar_arquivo, origem, nome, client, ocr_workers))
+            # janela limitada, igual ao lote.py
+            if len(pendentes) >= workers * 2:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+def main():
+    from dotenv import load_dotenv
+    from lote import gravar
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("origem", help="Pasta com PDFs, imagens (PNG/JPG) e XMLs")
+    ap.add_argument("-o", "--saida", default="resultado_extracao.jsonl",
+                    help="Arquivo JSONL de saída (nos outros formatos, prefixo das tabelas)")
+    ap.add_argument("--formato", choices=("jsonl", "parquet", "arrow", "csv"), default="jsonl",
+                    help="parquet/arrow/csv: tabelas de documentos e itens, ver exportacao.py")
+    ap.add_argument("--workers", type=int, default=4, help="Arquivos processados ao mesmo tempo")
+    args = ap.parse_args()
+
+    load_dotenv()
+    if not os.path.isdir(args.origem):
+        ap.error(f"Pasta não encontrada: {args.origem}")
+
+    inicio = time.perf_counter()
+    contagem, destino = gravar(processar_pasta(args.origem, args.workers), args.saida, args.formato)
+    duracao = time.perf_counter() - inicio
+
+    total = sum(contagem.values())
+    print(f"{total} arquivos em {duracao:.1f}s -> {destino}")
+    print(f"ok: {contagem['ok']} | inválidos: {contagem['invalido']} | erros: {contagem['erro']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Fila de processamento em segundo plano do app: cada arquivo do upload vira uma
+`Tarefa` num pool de threads do processo, com no máximo FILA_WORKERS arquivos
+rodando ao mesmo tempo (os outros esperam na fila). O script do streamlit só
+submete e lê o estado das tarefas, então a tela não trava durante OCR/Gemini e
+dá pra abrir um documento pronto enquanto os outros ainda rodam.
+
+A extração é o `extrator.extrair` de sempre (caches, repositório, regras, LLM).
+Cancelar uma tarefa na fila tira ela do pool; uma em andamento para na próxima
+etapa (antes do OCR ou antes do Gemini), que é onde está o custo.
+
+O pool é um só por processo (no app, via st.cache_resource): o limite vale pra
+todas as sessões juntas, igual ao Gemini e ao tesseract, que também são do servidor.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import ValidationError
+
+import metricas
+from extrator import ErroExtracao, extrair
+from modelos import DocumentoProcessado
+
+FILA_WORKERS = int(os.getenv("FILA_WORKERS", "2"))
+
+# status: "fila" -> ("xml" | "leitura" -> "llm") -> "ok" | "invalido" | "erro" | "cancelado"
+FINAIS = ("ok", "invalido", "erro", "cancelado")
+# fracao da barra no inicio de cada etapa (OCR e Gemini sao o grosso do tempo)
+PROGRESSO = {"fila": 0.0, "xml": 0.5, "leitura": 0.1, "llm": 0.5}
+
+
+class Cancelado(Exception):
+    """Levantada dentro da extração quando a tarefa foi cancelada."""
+
+
+class Tarefa:
+    """Um arquivo na fila. Só a thread do pool escreve nos campos; a tela só lê."""
+
+    def __init__(self, nome: str, conteudo: bytes, mime: str):
+        self.nome = nome
+        self.mime = mime
+        self.conteudo = conteudo  # solto quando termina
+        self.status = "fila"
+        self.resultado = None  # o dict do extrator.extrair
+        self.erro = None
+        self.resposta_bruta = None  # JSON que o LLM devolveu, quando nem o reparo salvou
+        self.rastro = None  # metricas.Rastro.resumo() deste arquivo
+        self.criada = time.time()
+        self.inicio = None
+        self.fim = None
+        self._cancelar = threading.Event()
+        self._futuro = None
+
+    @property
+    def terminada(self) -> bool:
+        return self.status in FINAIS
+
+    @property
+    def progresso(self) -> float:
+        return 1.0 if self.terminada else PROGRESSO[self.status]
+
+    @property
+    def duracao_s(self) -> float:
+        if self.inicio is None:
+            return 0.0
+        return (self.fim or time.time()) - self.inicio
+
+    def avancar(self, etapa: str):
+        """Callback de progresso do `extrair`: marca a etapa ou interrompe se foi cancelada."""
+        if self._cancelar.is_set():
+            raise Cancelado()
+        self.status = etapa
+
+    def cancelar(self):
+        if self.terminada:
+            return
+        self._cancelar.set()
+        if self._futuro is not None and self._futuro.cancel():
+            # nem tinha comecado: sai da fila na hora
+            self._terminar("cancelado")
+
+    def _terminar(self, status: str, erro: str = None):
+        self.conteudo = None
+        self.erro = erro
+        self.fim = time.time()
+        self.status = status  # por ultimo: a tela so le o resto depois de ver o status final
+        metricas.contar(f"fila_{status}")
+
+
+class Fila:
+    """Pool de threads limitado + submissão de tarefas. Thread basta: OCR é subprocesso e o Gemini é rede."""
+
+    def __init__(self, workers: int = FILA_WORKERS):
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fila")
+
+    def submeter(self, nome: str, conteudo: bytes, mime: str, client=None) -> Tarefa:
+        """Põe um arquivo na fila. `client` é o do Gemini (sem ele o `extrair` cria um se precisar)."""
+        tarefa = Tarefa(nome, conteudo, mime)
+        tarefa._futuro = self._pool.submit(self._rodar, tarefa, client)
+        metricas.contar("fila_submetidas")
+        return tarefa
+
+    def _rodar(self, tarefa: Tarefa, client):
+        from llm_reparo import RespostaInvalida
+
+        if tarefa._cancelar.is_set():
+            tarefa._terminar("cancelado")
+            return
+        tarefa.inicio = time.time()
+        ocr_workers = None
+        if "xml" not in tarefa.mime:
+            from ocr import OCR_WORKERS
+            # cada arquivo fica com a sua fatia das CPUs, igual ao processar_pasta
+            ocr_workers = max(1, OCR_WORKERS // self.workers)
+
+        rastro_doc = None
+        try:
+            with metricas.rastro(tarefa.nome) as rastro_doc:
+                resultado = extrair(tarefa.conteudo, tarefa.mime, client, ocr_workers=ocr_workers, nome=tarefa.nome,
+                                    progresso=tarefa.avancar)
+            tarefa.resultado = resultado
+            try:
+                DocumentoProcessado.model_validate(resultado["documento"])
+                status, erro = "ok", None
+            except ValidationError as ve:
+                status, erro = "invalido", str(ve)  # XML fora do schema: mostra mesmo assim, com o aviso
+        except Cancelado:
+            status, erro = "cancelado", None
+        except RespostaInvalida as e:
+            tarefa.resposta_bruta = e.conteudo
+            status, erro = "erro", f"O LLM retornou um JSON malformado mesmo depois dos reparos: {e.erro}"
+        except ErroExtracao as e:
+            status, erro = "erro", str(e)
+        except Exception as e:
+            status, erro = "erro", f"{type(e).__name__}: {e}"
+        if rastro_doc is not None:
+            tarefa.rastro = rastro_doc.resumo()
+        tarefa._terminar(status, erro)
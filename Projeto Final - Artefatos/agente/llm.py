@@ -0,0 +1,260 @@
+"""
+Prompt, parser e cache de respostas do Gemini.
+
+O cache fica na frente do `gemini_client.invoke`: a chave é o texto do OCR
+normalizado (sem marcadores de página e espaços extras) + versão do prompt +
+modelo + temperatura. Re-scan ou PDF reexportado com o mesmo texto cai no mesmo
+registro e não gasta chamada nem cota. Guarda o JSON já validado pelo Pydantic,
+com TTL.
+
+Antes de ir pro Gemini o texto do OCR é compactado (sem marcadores de página,
+linhas de lixo do OCR e cabeçalho/rodapé repetidos em toda página) e o schema vai
+num formato enxuto em vez do JSON Schema completo do Pydantic. Os tokens são
+estimados antes do envio e o `usage_metadata` real é registrado depois.
+
+`prompt` e `parser` são montados uma vez por processo, no primeiro acesso: o
+langchain só é importado quando algum fluxo usa o LLM de fato (upload de XML e
+os reruns do Streamlit não pagam esse import).
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+
+from cache import CacheDisco
+from modelos import DocumentoProcessado
+
+GEMINI_MODEL = "gemini-2.5-flash" # o modelo mais simples para não consumir a api mt rápido
+GEMINI_TEMPERATURE = 0.1  # temp baixa pra ele nao inventar dados
+
+# de onde vem a resposta: gemini (API), gravar (API + grava), reproduzir (das gravacoes,
+# sem rede) ou falso (documento sintetico). Os dois ultimos nao precisam de chave (llm_falso.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").strip().lower()
+BACKENDS_LLM = ("gemini", "gravar", "reproduzir", "falso")
+BACKENDS_OFFLINE = ("reproduzir", "falso")
+
+# suba quando mexer no system_prompt/template: invalida as respostas em cache
+PROMPT_VERSAO = "3"  # 3: texto compactado + schema nativo (format_instructions enxutas)
+LLM_CACHE_TTL_HORAS = float(os.getenv("LLM_CACHE_TTL_HORAS", "720"))
+
+# O prompt principal pro Gemini
+system_prompt = (
+    "Você é um Agente de Extração de Dados especializado em documentos, incluindo documentos eletrônicos (DANFE) e cupons/recibos."
+    "Sua função é ler o texto bruto (OCR) de documentos e extrair os dados em formato JSON, "
+    "obedecendo rigorosamente o schema Pydantic fornecido."
+    "Siga estas regras estritas:"
+    "1. **Documentos de Consumidor (Recibos):** Esses documentos muitas vezes listam 'CONSUMIDOR NAO INFORMADO'. Neste caso, preencha os campos `id_fiscal` e `nome_completo` do `receptor` com a string 'CONSUMIDOR NAO INFORMADO'."
+    "2. **Correção Ortográfica Contextual (CRÍTICO):** O texto de entrada é gerado por um OCR e contém erros de grafia comuns. Tente corrigir esses erros de grafia na `descricao` do `ItemDocumento`, usando o contexto do texto e o português correto, antes de incluí-lo no JSON. Caso não consiga inferir qual é a palavra, mantenha o valor original"
+    "3. **Extração de Texto Bruto:** Se um campo estiver faltando ou for ilegível no texto OCR, preencha-o com uma string vazia (''), mas *nunca* invente dados (exceto pela Regra 1)."
+    "4. **Valores Numéricos (CRÍTICO - FORMATO BRASILEIRO):** Converta todos os valores monetários e quantias (que usam ponto como milhar e vírgula como decimal, ex: 1.234,56) para o formato `float` americano (ponto como separador decimal, sem separador de milhar, ex: 1234.56). "
+    "   - **Atenção:** Remova o separador de milhar (ponto ou espaço) e substitua a vírgula (,) pelo ponto (.)." # ISSO DA MTO PROBLEMA!!
+    "5. **Datas:** Converta todas as datas para o formato estrito 'DD-MM-AAAA'." 
+    "6. **Número de Controle:** O número deve ser uma string de 44 dígitos (apenas números). Se for um recibo, o número pode estar em blocos, junte-os."
+    "7. **Tabelas de Itens:** Preste **MÁXIMA ATENÇÃO** à leitura correta das colunas. O campo `valor_total` deve ser o **Valor Total do Item/Produto**, e **NÃO** o Valor Principal ou outro valor."
+    "8. **Saída:** O resultado final deve ser **SOMENTE** o JSON, sem qualquer texto explicativo ou markdown adicional." # importante
+)
+
+def esquema_compacto(modelo) -> dict:
+    """
+    Esqueleto do JSON esperado: campo -> "tipo: descrição", sub-modelos aninhados e
+    listas como [item]. Diz o mesmo que o JSON Schema do Pydantic com bem menos
+    tokens (sem $defs, title, required e o exemplo em inglês do parser).
+    """
+    esqueleto = {}
+    for nome, campo in modelo.model_fields.items():
+        tipo = campo.annotation
+        item = (getattr(tipo, "__args__", None) or [None])[0]
+        if hasattr(tipo, "model_fields"):
+            esqueleto[nome] = esquema_compacto(tipo)
+        elif hasattr(item, "model_fields"):
+            esqueleto[nome] = [esquema_compacto(item)]
+        else:
+            esqueleto[nome] = f"{getattr(tipo, '__name__', tipo)}: {campo.description}"
+    return esqueleto
+
+
+def instrucoes_formato(modelo) -> str:
+    return (
+        "Responda com um objeto JSON com exatamente estes campos (valor = tipo: descrição; "
+        "listas mostram o formato de um item):\n"
+        + json.dumps(esquema_compacto(modelo), ensure_ascii=False, separators=(",", ":"))
+    )
+
+
+format_instructions = instrucoes_formato(DocumentoProcessado)
+
+
+@functools.lru_cache(maxsize=None)
+def _componentes():
+    # import tardio: langchain_core leva ~1s pra carregar
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import PydanticOutputParser
+
+    # Pega as instrucoes do Pydantic
+    parser = PydanticOutputParser(pydantic_object=DocumentoProcessado)
+
+    # Monta o prompt final
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", system_prompt),
+            ("human", "Extraia os dados do documento no seguinte texto OCR. Retorne apenas o JSON. {format_instructions}\n\nTexto OCR:\n{text_to_analyze}"),
+        ]
+    ).partial(format_instructions=format_instructions)
+
+    # o texto entra no fim do prompt: o tamanho e fixos + len(texto), sem precisar formatar
+    fixos = len(prompt.format(text_to_analyze=""))
+    # tamanho do prompt como era antes (schema completo + texto cru), so pra comparar a economia
+    fixos_original = fixos - len(format_instructions) + len(parser.get_format_instructions())
+    return {"parser": parser, "prompt": prompt, "fixos": fixos, "fixos_original": fixos_original}
+
+
+def __getattr__(nome):
+    # `from llm import prompt, parser` continua funcionando, so que montado no 1o uso
+    if nome in ("parser", "prompt"):
+        return _componentes()[nome]
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+
+_MARCADOR_PAGINA = re.compile(r"^-+ INÍCIO PÁGINA \d+ -+$")
+_ESPACOS = re.compile(r"[ \t\f\v]+")
+_PONTUACAO_REPETIDA = re.compile(r"([^\w\s])\1{2,}")  # "......", "____", "----" de tabela
+LINHAS_BORDA_PAGINA = 6  # quantas linhas do topo/fim de cada pagina contam como cabecalho/rodape
+
+
+def normalizar_texto_ocr(texto: str) -> str:
+    """Tira marcadores de página, espaços repetidos e linhas vazias."""
+    linhas = []
+    for linha in texto.splitlines():
+        linha = _ESPACOS.sub(" ", linha).strip()
+        if linha and not _MARCADOR_PAGINA.match(linha):
+            linhas.append(linha)
+    return "\n".join(linhas)
+
+
+def _linha_ruido(linha: str) -> bool:
+    # sobra de borda/carimbo/tabela: nada alfanumerico, ou uma letra solta ("UN", "SP" ficam)
+    return not any(c.isalnum() for c in linha) or (len(linha) == 1 and not linha.isdigit())
+
+
+def _paginas(texto: str) -> list:
+    paginas = [[]]
+    for linha in texto.splitlines():
+        linha = _ESPACOS.sub(" ", linha).strip()
+        if _MARCADOR_PAGINA.match(linha):
+            if paginas[-1]:
+                paginas.append([])
+            continue
+        linha = _PONTUACAO_REPETIDA.sub(r"\1", linha)
+        if linha and not _linha_ruido(linha):
+            paginas[-1].append(linha)
+    return [p for p in paginas if p]
+
+
+def compactar_texto_ocr(texto: str) -> str:
+    """
+    Texto que vai de fato pro LLM: `normalizar_texto_ocr` + remove linhas de ruído,
+    pontuação repetida e cabeçalho/rodapé que se repetem nas bordas de várias
+    páginas (ficam só na primeira). Linhas iguais no meio da página ficam: num
+    cupom podem ser dois itens iguais.
+    """
+    return "\n".join(linhas_compactadas(texto))
+
+
+def linhas_compactadas(texto: str) -> list:
+    """Mesmo que `compactar_texto_ocr`, mas devolve a lista de linhas."""
+    paginas = _paginas(texto)
+
+    # linha que aparece na borda de 2+ paginas = cabecalho/rodape da DANFE (emitente, chave, "folha x/y"...)
+    bordas = {}
+    for pagina in paginas:
+        for linha in set(pagina[:LINHAS_BORDA_PAGINA] + pagina[-LINHAS_BORDA_PAGINA:]):
+            bordas[linha] = bordas.get(linha, 0) + 1
+    repetidas = {linha for linha, n in bordas.items() if n > 1}
+
+    vistas = set()
+    saida = []
+    for pagina in paginas:
+        for pos, linha in enumerate(pagina):
+            na_borda = pos < LINHAS_BORDA_PAGINA or pos >= len(pagina) - LINHAS_BORDA_PAGINA
+            if na_borda and linha in repetidas:
+                if linha in vistas:
+                    continue
+                vistas.add(linha)
+            saida.append(linha)
+    return saida
+
+
+def estimar_tokens(texto: str) -> int:
+    # ~4 caracteres por token no Gemini, bom o bastante pra orcamento e cota
+    return len(texto) // 4 + 1
+
+
+def estimar_tokens_original(text_to_analyze: str) -> int:
+    """Quanto o prompt antigo (schema completo + texto cru) gastaria, pra comparação."""
+    return (_componentes()["fixos_original"] + len(text_to_analyze)) // 4 + 1
+
+
+def medir_prompt(text_to_analyze: str, compactado: str = None) -> dict:
+    """
+    Só as métricas de tamanho do `preparar_prompt`, sem montar o prompt (pra quando
+    vai outro prompt, como o do complemento das regras, ou os blocos).
+    """
+    if compactado is None:
+        compactado = compactar_texto_ocr(text_to_analyze)
+    return {
+        "caracteres_ocr": len(text_to_analyze),
+        "caracteres_enviados": len(compactado),
+        "tokens_estimados": (_componentes()["fixos"] + len(compactado)) // 4 + 1,
+        "tokens_estimados_original": estimar_tokens_original(text_to_analyze),
+        "inicio": time.perf_counter(),
+    }
+
+
+def preparar_prompt(text_to_analyze: str) -> tuple:
+    """
+    Prompt final (com o texto compactado) + métricas de tamanho antes do envio.
+    Depois da chamada, passe as métricas pro `registrar_uso`.
+    """
+    compactado = compactar_texto_ocr(text_to_analyze)
+    final_prompt = _componentes()["prompt"].format(text_to_analyze=compactado)
+    return final_prompt, medir_prompt(text_to_analyze, compactado)
+
+
+def registrar_uso(metricas: dict, respostas) -> dict:
+    """Soma o `usage_metadata` das respostas (chamada + reparos) e a latência às métricas do `preparar_prompt`."""
+    metricas = dict(metricas)
+    metricas["latencia_s"] = round(time.perf_counter() - metricas.pop("inicio"), 3)
+    usos = [getattr(r, "usage_metadata", None) or {} for r in respostas]
+    metricas["tokens_entrada"] = sum(u.get("input_tokens", 0) for u in usos)
+    metricas["tokens_saida"] = sum(u.get("output_tokens", 0) for u in usos)
+    metricas["chamadas"] = len(usos)
+    return metricas
+
+
+def chave_llm(text_to_analyze: str, modelo: str = GEMINI_MODEL, temperatura: float = GEMINI_TEMPERATURE) -> str:
+    # chave pelo texto que vai de fato no prompt
+    digest = hashlib.sha256(compactar_texto_ocr(text_to_analyze).encode("utf-8")).hexdigest()
+    return f"{digest}:{PROMPT_VERSAO}:{modelo}:{temperatura}"
+
+
+def modelo_backend(backend: str = LLM_BACKEND) -> str:
+    """Modelo que vai nas chaves dos caches: resposta falsa/reproduzida nunca se mistura com a do Gemini."""
+    return GEMINI_MODEL if backend in ("gemini", "gravar") else backend
+
+
+def pode_cachear(text_to_analyze: str) -> bool:
+    # texto com pagina que falhou no OCR nao entra: um reprocessamento ok tem que chegar no LLM
+    return "[ERRO_PAGINA" not in text_to_analyze
+
+
+_cache_respostas = None
+
+
+def get_cache_llm():
+    """Cache de respostas (um por processo, criado só quando precisa)."""
+    global _cache_respostas
+    if _cache_respostas is None:
+        _cache_respostas = CacheDisco("respostas_llm", ttl_segundos=LLM_CACHE_TTL_HORAS * 3600)
+    return _cache_respostas
@@ -0,0 +1,277 @@
+"""
+Extração assíncrona e concorrente com o Gemini, pra jobs em lote.
+
+Usa os mesmos componentes do app (prompt -> gemini_client -> parser), só que
+com `ainvoke` e várias requisições em voo ao mesmo tempo:
+- semáforo limita a concorrência;
+- dois token buckets seguram requisições/minuto (RPM) e tokens/minuto (TPM);
+- 429 e 5xx voltam pra fila com backoff exponencial com jitter;
+- saída JSON nativa + reparo parcial (llm_reparo) quando a validação falha;
+- o cache de respostas do llm.py é consultado antes de cada chamada;
+- DANFE que a leitura por regras (regras_danfe) lê inteira não vira requisição, e a
+  lida em parte só pede os campos que faltaram;
+- documento longo vai em blocos (llm_blocos), cada bloco uma requisição na fila.
+
+O que bloqueia (SQLite do cache, regex das regras, montar o prompt) roda em
+`asyncio.to_thread`, pra não parar o event loop e as outras requisições em voo.
+
+Pra testar sem rede, passe um `llm_falso.ChatFalso` no lugar do gemini_client.
+"""
+import asyncio
+import os
+import random
+import time
+
+from llm_blocos import juntar_blocos, montar_chamadas, precisa_blocos, uso_chamada
+from llm import (GEMINI_MODEL, GEMINI_TEMPERATURE, chave_llm, get_cache_llm, pode_cachear,
+                 medir_prompt, preparar_prompt, registrar_uso, estimar_tokens)
+from llm_reparo import Extracao, RespostaInvalida, saida_json
+from metricas import contar, etapa
+from modelos import DocumentoProcessado
+from regras_danfe import campos_para_llm, ler_por_regras
+
+LLM_CONCORRENCIA = int(os.getenv("LLM_CONCORRENCIA", "4"))
+LLM_RPM = float(os.getenv("LLM_RPM", "10"))
+LLM_TPM = float(os.getenv("LLM_TPM", "250000"))
+LLM_TENTATIVAS = max(1, int(os.getenv("LLM_TENTATIVAS", "5")))
+TOKENS_SAIDA_ESTIMADOS = 2000  # reserva pro JSON de resposta antes de saber o real
+BACKOFF_BASE_S = 1.0
+BACKOFF_TETO_S = 60.0
+
+_CODIGOS_RETENTAVEIS = {408, 429, 500, 502, 503, 504}
+_NOMES_RETENTAVEIS = ("ResourceExhausted", "RateLimit", "TooManyRequests", "ServiceUnavailable",
+                      "InternalServerError", "DeadlineExceeded", "ServerError")
+
+
+def eh_retentavel(erro: BaseException) -> bool:
+    """429/5xx/timeout valem nova tentativa; erro de validação ou 4xx não."""
+    atual = erro
+    while atual is not None:
+        if isinstance(atual, (asyncio.TimeoutError, TimeoutError)):
+            return True
+        for attr in ("code", "status_code"):
+            codigo = getattr(atual, attr, None)
+            if isinstance(codigo, int) and codigo in _CODIGOS_RETENTAVEIS:
+                return True
+        if any(nome in type(atual).__name__ for nome in _NOMES_RETENTAVEIS):
+            return True
+        atual = atual.__cause__
+    return False
+
+
+def tempo_backoff(tentativa: int) -> float:
+    # "full jitter": espalha as retentativas pra nao baterem todas juntas na API
+    return random.uniform(0, min(BACKOFF_TETO_S, BACKOFF_BASE_S * 2 ** tentativa))
+
+
+class BaldeTokens:
+    """Token bucket que enche continuamente até `por_minuto`."""
+
+    def __init__(self, por_minuto: float):
+        self.capacidade = float(por_minuto)
+        self.taxa = self.capacidade / 60.0
+        self.disponivel = self.capacidade
+        self.atualizado = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    async def consumir(self, quantidade: float):
+        quantidade = min(quantidade, self.capacidade)  # pedido maior que o balde nunca passaria
+        while True:
+            async with self._lock:
+                self._repor()
+                if self.disponivel >= quantidade:
+                    self.disponivel -= quantidade
+                    return
+                espera = (quantidade - self.disponivel) / self.taxa
+            await asyncio.sleep(espera)
+
+    def ajustar(self, diferenca: float):
+        """Corrige a reserva depois que o uso real chega (pode ficar negativo = dívida)."""
+        self._repor()
+        self.disponivel = min(self.capacidade, self.disponivel - diferenca)
+
+
+class LimitadorTaxa:
+    """RPM + TPM juntos."""
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM):
+        self.requisicoes = BaldeTokens(rpm)
+        self.tokens = BaldeTokens(tpm)
+
+    async def adquirir(self, tokens_estimados: int):
+        await self.requisicoes.consumir(1)
+        await self.tokens.consumir(tokens_estimados)
+
+
+class _FalhaChamada(Exception):
+    """Chamada sem mais retentativas (erro não retentável ou tentativas esgotadas)."""
+
+
+async def _chamar(client, final_prompt, kwargs, semaforo, limitador, estimados, max_tentativas, resultado):
+    for tentativa in range(1, max_tentativas + 1):
+        resultado["tentativas"] += 1
+        async with semaforo:
+            await limitador.adquirir(estimados)
+            try:
+                with etapa("llm_chamada"):
+                    response = await client.ainvoke(final_prompt, **kwargs)
+                break
+            except Exception as e:
+                if not eh_retentavel(e) or tentativa == max_tentativas:
+                    contar("llm_falhas")
+                    raise _FalhaChamada(f"{type(e).__name__}: {e}") from e
+                contar("llm_retentativas")
+        # dorme fora do semaforo pra vaga ir pra outro documento
+        await asyncio.sleep(tempo_backoff(tentativa))
+
+    uso = getattr(response, "usage_metadata", None) or {}
+    if uso:
+        limitador.tokens.ajustar(uso.get("input_tokens", 0) + uso.get("output_tokens", 0) - estimados)
+    return response
+
+
+def _receber(extracao, resposta):
+    extracao.receber(resposta)
+    return extracao.proximo_reparo()
+
+
+async def _rodar(client, extracao, pedido, semaforo, limitador, max_tentativas, resultado):
+    # chamada inicial (ou o complemento das regras) + reparos parciais, todos passando por retentativa e limitador
+    while pedido is not None:
+        estimados = estimar_tokens(pedido[0]) + TOKENS_SAIDA_ESTIMADOS
+        resposta = await _chamar(client, pedido[0], pedido[1], semaforo, limitador, estimados, max_tentativas,
+                                 resultado)
+        # validar a resposta (json + pydantic) e CPU: fora do event loop tambem
+        pedido = await asyncio.to_thread(_receber, extracao, resposta)
+    return extracao
+
+
+async def _todas(corotinas) -> list:
+    """`gather` que cancela as outras quando uma falha (bloco sem conserto já perdeu o documento)."""
+    tarefas = [asyncio.ensure_future(c) for c in corotinas]
+    try:
+        return await asyncio.gather(*tarefas)
+    except BaseException:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        raise
+
+
+def _planejar(texto, modelo, temperatura, usar_cache) -> dict:
+    """
+    Tudo antes da 1a requisição (chave e cache, leitura por regras, prompt ou blocos),
+    na mesma ordem do extrator.interpretar_texto. É SQLite e CPU: roda numa thread.
+    """
+    plano = {"chave": chave_llm(texto, modelo, temperatura), "documento": None, "cache": False, "regras": None,
+             "campos": None, "chamadas": None}
+    if usar_cache:
+        plano["documento"] = get_cache_llm().get(plano["chave"])
+        contar("llm_cache_acertos" if plano["documento"] is not None else "llm_cache_faltas")
+        if plano["documento"] is not None:
+            plano["cache"] = True
+            return plano
+
+    # DANFE lida por regras: completa nao gasta requisicao; parcial so pede o que faltou
+    regras = ler_por_regras(texto)
+    campos = campos_para_llm(regras, texto)
+    if campos == {}:
+        contar("regras_completas")
+        plano.update(documento=regras["documento"], regras=regras)
+        return plano
+
+    if campos:
+        contar("regras_complementos")
+        plano["metricas"] = medir_prompt(texto)
+        extracao = Extracao(DocumentoProcessado, texto)
+        plano.update(extracoes=[extracao], pedidos=[extracao.complementar(regras["documento"], campos)],
+                     campos=list(campos))
+    elif precisa_blocos(texto):
+        # documento longo: cabecalho + blocos de itens, cada um uma requisicao (e reparo) propria
+        chamadas = montar_chamadas(texto)
+        plano["metricas"] = medir_prompt(texto)
+        plano.update(extracoes=[Extracao(modelo_bloco, texto_bloco) for _, modelo_bloco, texto_bloco in chamadas],
+                     pedidos=[(prompt, saida_json(modelo_bloco)) for prompt, modelo_bloco, _ in chamadas],
+                     chamadas=chamadas)
+    else:
+        final_prompt, plano["metricas"] = preparar_prompt(texto)
+        plano.update(extracoes=[Extracao(DocumentoProcessado, texto)],
+                     pedidos=[(final_prompt, saida_json(DocumentoProcessado))])
+    return plano
+
+
+def _concluir(texto, plano, usar_cache) -> dict:
+    """Junta os blocos (se foi em blocos) e grava no cache. Também numa thread."""
+    extracoes = plano["extracoes"]
+    if plano["chamadas"] is None:
+        parsed_data = extracoes[0].documento()
+    else:
+        parsed_data, _ = juntar_blocos(texto, plano["chamadas"], [uso_chamada(e) for e in extracoes],
+                                       plano["metricas"]["inicio"])
+    if usar_cache and pode_cachear(texto):
+        get_cache_llm().set(plano["chave"], parsed_data)
+    return parsed_data
+
+
+async def _extrair_um(indice, texto, client, semaforo, limitador, usar_cache, max_tentativas):
+    resultado = {"indice": indice, "status": "erro", "documento": None, "erro": None,
+                 "tentativas": 0, "reparos": 0, "tokens_estimados": 0, "tokens_entrada": 0, "tokens_saida": 0,
+                 "latencia_s": 0.0, "cache": False, "regras": False, "complemento": None, "blocos": 0}
+
+    modelo = getattr(client, "model", GEMINI_MODEL)
+    temperatura = getattr(client, "temperature", GEMINI_TEMPERATURE)
+    plano = await asyncio.to_thread(_planejar, texto, modelo, temperatura, usar_cache)
+    if plano["documento"] is not None:
+        resultado.update(status="ok", documento=plano["documento"], cache=plano["cache"],
+                         regras=plano["regras"] is not None)
+        return resultado
+
+    extracoes = plano["extracoes"]
+    resultado.update(tokens_estimados=sum(estimar_tokens(pedido[0]) for pedido in plano["pedidos"]),
+                     complemento=plano["campos"], blocos=len(plano["chamadas"] or [None]) - 1)
+    try:
+        await _todas(_rodar(client, extracao, pedido, semaforo, limitador, max_tentativas, resultado)
+                     for extracao, pedido in zip(extracoes, plano["pedidos"]))
+    except _FalhaChamada as e:
+        resultado["erro"] = str(e)
+    except RespostaInvalida as e:
+        resultado["erro"] = f"Resposta inválida do LLM: {e}"
+
+    # latencia conta desde o 1o envio, com retentativas e reparos
+    uso = registrar_uso(plano["metricas"], [r for extracao in extracoes for r in extracao.respostas])
+    resultado.update(tokens_entrada=uso["tokens_entrada"], tokens_saida=uso["tokens_saida"],
+                     latencia_s=uso["latencia_s"], reparos=sum(extracao.reparos for extracao in extracoes))
+    contar("llm_tokens_entrada", uso["tokens_entrada"])
+    contar("llm_tokens_saida", uso["tokens_saida"])
+    if resultado["erro"] is not None:
+        return resultado
+
+    resultado.update(status="ok", documento=await asyncio.to_thread(_concluir, texto, plano, usar_cache))
+    return resultado
+
+
+async def extrair_lote_async(textos, client, concorrencia: int = LLM_CONCORRENCIA, rpm: float = LLM_RPM,
+                             tpm: float = LLM_TPM, max_tentativas: int = LLM_TENTATIVAS,
+                             usar_cache: bool = True) -> list:
+    """
+    Extrai vários textos OCR ao mesmo tempo. Devolve um dict por texto, na mesma ordem
+    (status ok/erro, documento, tentativas, reparos, tokens, se veio do cache, se saiu
+    só das regras e quais campos foram complementados pelo LLM).
+    """
+    max_tentativas = max(1, max_tentativas)  # com 0 nenhuma chamada sairia e nao haveria resposta
+    semaforo = asyncio.Semaphore(concorrencia)
+    limitador = LimitadorTaxa(rpm, tpm)
+    tarefas = [
+        _extrair_um(i, texto, client, semaforo, limitador, usar_cache, max_tentativas)
+        for i, texto in enumerate(textos)
+    ]
+    return await asyncio.gather(*tarefas)
+
+
+def extrair_lote(textos, client, **kwargs) -> list:
+    """Versão síncrona do `extrair_lote_async` (pra script/CLI)."""
+    return asyncio.run(extrair_lote_async(list(textos), client, **kwargs))
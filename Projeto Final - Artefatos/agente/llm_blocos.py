@@ -0,0 +1,166 @@
+"""
+Extração em blocos pra documentos longos (DANFE com centenas de itens).
+
+Num prompt só, o Gemini tem que devolver todos os `ItemDocumento` de uma vez: a
+latência cresce com o tamanho da resposta, a saída chega a ser cortada e itens
+somem. Aqui o documento é dividido:
+- 1 chamada pro cabeçalho, participantes e totais (começo + fim do texto, sem itens);
+- N chamadas em paralelo, uma por bloco de linhas, só com os itens daquele trecho.
+Os blocos se sobrepõem umas linhas pra nenhum item ficar cortado ao meio; o item
+que sai repetido na emenda de dois blocos é removido na junção.
+
+O resultado final é um DocumentoProcessado normal e passa pela mesma checagem de
+soma dos itens x valor total no `enrich_and_validate_extraction` do app.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm import system_prompt, instrucoes_formato, linhas_compactadas, estimar_tokens, estimar_tokens_original
+from llm_reparo import extrair_estruturado
+from metricas import no_contexto
+from modelos import CabecalhoDocumento, ListaItens, DocumentoProcessado
+
+# acima disso (tokens do texto compactado) o documento vai em blocos
+LLM_BLOCOS_LIMIAR_TOKENS = int(os.getenv("LLM_BLOCOS_LIMIAR_TOKENS", "4000"))
+LLM_BLOCO_TOKENS = int(os.getenv("LLM_BLOCO_TOKENS", "1500"))  # tamanho de cada bloco de itens
+LLM_BLOCOS_WORKERS = int(os.getenv("LLM_BLOCOS_WORKERS", "4"))
+SOBREPOSICAO_LINHAS = 3  # linhas repetidas entre blocos vizinhos
+LINHAS_FIM_CABECALHO = 40  # fim do texto vai junto no cabecalho (totais/dados adicionais)
+
+prompt_cabecalho = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        ("human", "Extraia os dados do documento no seguinte texto OCR, MENOS a lista de itens (ela é extraída separadamente). "
+                  "O texto é o começo e o fim de um documento longo. Retorne apenas o JSON. {format_instructions}\n\nTexto OCR:\n{text_to_analyze}"),
+    ]
+).partial(format_instructions=instrucoes_formato(CabecalhoDocumento))
+
+prompt_itens = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        ("human", "O texto OCR abaixo é o trecho {bloco} de {total_blocos} de um documento longo. Extraia SOMENTE os itens "
+                  "(produtos/serviços) que aparecem neste trecho, na ordem, inclusive os do começo e do fim do trecho. "
+                  "Ignore cabeçalho, totais e qualquer outra informação. Se não houver itens, devolva a lista vazia. "
+                  "Retorne apenas o JSON. {format_instructions}\n\nTexto OCR:\n{text_to_analyze}"),
+    ]
+).partial(format_instructions=instrucoes_formato(ListaItens))
+
+
+def precisa_blocos(text_to_analyze: str) -> bool:
+    """Documento grande o bastante pra valer a extração em blocos?"""
+    return estimar_tokens("\n".join(linhas_compactadas(text_to_analyze))) > LLM_BLOCOS_LIMIAR_TOKENS
+
+
+def dividir_blocos(linhas: list, max_caracteres: int, sobreposicao: int = SOBREPOSICAO_LINHAS) -> list:
+    """Quebra as linhas em blocos de até ~max_caracteres, repetindo `sobreposicao` linhas entre vizinhos."""
+    blocos = []
+    inicio = 0
+    while inicio < len(linhas):
+        fim, tamanho = inicio, 0
+        while fim < len(linhas) and (fim == inicio or tamanho + len(linhas[fim]) <= max_caracteres):
+            tamanho += len(linhas[fim]) + 1
+            fim += 1
+        blocos.append(linhas[inicio:fim])
+        if fim >= len(linhas):
+            break
+        inicio = max(inicio + 1, fim - sobreposicao)
+    return blocos
+
+
+def _chave_item(item: dict) -> tuple:
+    return (" ".join(item["descricao"].upper().split()), round(item["quantidade"], 4),
+            round(item["valor_unitario"], 2), round(item["valor_total"], 2))
+
+
+def juntar_itens(listas: list, max_repetidos: int = SOBREPOSICAO_LINHAS) -> list:
+    """
+    Junta os itens dos blocos na ordem. Na emenda de dois blocos, o maior trecho que
+    termina o bloco anterior e começa o seguinte (até `max_repetidos` itens) é o que
+    veio da sobreposição e entra uma vez só. Itens iguais longe da emenda ficam
+    (cupom pode ter dois itens iguais).
+    """
+    itens = []
+    for lista in listas:
+        repetidos = 0
+        for m in range(min(max_repetidos, len(itens), len(lista)), 0, -1):
+            if [_chave_item(i) for i in itens[-m:]] == [_chave_item(i) for i in lista[:m]]:
+                repetidos = m
+                break
+        itens.extend(lista[repetidos:])
+    return itens
+
+
+def _chamar(client, final_prompt, modelo, texto):
+    # reparo so do bloco que falhou, com o texto do proprio bloco
+    return uso_chamada(extrair_estruturado(client, final_prompt, modelo, texto))
+
+
+def uso_chamada(extracao) -> tuple:
+    """(documento, tokens de entrada, tokens de saída, nº de chamadas) de uma `Extracao` terminada."""
+    usos = [getattr(r, "usage_metadata", None) or {} for r in extracao.respostas]
+    return (extracao.documento(), sum(u.get("input_tokens", 0) for u in usos),
+            sum(u.get("output_tokens", 0) for u in usos), len(usos))
+
+
+def montar_chamadas(text_to_analyze: str) -> list:
+    """
+    [(prompt, modelo pydantic, texto do bloco), ...]: a 1a é o cabeçalho, as outras
+    os blocos de itens. É o que o `extrair_em_blocos` (threads) e o `llm_async`
+    (asyncio) mandam pro LLM.
+    """
+    linhas = linhas_compactadas(text_to_analyze)
+    max_caracteres = LLM_BLOCO_TOKENS * 4
+
+    # cabecalho: comeco do texto (emitente, destinatario, calculo do imposto) + fim (totais/rodape)
+    frente = dividir_blocos(linhas, max_caracteres, sobreposicao=0)[0]
+    ja_na_frente = set(frente)
+    fim = [l for l in linhas[-LINHAS_FIM_CABECALHO:] if l not in ja_na_frente]
+    texto_cabecalho = "\n".join(frente + fim)
+    chamadas = [(prompt_cabecalho.format(text_to_analyze=texto_cabecalho), CabecalhoDocumento, texto_cabecalho)]
+
+    blocos = dividir_blocos(linhas, max_caracteres)
+    for n, bloco in enumerate(blocos, start=1):
+        texto = "\n".join(bloco)
+        final_prompt = prompt_itens.format(text_to_analyze=texto, bloco=n, total_blocos=len(blocos))
+        chamadas.append((final_prompt, ListaItens, texto))
+    return chamadas
+
+
+def juntar_blocos(text_to_analyze: str, chamadas: list, respostas: list, inicio: float) -> tuple:
+    """(parsed_data, uso) a partir das `respostas` (`uso_chamada`) de cada chamada do `montar_chamadas`."""
+    cabecalho = respostas[0][0]
+    itens = juntar_itens([r[0]["itens"] for r in respostas[1:]])
+    parsed_data = DocumentoProcessado(**cabecalho, itens=itens).model_dump()
+
+    uso = {
+        "caracteres_ocr": len(text_to_analyze),
+        "caracteres_enviados": sum(len(c[2]) for c in chamadas),
+        "tokens_estimados": sum(estimar_tokens(c[0]) for c in chamadas),
+        "tokens_estimados_original": estimar_tokens_original(text_to_analyze),
+        "latencia_s": round(time.perf_counter() - inicio, 3),
+        "tokens_entrada": sum(r[1] for r in respostas),
+        "tokens_saida": sum(r[2] for r in respostas),
+        "chamadas": sum(r[3] for r in respostas),
+        "blocos": len(chamadas) - 1,
+    }
+    return parsed_data, uso
+
+
+def extrair_em_blocos(text_to_analyze: str, client, workers: int = None) -> tuple:
+    """
+    Extrai o documento em blocos paralelos. Devolve (parsed_data, uso), com `uso` no
+    mesmo formato do `llm.registrar_uso` + nº de blocos. Cada bloco é reparado sozinho
+    se vier inválido; se não tiver conserto, `RespostaInvalida` sobe.
+    """
+    workers = max(1, workers or LLM_BLOCOS_WORKERS)
+    inicio = time.perf_counter()
+    chamadas = montar_chamadas(text_to_analyze)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # no_contexto: os spans das chamadas entram no rastro do documento
+        respostas = list(pool.map(no_contexto(lambda c: _chamar(client, *c)), chamadas))
+
+    return juntar_blocos(text_to_analyze, chamadas, respostas, inicio)
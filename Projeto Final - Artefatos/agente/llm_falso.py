@@ -0,0 +1,276 @@
+"""
+Chat models falsos pra testar o pipeline do LLM sem rede e sem gastar cota.
+
+- ChatFalso: responde um DocumentoProcessado sintético (JSON válido) depois de uma
+  latência configurável e preenche o `usage_metadata` como o Gemini faz.
+- ChatGravado: grava as respostas reais do Gemini (modo "gravar", embrulhando o
+  cliente de verdade) chaveadas pelo hash do prompt, e depois as reproduz sem rede
+  (modo "reproduzir"), com a latência gravada ou uma fixa.
+
+Os dois injetam falhas de propósito: 429, timeout e JSON cortado no meio (cai no
+reparo do llm_reparo). Com `semente` a latência e as falhas de cada prompt saem
+iguais em toda rodada, independente da ordem das threads/tarefas, então dá pra
+comparar vazão e retentativas entre versões. São substitutos diretos do
+`gemini_client`; o app/CLI escolhem pelo LLM_BACKEND (ver `cliente_do_ambiente`).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from cache import CACHE_DIR, CacheDisco
+
+LLM_GRAVACOES = os.getenv("LLM_GRAVACOES", os.path.join(CACHE_DIR, "gravacoes_llm.sqlite3"))
+GRAVACOES_LIMITE_MB = 10_240  # gravacao nao e cache: nao quer despejo LRU
+
+
+class ErroTaxaFalso(Exception):
+    """Imita o 429 (RESOURCE_EXHAUSTED) da API."""
+    code = 429
+
+
+class GravacaoAusente(LookupError):
+    """Prompt sem resposta gravada no modo reproduzir."""
+
+
+def documento_sintetico(n_itens: int = 3) -> dict:
+    itens = [
+        {
+            "descricao": f"PRODUTO SINTETICO {i + 1}",
+            "quantidade": 1.0,
+            "valor_unitario": 10.0,
+            "valor_total": 10.0,
+            "codigo_operacao": "5102",
+            "codigo_tributario": "00",
+            "valor_aprox_taxas": 0.0,
+        }
+        for i in range(n_itens)
+    ]
+    participante = {
+        "id_fiscal": "12345678000199",
+        "nome_completo": "EMPRESA SINTETICA LTDA",
+        "endereco_completo": "RUA TESTE, 1 - CENTRO - SAO PAULO/SP",
+        "inscricao_estadual": "",
+    }
+    return {
+        "numero_controle": "3" * 44,
+        "modelo_documento": "NF-e",
+        "data_emissao": "15-03-2024",
+        "valor_total_nota": 10.0 * n_itens,
+        "tipo_operacao": "VENDA DE MERCADORIA",
+        "remetente": participante,
+        "receptor": dict(participante, nome_completo="CLIENTE SINTETICO"),
+        "totais_valores": {
+            "base_calculo_principal": 0.0,
+            "valor_total_principal": 0.0,
+            "valor_total_adicional": 0.0,
+            "valor_total_contribuicao_a": 0.0,
+            "valor_total_contribuicao_b": 0.0,
+            "valor_outras_despesas": 0.0,
+            "valor_aprox_taxas_total": 0.0,
+        },
+        "itens": itens,
+    }
+
+
+def chave_prompt(messages, kwargs: dict) -> str:
+    """Hash do que vai pra API: mensagens + kwargs da chamada (schema da saída JSON etc.)."""
+    h = hashlib.sha256()
+    for m in messages:
+        h.update(json.dumps([m.type, m.content], ensure_ascii=False).encode("utf-8"))
+    h.update(json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _estimar_uso(messages, conteudo: str) -> dict:
+    entrada = sum(len(str(m.content)) for m in messages) // 4
+    saida = len(conteudo) // 4
+    return {"input_tokens": entrada, "output_tokens": saida, "total_tokens": entrada + saida}
+
+
+class ChatFalso(BaseChatModel):
+    """Substituto offline do ChatGoogleGenerativeAI."""
+
+    model: str = "falso"
+    temperature: float = 0.0
+    resposta: Optional[str] = None  # None = documento_sintetico()
+    latencia_s: Optional[float] = 0.5
+    jitter_s: float = 0.1
+    taxa_429: float = 0.0  # fração das chamadas que devolvem 429
+    taxa_timeout: float = 0.0  # fração que estoura o prazo (TimeoutError, retentável)
+    taxa_json_invalido: float = 0.0  # fração que volta com o JSON cortado no meio
+    prazo_s: Optional[float] = None  # quanto o timeout demora pra estourar (None = a latência normal)
+    semente: Optional[int] = None  # None = aleatório de verdade
+
+    _chamadas: dict = PrivateAttr(default_factory=dict)  # chave do prompt -> nº de chamadas
+    _trava: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "chat-falso"
+
+    def _sorteio(self, chave: str):
+        # com semente: um gerador por (prompt, n-esima chamada dele), entao a retentativa
+        # sorteia de novo mas a rodada inteira se repete igual
+        if self.semente is None:
+            return random
+        with self._trava:
+            n = self._chamadas.get(chave, 0)
+            self._chamadas[chave] = n + 1
+        return random.Random(f"{self.semente}:{chave}:{n}")
+
+    def _falha(self, sorteio) -> Optional[str]:
+        sorteado = sorteio.random()
+        for tipo, taxa in (("429", self.taxa_429), ("timeout", self.taxa_timeout),
+                           ("json", self.taxa_json_invalido)):
+            if sorteado < taxa:
+                return tipo
+            sorteado -= taxa
+        return None
+
+    def _resposta(self, messages, chave: str) -> dict:
+        """{"conteudo", "uso" (ou None = estimar), "latencia_s" (ou None)} pro prompt."""
+        return {"conteudo": self.resposta or json.dumps(documento_sintetico(), ensure_ascii=False),
+                "uso": None, "latencia_s": None}
+
+    def _espera(self, sorteio, latencia_gravada: Optional[float]) -> float:
+        base = self.latencia_s if self.latencia_s is not None else (latencia_gravada or 0.0)
+        return max(0.0, base + sorteio.uniform(-self.jitter_s, self.jitter_s))
+
+    def _preparar(self, messages, kwargs: dict):
+        """(segundos de espera, ChatResult ou exceção a levantar depois da espera)."""
+        chave = chave_prompt(messages, kwargs)
+        sorteio = self._sorteio(chave)
+        falha = self._falha(sorteio)
+        try:
+            resposta = self._resposta(messages, chave)
+        except GravacaoAusente as e:
+            return 0.0, e
+        espera = self._espera(sorteio, resposta["latencia_s"])
+
+        if falha == "429":
+            return espera, ErroTaxaFalso("429 RESOURCE_EXHAUSTED (falso)")
+        if falha == "timeout":
+            return (espera if self.prazo_s is None else self.prazo_s), TimeoutError("Prazo da chamada estourado (falso)")
+        conteudo = resposta["conteudo"]
+        if falha == "json":
+            conteudo = conteudo[:int(len(conteudo) * sorteio.uniform(0.3, 0.9))]
+        mensagem = AIMessage(content=conteudo, usage_metadata=resposta["uso"] or _estimar_uso(messages, conteudo))
+        return espera, ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        espera, resultado = self._preparar(messages, kwargs)
+        time.sleep(espera)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        espera, resultado = self._preparar(messages, kwargs)
+        await asyncio.sleep(espera)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+
+class ChatGravado(ChatFalso):
+    """
+    Grava (modo "gravar": repassa pro `cliente` real e guarda a resposta) ou reproduz
+    (modo "reproduzir": responde do arquivo de gravações, sem rede) respostas do Gemini.
+    Prompt sem gravação no reproduzir levanta `GravacaoAusente`, ou responde o
+    documento sintético com faltando="sintetico".
+    """
+
+    model: str = "gravado"
+    modo: str = "reproduzir"
+    cliente: Optional[Any] = None  # o ChatGoogleGenerativeAI de verdade (so no gravar)
+    caminho: str = LLM_GRAVACOES
+    faltando: str = "erro"
+    latencia_s: Optional[float] = None  # None = a latência que a chamada real teve
+    jitter_s: float = 0.0
+
+    _gravacoes: Any = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "chat-gravado"
+
+    def gravacoes(self) -> CacheDisco:
+        if self._gravacoes is None:
+            self._gravacoes = CacheDisco("gravacoes_llm", caminho=self.caminho, limite_mb=GRAVACOES_LIMITE_MB)
+        return self._gravacoes
+
+    def _resposta(self, messages, chave: str) -> dict:
+        gravada = self.gravacoes().get(chave)
+        if gravada is not None:
+            return gravada
+        if self.faltando == "sintetico":
+            return ChatFalso._resposta(self, messages, chave)
+        raise GravacaoAusente(f"Sem resposta gravada pra este prompt ({chave[:12]}) em {self.caminho}. "
+                              "Grave antes com LLM_BACKEND=gravar.")
+
+    def _guardar(self, messages, kwargs: dict, resposta, latencia_s: float):
+        conteudo = resposta.content
+        if isinstance(conteudo, list):  # blocos de conteudo (langchain 1.x)
+            conteudo = "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in conteudo)
+        uso = getattr(resposta, "usage_metadata", None) or None
+        self.gravacoes().set(chave_prompt(messages, kwargs), {
+            "conteudo": conteudo, "uso": dict(uso) if uso else None, "latencia_s": round(latencia_s, 3),
+            "modelo": getattr(self.cliente, "model", None), "gravado_em": round(time.time(), 3)})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.modo != "gravar":
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        inicio = time.perf_counter()
+        resposta = self.cliente.invoke(messages, stop=stop, **kwargs)
+        self._guardar(messages, kwargs, resposta, time.perf_counter() - inicio)
+        return ChatResult(generations=[ChatGeneration(message=resposta)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.modo != "gravar":
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        inicio = time.perf_counter()
+        resposta = await self.cliente.ainvoke(messages, stop=stop, **kwargs)
+        self._guardar(messages, kwargs, resposta, time.perf_counter() - inicio)
+        return ChatResult(generations=[ChatGeneration(message=resposta)])
+
+
+def _float_env(nome: str, padrao: Optional[float]) -> Optional[float]:
+    valor = os.getenv(nome, "").strip()
+    return float(valor) if valor else padrao
+
+
+def cliente_do_ambiente(backend: str, cliente=None):
+    """
+    Modelo falso do LLM_BACKEND ("falso", "gravar" ou "reproduzir"), com latência,
+    falhas e semente das variáveis LLM_FALSO_*. No "gravar", `cliente` é o Gemini real.
+    """
+    semente = os.getenv("LLM_FALSO_SEMENTE", "").strip()
+    falhas = {
+        "taxa_429": _float_env("LLM_FALSO_TAXA_429", 0.0),
+        "taxa_timeout": _float_env("LLM_FALSO_TAXA_TIMEOUT", 0.0),
+        "taxa_json_invalido": _float_env("LLM_FALSO_TAXA_JSON", 0.0),
+        "prazo_s": _float_env("LLM_FALSO_PRAZO_S", None),
+        "semente": int(semente) if semente else None,
+    }
+    if backend == "falso":
+        return ChatFalso(latencia_s=_float_env("LLM_FALSO_LATENCIA_S", 0.5),
+                         jitter_s=_float_env("LLM_FALSO_JITTER_S", 0.1), **falhas)
+    if backend == "gravar":
+        # mesmo nome de modelo do cliente real: as respostas sao reais, podem ir pros caches do app
+        return ChatGravado(modo="gravar", cliente=cliente, model=cliente.model,
+                           temperature=getattr(cliente, "temperature", 0.0))
+    if backend == "reproduzir":
+        return ChatGravado(modo="reproduzir", model=backend, faltando=os.getenv("LLM_REPRODUZIR_FALTANDO", "erro"),
+                           latencia_s=_float_env("LLM_FALSO_LATENCIA_S", None),
+                           jitter_s=_float_env("LLM_FALSO_JITTER_S", 0.0), **falhas)
+    raise ValueError(f"LLM_BACKEND sem modelo falso: {backend}")
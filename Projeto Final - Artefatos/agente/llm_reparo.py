@@ -0,0 +1,249 @@
+"""
+Saída estruturada nativa do Gemini + reparo só do que veio inválido.
+
+A chamada pede `response_mime_type=application/json` com o JSON Schema do modelo
+Pydantic (o Gemini gera já no formato). Se mesmo assim a validação falhar (valor
+fora do tipo, campo faltando, resposta cortada por limite de tokens), a parte
+válida é mantida e só os campos / itens com erro voltam pro modelo, num prompt
+pequeno, com no máximo LLM_REPAROS rodadas. Antes, qualquer erro obrigava a
+refazer OCR + chamada inteira.
+
+O mesmo pedido parcial serve pra completar um documento que já veio quase todo
+de outro lugar (leitura por regras da DANFE, regras_danfe.py): `complementar`
+pede só os campos que faltaram, no lugar da chamada inicial.
+"""
+import os
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import BaseModel, Field, ValidationError, create_model
+
+from llm import system_prompt, instrucoes_formato, compactar_texto_ocr
+from metricas import contar, etapa
+from modelos import ItemDocumento
+
+LLM_REPAROS = int(os.getenv("LLM_REPAROS", "2"))
+CAMPO_ITENS = "itens"
+
+
+class RespostaInvalida(ValueError):
+    """O LLM não chegou num JSON válido nem depois dos reparos."""
+
+    def __init__(self, erro, conteudo: str):
+        super().__init__(str(erro))
+        self.erro = erro
+        self.conteudo = conteudo  # ultima resposta bruta, pra debug na tela
+
+
+class ItemCorrigido(BaseModel):
+    indice: int = Field(description="Posição do item na lista (o mesmo índice informado no pedido).")
+    item: ItemDocumento
+
+
+def saida_json(modelo) -> dict:
+    """kwargs do `invoke` que ligam a saída estruturada nativa do Gemini."""
+    return {"response_mime_type": "application/json", "response_json_schema": modelo.model_json_schema()}
+
+
+def conteudo_resposta(response) -> str:
+    conteudo = response.content
+    if isinstance(conteudo, list):  # blocos de conteudo (langchain 1.x)
+        conteudo = "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in conteudo)
+    return conteudo
+
+
+def _foi_cortada(response) -> bool:
+    motivo = (getattr(response, "response_metadata", None) or {}).get("finish_reason", "")
+    return "MAX_TOKENS" in str(motivo).upper()
+
+
+def _ler_json(conteudo: str) -> dict:
+    # parse_json_markdown tira ```json``` e fecha JSON cortado no meio
+    try:
+        dados = parse_json_markdown(conteudo)
+    except Exception:
+        return {}
+    return dados if isinstance(dados, dict) else {}
+
+
+def _erros(modelo, dados: dict):
+    """Valida; devolve (objeto, {}, {}) ou (None, {campo: [msgs]}, {indice_item: [msgs]})."""
+    try:
+        return modelo.model_validate(dados), {}, {}
+    except ValidationError as e:
+        campos, itens = {}, {}
+        for erro in e.errors():
+            loc = erro["loc"]
+            msg = f"{'.'.join(str(p) for p in loc)}: {erro['msg']}"
+            if len(loc) >= 2 and loc[0] == CAMPO_ITENS and isinstance(loc[1], int):
+                itens.setdefault(loc[1], []).append(msg)
+            else:
+                campos.setdefault(loc[0], []).append(msg)
+        return None, campos, itens
+
+
+def _modelo_reparo(modelo, campos: dict, itens: dict, continuar: bool):
+    definicoes = {nome: (modelo.model_fields[nome].annotation, Field(description=modelo.model_fields[nome].description))
+                  for nome in campos}
+    if itens:
+        definicoes["itens_corrigidos"] = (list[ItemCorrigido], Field(description="Itens corrigidos, um por índice pedido."))
+    if continuar:
+        definicoes["itens_restantes"] = (list[ItemDocumento], Field(
+            description="Itens que vêm DEPOIS do último item já extraído, até o fim do documento."))
+    return create_model("Reparo", **definicoes)
+
+
+prompt_reparo = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        ("human", "Uma extração anterior deste documento saiu com problemas. Corrija SOMENTE o que está listado abaixo, "
+                  "usando o texto OCR; o resto já está certo e não deve ser repetido.\n\n{problemas}\n\n"
+                  "Retorne apenas o JSON. {format_instructions}\n\nTexto OCR:\n{text_to_analyze}"),
+    ]
+)
+
+
+def _descrever_problemas(dados: dict, campos: dict, itens: dict, continuar: bool) -> str:
+    linhas = []
+    for nome, msgs in campos.items():
+        linhas.append(f"- Campo `{nome}` inválido ou faltando ({'; '.join(msgs)}). Valor recebido: {dados.get(nome)!r}")
+    lista = dados.get(CAMPO_ITENS) or []
+    for i, msgs in sorted(itens.items()):
+        atual = lista[i] if i < len(lista) else None
+        linhas.append(f"- Item de índice {i} inválido ({'; '.join(msgs)}). Valor recebido: {atual!r}")
+    if continuar:
+        ultimo = lista[-1] if lista else None
+        linhas.append(f"- A resposta foi cortada: faltam os itens depois do último extraído ({ultimo!r}).")
+    return "\n".join(linhas)
+
+
+def _aplicar(dados: dict, reparo: dict, itens_pedidos) -> dict:
+    dados = dict(dados)
+    for nome, valor in reparo.items():
+        if nome not in ("itens_corrigidos", "itens_restantes"):
+            dados[nome] = valor
+    lista = list(dados.get(CAMPO_ITENS) or [])
+    for corrigido in reparo.get("itens_corrigidos", []):
+        if corrigido["indice"] in itens_pedidos and corrigido["indice"] < len(lista):
+            lista[corrigido["indice"]] = corrigido["item"]
+    lista.extend(reparo.get("itens_restantes", []))
+    if CAMPO_ITENS in dados or lista:
+        dados[CAMPO_ITENS] = lista
+    return dados
+
+
+class Extracao:
+    """
+    Estado de uma extração com reparo. Sem I/O: quem chama faz o invoke/ainvoke
+    (serve pro fluxo síncrono do app e pro assíncrono do lote).
+    """
+
+    def __init__(self, modelo, text_to_analyze: str, max_reparos: int = LLM_REPAROS):
+        self.modelo = modelo
+        self.text_to_analyze = text_to_analyze
+        self.max_reparos = max_reparos
+        self.reparos = 0
+        self.respostas = []
+        self.dados = {}
+        self.resultado = None
+        self._pendente = None
+
+    def receber(self, response):
+        """Processa uma resposta (a inicial ou de um reparo)."""
+        self.respostas.append(response)
+        conteudo = conteudo_resposta(response)
+        continuar = _foi_cortada(response) and CAMPO_ITENS in self.modelo.model_fields
+        if self._pendente is None:
+            self.dados = _ler_json(conteudo)
+        else:
+            # so o que foi pedido: o resto ja estava valido (ou conferido pelas regras)
+            pedidos = set(self._pendente[0]) | {"itens_corrigidos", "itens_restantes"}
+            reparo = {nome: valor for nome, valor in _ler_json(conteudo).items() if nome in pedidos}
+            self.dados = _aplicar(self.dados, reparo, self._pendente[1])
+
+        with etapa("validacao"):
+            self.resultado, campos, itens = _erros(self.modelo, self.dados)
+        if self.resultado is None:
+            contar("validacao_falhas")
+        if self.resultado is not None and not continuar:
+            self._pendente = None
+            return
+        self._pendente = (campos, itens, continuar)
+
+    def proximo_reparo(self):
+        """(prompt, kwargs do invoke) do próximo reparo, ou None se acabou (ok ou sem tentativas)."""
+        if self._pendente is None:
+            return None
+        if self.reparos >= self.max_reparos:
+            if self.resultado is not None:
+                return None  # valido, so nao deu pra buscar o resto da lista cortada
+            try:
+                self.modelo.model_validate(self.dados)
+            except ValidationError as e:
+                contar("llm_respostas_invalidas")
+                raise RespostaInvalida(e, conteudo_resposta(self.respostas[-1])) from e
+        self.reparos += 1
+        contar("llm_reparos")
+        return self._pedido(*self._pendente)
+
+    def complementar(self, dados: dict, campos: dict):
+        """
+        Começa de um documento já lido em parte: em vez da chamada inicial, pede só
+        `campos` ({campo: [motivos]}). Devolve (prompt, kwargs do invoke); a resposta
+        vai pro `receber` como qualquer outra. Não conta como reparo.
+        """
+        self.dados = dict(dados)
+        return self._pedido(campos, {}, False)
+
+    def _pedido(self, campos: dict, itens: dict, continuar: bool):
+        modelo_reparo = _modelo_reparo(self.modelo, campos, itens, continuar)
+        final_prompt = prompt_reparo.format(
+            problemas=_descrever_problemas(self.dados, campos, itens, continuar),
+            format_instructions=instrucoes_formato(modelo_reparo),
+            text_to_analyze=compactar_texto_ocr(self.text_to_analyze),
+        )
+        self._pendente = (campos, set(itens), continuar)
+        return final_prompt, saida_json(modelo_reparo)
+
+    def documento(self) -> dict:
+        return self.resultado.model_dump()
+
+
+def extrair_estruturado(client, final_prompt: str, modelo, text_to_analyze: str,
+                        max_reparos: int = LLM_REPAROS) -> Extracao:
+    """
+    Chama o LLM com saída JSON nativa e repara só as partes inválidas.
+    Devolve a `Extracao` (documento(), respostas, reparos). Levanta `RespostaInvalida`
+    se não validar depois de `max_reparos` rodadas.
+    """
+    extracao = Extracao(modelo, text_to_analyze, max_reparos)
+    return _rodar(client, extracao, (final_prompt, saida_json(modelo)))
+
+
+def complementar_estruturado(client, modelo, text_to_analyze: str, dados: dict, campos: dict,
+                             max_reparos: int = LLM_REPAROS) -> Extracao:
+    """
+    Como o `extrair_estruturado`, mas partindo de `dados` já lidos: o LLM só devolve
+    os `campos` ({campo: [motivos]}) e o que vier inválido passa pelos reparos.
+    """
+    extracao = Extracao(modelo, text_to_analyze, max_reparos)
+    return _rodar(client, extracao, extracao.complementar(dados, campos))
+
+
+def _rodar(client, extracao: Extracao, pedido) -> Extracao:
+    while pedido is not None:
+        with etapa("llm_chamada"):
+            resposta = client.invoke(pedido[0], **pedido[1])
+        extracao.receber(resposta)
+        pedido = extracao.proximo_reparo()
+    return extracao
+
+
+async def aextrair_estruturado(client, final_prompt: str, modelo, text_to_analyze: str,
+                               max_reparos: int = LLM_REPAROS) -> Extracao:
+    """Versão assíncrona do `extrair_estruturado`."""
+    extracao = Extracao(modelo, text_to_analyze, max_reparos)
+    extracao.receber(await client.ainvoke(final_prompt, **saida_json(modelo)))
+    while (reparo := extracao.proximo_reparo()) is not None:
+        extracao.receber(await client.ainvoke(reparo[0], **reparo[1]))
+    return extracao
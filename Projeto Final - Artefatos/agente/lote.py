@@ -0,0 +1,212 @@
+"""
+Ingestão em lote de XMLs de NF-e (ZIP exportado da SEFAZ ou pasta) com pool de processos.
+
+Nada é extraído pro disco: o processo principal só lista os nomes dos XMLs e manda
+pacotes de nomes pros workers, que abrem o ZIP/pasta por conta própria, rodam o
+`extrair_nfe` + validação do DocumentoProcessado e devolvem o resultado. Como só
+existe um número fixo de pacotes "em voo" por vez, a memória não cresce com o
+tamanho do arquivo.
+
+Uso (da pasta agente):
+    python lote.py exportacao_sefaz.zip -o resultado.jsonl
+    python lote.py pasta_com_xmls/ -o resultado.jsonl --workers 8
+    python lote.py exportacao_sefaz.zip --repositorio   # grava também no repositorio.py
+    python lote.py exportacao_sefaz.zip -o notas --formato parquet   # notas.documentos/itens.parquet (exportacao.py)
+"""
+import argparse
+import json
+import multiprocessing.util
+import os
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree.ElementTree import ParseError
+
+from nfe_xml import extrair_nfe
+
+TAMANHO_PACOTE = 64  # XMLs por tarefa; pacote grande dilui o custo de IPC
+PACOTES_POR_WORKER = 2  # quantos pacotes ficam na fila de cada worker
+
+
+def listar_xmls(origem: str):
+    """Gera o nome (relativo) de cada XML dentro de um ZIP ou de uma pasta, sem ler o conteúdo."""
+    if os.path.isdir(origem):
+        for raiz, _, arquivos in os.walk(origem):
+            for nome in sorted(arquivos):
+                if nome.lower().endswith(".xml"):
+                    yield os.path.relpath(os.path.join(raiz, nome), origem)
+    elif zipfile.is_zipfile(origem):
+        with zipfile.ZipFile(origem) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".xml"):
+                    yield info.filename
+    else:
+        raise ValueError(f"Origem inválida (esperado ZIP ou pasta): {origem}")
+
+
+# cada processo do pool mantem o proprio ZipFile aberto (reabrir por pacote relê o diretorio
+# central inteiro) e fecha no fim: `_fechar_zips`. A chave leva o pid porque, com fork, o
+# filho herdaria o handle do pai e os dois disputariam o mesmo offset.
+_zips_abertos = {}
+
+
+def _ler_membro(origem: str, nome: str) -> bytes:
+    if os.path.isdir(origem):
+        with open(os.path.join(origem, nome), "rb") as f:
+            return f.read()
+    chave = (os.getpid(), origem)
+    zf = _zips_abertos.get(chave)
+    if zf is None:
+        zf = _zips_abertos[chave] = zipfile.ZipFile(origem)
+    return zf.read(nome)
+
+
+def _fechar_zips():
+    """Fecha os ZipFile que este processo abriu no `_ler_membro`."""
+    for chave in [c for c in _zips_abertos if c[0] == os.getpid()]:
+        _zips_abertos.pop(chave).close()
+
+
+def _iniciar_worker():
+    # o ProcessPoolExecutor nao tem gancho de saida e o atexit nao roda no worker com fork;
+    # o Finalize do multiprocessing roda quando o worker termina (fork ou spawn)
+    multiprocessing.util.Finalize(None, _fechar_zips, exitpriority=0)
+
+
+def processar_xml(nome: str, xml_content: bytes) -> dict:
+    """Extrai e valida um XML. Nunca levanta: o erro vai no próprio registro."""
+    # import aqui pra nao carregar o pydantic no processo principal a toa
+    from pydantic import ValidationError
+    from modelos import DocumentoProcessado
+
+    try:
+        parsed_data = extrair_nfe(xml_content)
+    except ParseError as e:
+        return {"arquivo": nome, "status": "erro", "erro": f"XML malformado: {e}", "documento": None}
+
+    try:
+        DocumentoProcessado(**parsed_data)
+    except ValidationError as ve:
+        # igual a tela: o dado vai junto pra debug, mas marcado como invalido
+        return {"arquivo": nome, "status": "invalido", "erro": str(ve), "documento": parsed_data}
+
+    return {"arquivo": nome, "status": "ok", "erro": None, "documento": parsed_data}
+
+
+def _processar_pacote(origem: str, nomes: list) -> list:
+    resultados = []
+    for nome in nomes:
+        try:
+            conteudo = _ler_membro(origem, nome)
+        except (OSError, KeyError, zipfile.BadZipFile, zlib.error) as e:
+            resultados.append({"arquivo": nome, "status": "erro", "erro": f"Falha ao ler: {e}", "documento": None})
+            continue
+        resultados.append(processar_xml(nome, conteudo))
+    return resultados
+
+
+def _pacotes(nomes, tamanho):
+    pacote = []
+    for nome in nomes:
+        pacote.append(nome)
+        if len(pacote) == tamanho:
+            yield pacote
+            pacote = []
+    if pacote:
+        yield pacote
+
+
+def processar_lote(origem: str, workers: int = None, tamanho_pacote: int = TAMANHO_PACOTE):
+    """
+    Processa todos os XMLs da origem e gera um resultado por arquivo, na ordem da listagem.
+    Com workers=1 roda tudo no processo atual (bom pra debug e pra comparar).
+    """
+    workers = workers or os.cpu_count() or 1
+    pacotes = _pacotes(listar_xmls(origem), tamanho_pacote)
+
+    if workers == 1:
+        try:
+            for pacote in pacotes:
+                yield from _processar_pacote(origem, pacote)
+        finally:
+            _fechar_zips()
+        return
+
+    max_pendentes = workers * PACOTES_POR_WORKER
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker) as pool:
+        pendentes = deque()
+        for pacote in pacotes:
+            pendentes.append(pool.submit(_processar_pacote, origem, pacote))
+            # janela limitada: espera o mais antigo antes de mandar mais
+            if len(pendentes) >= max_pendentes:
+                yield from pendentes.popleft().result()
+        while pendentes:
+            yield from pendentes.popleft().result()
+
+
+def gravar_jsonl(resultados, destino: str) -> dict:
+    """Grava um registro por linha conforme chegam e devolve a contagem por status."""
+    contagem = {"ok": 0, "invalido": 0, "erro": 0}
+    with open(destino, "w", encoding="utf-8") as f:
+        for resultado in resultados:
+            contagem[resultado["status"]] += 1
+            f.write(json.dumps(resultado, ensure_ascii=False))
+            f.write("\n")
+    return contagem
+
+
+def gravar(resultados, saida: str, formato: str = "jsonl") -> tuple:
+    """JSONL em `saida` ou, nos formatos do exportacao.py, as duas tabelas com `saida` sem extensão de prefixo."""
+    if formato == "jsonl":
+        return gravar_jsonl(resultados, saida), saida
+    from exportacao import caminhos_tabelas, gravar_tabelas
+
+    base = os.path.splitext(saida)[0]
+    return gravar_tabelas(resultados, base, formato), " + ".join(caminhos_tabelas(base, formato).values())
+
+
+def salvar_no_repositorio(resultados, repo, tamanho: int = 500):
+    """Repassa os resultados, gravando os ok no repositório (repositorio.py) em transações de `tamanho` documentos."""
+    pendentes = []
+
+    def descarregar():
+        repo.salvar_lote([(r["documento"], "XML", None, r["arquivo"], None) for r in pendentes if r["status"] == "ok"])
+        yield from pendentes
+        pendentes.clear()
+
+    for resultado in resultados:
+        pendentes.append(resultado)
+        if len(pendentes) >= tamanho:
+            yield from descarregar()
+    yield from descarregar()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("origem", help="Arquivo .zip ou pasta com os XMLs")
+    ap.add_argument("-o", "--saida", default="resultado_lote.jsonl",
+                    help="Arquivo JSONL de saída (nos outros formatos, prefixo das tabelas)")
+    ap.add_argument("--formato", choices=("jsonl", "parquet", "arrow", "csv"), default="jsonl",
+                    help="parquet/arrow/csv: tabelas de documentos e itens, ver exportacao.py")
+    ap.add_argument("--workers", type=int, default=None, help="Processos (padrão: nº de CPUs)")
+    ap.add_argument("--pacote", type=int, default=TAMANHO_PACOTE, help="XMLs por tarefa")
+    ap.add_argument("--repositorio", action="store_true", help="Grava também no repositório de documentos")
+    args = ap.parse_args()
+
+    inicio = time.perf_counter()
+    resultados = processar_lote(args.origem, args.workers, args.pacote)
+    if args.repositorio:
+        from repositorio import Repositorio
+        resultados = salvar_no_repositorio(resultados, Repositorio())
+    contagem, destino = gravar(resultados, args.saida, args.formato)
+    duracao = time.perf_counter() - inicio
+
+    total = sum(contagem.values())
+    print(f"{total} XMLs em {duracao:.1f}s ({total / duracao if duracao else 0:.0f} docs/s) -> {destino}")
+    print(f"ok: {contagem['ok']} | inválidos: {contagem['invalido']} | erros: {contagem['erro']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Métricas do pipeline: tempo de cada etapa e contadores, pra saber pra onde foi o
+tempo de um upload lento (rasterização, Tesseract, Gemini, validação, painel...).
+
+- `etapa("nome")`: context manager que mede a etapa (span);
+- `medido("nome")`: o mesmo como decorator;
+- `contar("nome", n)`: contador (acertos de cache, páginas de OCR, tokens, reparos...);
+- `rastro("arquivo")`: junta spans e contadores de UM documento (inclusive os das
+  threads do OCR / blocos do LLM, se a tarefa for submetida com `no_contexto`).
+
+Tudo vai pra um registro do processo (somas, máximos e histograma por etapa),
+exposto no formato texto do Prometheus (`texto_prometheus`, servidor HTTP opcional
+em METRICAS_PORTA) e, se METRICAS_ARQUIVO estiver definido, cada rastro é anexado
+nele como uma linha JSON.
+
+METRICAS=0 desliga: `etapa` devolve um context manager vazio compartilhado,
+`contar` retorna na 1a linha e `medido` nem embrulha a função.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICAS = os.getenv("METRICAS", "1") != "0"
+METRICAS_ARQUIVO = os.getenv("METRICAS_ARQUIVO", "")  # JSONL, um registro por documento
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", "0"))  # 0 = sem endpoint /metrics
+PREFIXO = "extrator"
+LIMITES_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # buckets do histograma
+
+_NADA = nullcontext()
+_trava = threading.Lock()
+_etapas = {}  # nome -> [quantidade, soma_s, max_s, contagem por bucket]
+_contadores = {}
+_rastro_atual = contextvars.ContextVar("rastro_metricas", default=None)
+
+
+class Rastro:
+    """Spans e contadores de um documento (ms somados por etapa)."""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.inicio = time.time()
+        self.etapas = {}
+        self.contadores = {}
+        self.total_ms = 0.0
+        self._trava = threading.Lock()
+
+    def _etapa(self, nome: str, segundos: float):
+        with self._trava:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos * 1000
+
+    def _contar(self, nome: str, valor: float):
+        with self._trava:
+            self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def resumo(self) -> dict:
+        return {"arquivo": self.nome, "inicio": round(self.inicio, 3), "total_ms": round(self.total_ms, 1),
+                "etapas": {k: round(v, 1) for k, v in self.etapas.items()}, "contadores": dict(self.contadores)}
+
+
+def _observar(nome: str, segundos: float):
+    with _trava:
+        dados = _etapas.get(nome)
+        if dados is None:
+            dados = _etapas[nome] = [0, 0.0, 0.0, [0] * len(LIMITES_S)]
+        dados[0] += 1
+        dados[1] += segundos
+        dados[2] = max(dados[2], segundos)
+        for i, limite in enumerate(LIMITES_S):
+            if segundos <= limite:
+                dados[3][i] += 1
+                break
+    rastro_atual = _rastro_atual.get()
+    if rastro_atual is not None:
+        rastro_atual._etapa(nome, segundos)
+
+
+class _Span:
+    __slots__ = ("nome", "inicio")
+
+    def __init__(self, nome: str):
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        _observar(self.nome, time.perf_counter() - self.inicio)
+        return False
+
+
+def etapa(nome: str):
+    """`with etapa("tesseract"): ...` mede o bloco (mesmo se ele levantar exceção)."""
+    if not METRICAS:
+        return _NADA
+    return _Span(nome)
+
+
+def medido(nome: str):
+    """Decorator: mede cada chamada da função como a etapa `nome`."""
+    def decorar(funcao):
+        if not METRICAS:
+            return funcao
+
+        def medida(*args, **kwargs):
+            with _Span(nome):
+                return funcao(*args, **kwargs)
+        medida.__name__, medida.__doc__, medida.__wrapped__ = funcao.__name__, funcao.__doc__, funcao
+        return medida
+    return decorar
+
+
+def contar(nome: str, valor: float = 1):
+    if not METRICAS or not valor:
+        return
+    with _trava:
+        _contadores[nome] = _contadores.get(nome, 0) + valor
+    rastro_atual = _rastro_atual.get()
+    if rastro_atual is not None:
+        rastro_atual._contar(nome, valor)
+
+
+def no_contexto(funcao):
+    """Embrulha uma tarefa de pool de threads pra ela contar no rastro de quem submeteu."""
+    if not METRICAS:
+        return funcao
+    contexto = contextvars.copy_context()
+
+    def rodar(*args, **kwargs):
+        # cada tarefa roda numa copia (o mesmo Context nao pode estar ativo em 2 threads);
+        # o Rastro dentro dele e o mesmo objeto, entao tudo soma no documento certo
+        return contexto.copy().run(funcao, *args, **kwargs)
+    return rodar
+
+
+@contextmanager
+def rastro(nome: str):
+    """
+    Tudo que for medido/contado dentro do bloco (nesta thread ou em tarefas `no_contexto`)
+    entra no Rastro devolvido. Na saída ele vai pro METRICAS_ARQUIVO, se configurado.
+    """
+    if not METRICAS:
+        yield None
+        return
+    atual = Rastro(nome)
+    token = _rastro_atual.set(atual)
+    inicio = time.perf_counter()
+    try:
+        yield atual
+    finally:
+        atual.total_ms = (time.perf_counter() - inicio) * 1000
+        _rastro_atual.reset(token)
+        if METRICAS_ARQUIVO:
+            gravar(atual)
+
+
+def gravar(rastro_doc: Rastro, caminho: str = None):
+    linha = json.dumps(rastro_doc.resumo(), ensure_ascii=False)
+    with _trava, open(caminho or METRICAS_ARQUIVO, "a", encoding="utf-8") as f:
+        f.write(linha + "\n")
+
+
+def resumo() -> dict:
+    """Totais do processo: {"etapas": {nome: {quantidade, soma_ms, media_ms, max_ms}}, "contadores": {...}}."""
+    with _trava:
+        etapas = {nome: {"quantidade": q, "soma_ms": round(s * 1000, 1), "media_ms": round(s * 1000 / q, 1),
+                         "max_ms": round(m * 1000, 1)}
+                  for nome, (q, s, m, _) in _etapas.items()}
+        return {"etapas": etapas, "contadores": dict(_contadores)}
+
+
+def _numero(valor) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def texto_prometheus() -> str:
+    """Registro no formato de exposição texto do Prometheus."""
+    with _trava:
+        etapas = {nome: (q, s, list(b)) for nome, (q, s, _, b) in _etapas.items()}
+        contadores = dict(_contadores)
+    linhas = [f"# HELP {PREFIXO}_etapa_segundos Duração das etapas do pipeline.",
+              f"# TYPE {PREFIXO}_etapa_segundos histogram"]
+    for nome, (quantidade, soma, buckets) in sorted(etapas.items()):
+        acumulado = 0
+        for limite, n in zip(LIMITES_S, buckets):
+            acumulado += n
+            linhas.append(f'{PREFIXO}_etapa_segundos_bucket{{etapa="{nome}",le="{limite}"}} {acumulado}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_bucket{{etapa="{nome}",le="+Inf"}} {quantidade}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_sum{{etapa="{nome}"}} {soma!r}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_count{{etapa="{nome}"}} {quantidade}')
+    for nome, valor in sorted(contadores.items()):
+        linhas.append(f"# TYPE {PREFIXO}_{nome}_total counter")
+        linhas.append(f"{PREFIXO}_{nome}_total {_numero(valor)}")
+    return "\n".join(linhas) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *_):
+        pass  # sem log por scrape
+
+
+_servidor = None
+
+
+def iniciar_servidor(porta: int = None):
+    """Sobe o /metrics numa thread (uma vez por processo). Devolve a porta ou None se desligado."""
+    global _servidor
+    porta = METRICAS_PORTA if porta is None else porta
+    if not METRICAS or not porta:
+        return None
+    with _trava:
+        if _servidor is None:
+            _servidor = ThreadingHTTPServer(("0.0.0.0", porta), _Handler)
+            threading.Thread(target=_servidor.serve_forever, name="metricas-http", daemon=True).start()
+    return _servidor.server_address[1]
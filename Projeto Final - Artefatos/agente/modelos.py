@@ -0,0 +1,60 @@
+"""
+Esquema Pydantic de um documento fiscal (usado pelo LLM, pela validação do XML e pelo lote).
+Fica separado do main.py pra poder ser importado sem subir o Streamlit.
+"""
+from pydantic import BaseModel, Field
+
+
+# Classes de uma nota fiscal
+
+class Participante(BaseModel):
+    """Sub-estrutura para Remetente e Receptor."""
+    id_fiscal: str = Field(description="ID Fiscal (CNPJ ou CPF) da parte (apenas dígitos).")
+    nome_completo: str = Field(
+        description="Nome ou Razão Social completa.",
+    )
+    endereco_completo: str = Field(description="Endereço completo (Rua, Número, Bairro, Cidade, Estado).")
+    inscricao_estadual: str = Field(description="Inscrição Estadual, se disponível.")
+
+
+class TotaisValores(BaseModel):
+    """Sub-estrutura para os Totais de Valores (Nível de Documento)."""
+    base_calculo_principal: float = Field(description="Valor total da Base de Cálculo principal (ex: ICMS) do documento.")
+    valor_total_principal: float = Field(description="Valor total do valor principal (ex: ICMS) destacado no documento.")
+    valor_total_adicional: float = Field(description="Valor total do valor adicional (ex: IPI) destacado no documento.")
+    valor_total_contribuicao_a: float = Field(description="Valor total da Contribuição A (ex: PIS) destacado no documento.")
+    valor_total_contribuicao_b: float = Field(description="Valor total da Contribuição B (ex: COFINS) destacado no documento.")
+    valor_outras_despesas: float = Field(description="Valor total de outras despesas acessórias (frete, seguro, etc.).")
+    valor_aprox_taxas_total: float = Field(description="Valor aproximado total das taxas.")
+
+
+class ItemDocumento(BaseModel):
+    descricao: str = Field(description="Nome ou descrição completa do produto/serviço.")
+    quantidade: float = Field(description="Quantidade do item, convertida para um valor numérico (float).")
+    valor_unitario: float = Field(description="Valor unitário do item.")
+    valor_total: float = Field(description="Valor total da linha do item.")
+    codigo_operacao: str = Field(description="Código de Operação (ex: CFOP) associado ao item, se disponível.")
+    codigo_tributario: str = Field(description="Código de Situação Tributária (ex: CST/CSOSN) do item, se disponível.")
+    valor_aprox_taxas: float = Field(description="Valor aproximado das taxas incidentes sobre este item (Lei da Transparência).")
+
+
+class CabecalhoDocumento(BaseModel):
+    """Tudo do documento menos os itens (a extração em blocos pede isso separado)."""
+    numero_controle: str = Field(description="Número de Controle (ex: Chave de Acesso) do documento (44 dígitos), se presente.")
+    modelo_documento: str = Field(description="Modelo do documento (Ex: NF-e, NFS-e, Cupom).")
+    data_emissao: str = Field(description="Data de emissão do documento no formato DD-MM-AAAA.") 
+    valor_total_nota: float = Field(description="Valor total FINAL do documento (somatório de tudo).")
+    tipo_operacao: str = Field(description="Descrição do tipo de operação (Ex: Venda de Mercadoria, Remessa para Armazém Geral).")
+
+    remetente: Participante = Field(description="Dados completos do remetente (quem vendeu/prestou o serviço).")
+    receptor: Participante = Field(description="Dados completos do receptor (quem comprou/recebeu o serviço).")
+    totais_valores: TotaisValores = Field(description="Valores totais de taxas e despesas acessórias do documento.")
+
+
+class DocumentoProcessado(CabecalhoDocumento):
+    itens: list[ItemDocumento] = Field(description="Lista completa de todos os produtos ou serviços discriminados no documento, seguindo o esquema ItemDocumento.")
+
+
+class ListaItens(BaseModel):
+    """Itens de um trecho do documento (extração em blocos)."""
+    itens: list[ItemDocumento] = Field(description="Itens (produtos/serviços) que aparecem neste trecho do texto, na ordem.")
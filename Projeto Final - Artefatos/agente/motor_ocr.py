@@ -0,0 +1,126 @@
+"""
+Motores de OCR: o que de fato transforma uma imagem PIL em texto.
+
+- subprocesso: o `pytesseract.image_to_string` de sempre. Cada página grava um PNG
+  temporário, sobe um processo `tesseract` novo e ele recarrega o `por.traineddata`.
+  Em cupom pequeno essa partida custa mais que o OCR em si.
+- persistente: instâncias da API do Tesseract (via `tesserocr`) que ficam vivas no
+  processo, com o modelo do idioma já carregado, e recebem a imagem em memória.
+  Uma instância atende uma página por vez; o pool cresce até o nº de threads que
+  pedem OCR ao mesmo tempo (o OCR_WORKERS) e é reaproveitado entre documentos e
+  reruns do Streamlit. O tesserocr solta o GIL durante o reconhecimento, então as
+  threads do `ocr_paginas` rodam em paralelo de verdade.
+
+OCR_MOTOR escolhe: "auto" (padrão: persistente se o tesserocr estiver instalado,
+senão subprocesso), "subprocesso" ou "persistente".
+
+Os dois motores devolvem o mesmo texto e as mesmas exceções: Tesseract/idioma
+ausente vira `pytesseract.TesseractNotFoundError` (o ERRO_TESSERACT do app) e
+falha numa página sobe como exceção comum (vira marcação só naquela página).
+"""
+import os
+import queue
+import re
+import threading
+
+import pytesseract
+
+OCR_MOTOR = os.getenv("OCR_MOTOR", "auto").strip().lower()
+MOTORES = ("auto", "subprocesso", "persistente")
+
+
+def _parametro(config: str, nome: str, padrao: int) -> int:
+    achado = re.search(rf"--{nome}\s+(\d+)", config)
+    return int(achado.group(1)) if achado else padrao
+
+
+def _pasta_tessdata():
+    """tessdata do mesmo Tesseract que o pytesseract usaria (TESSDATA_PREFIX ou do lado do executável)."""
+    if os.getenv("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    executavel = pytesseract.pytesseract.tesseract_cmd
+    pasta = os.path.join(os.path.dirname(executavel), "tessdata")
+    if os.path.dirname(executavel) and os.path.isdir(pasta):
+        return pasta
+    return None  # padrao compilado no libtesseract
+
+
+class MotorSubprocesso:
+    """Um processo `tesseract` por página (caminho antigo do app)."""
+
+    nome = "subprocesso"
+
+    def __init__(self, lang: str, config: str):
+        self.lang, self.config = lang, config
+
+    def texto(self, imagem) -> str:
+        return pytesseract.image_to_string(imagem, lang=self.lang, config=self.config)
+
+    def fechar(self):
+        pass
+
+
+class MotorPersistente:
+    """Pool de instâncias `tesserocr.PyTessBaseAPI` com o idioma carregado."""
+
+    nome = "persistente"
+
+    def __init__(self, lang: str, config: str):
+        import tesserocr  # opcional: sem ele o "auto" fica no subprocesso
+
+        self._tesserocr = tesserocr
+        self.lang, self.config = lang, config
+        self._oem = _parametro(config, "oem", tesserocr.OEM.DEFAULT)
+        self._psm = _parametro(config, "psm", tesserocr.PSM.AUTO)
+        self._tessdata = _pasta_tessdata()
+        self._livres = queue.SimpleQueue()
+        self._todas = []
+        self._trava = threading.Lock()
+
+    def _nova_api(self):
+        kwargs = {"lang": self.lang, "oem": self._oem, "psm": self._psm}
+        if self._tessdata:
+            kwargs["path"] = self._tessdata
+        try:
+            api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        except RuntimeError as e:
+            # sem tessdata / sem o idioma: mesmo erro que o pytesseract da quando nao acha o tesseract
+            raise pytesseract.TesseractNotFoundError() from e
+        with self._trava:
+            self._todas.append(api)
+        return api
+
+    def texto(self, imagem) -> str:
+        try:
+            api = self._livres.get_nowait()
+        except queue.Empty:
+            api = self._nova_api()
+        try:
+            api.SetImage(imagem)
+            # o CLI termina cada pagina com "\f" (page separator); mantem igual pro cache/LLM verem o mesmo texto
+            return api.GetUTF8Text() + "\f"
+        finally:
+            api.Clear()
+            self._livres.put(api)
+
+    def fechar(self):
+        with self._trava:
+            for api in self._todas:
+                api.End()
+            self._todas.clear()
+        self._livres = queue.SimpleQueue()
+
+
+def criar_motor(lang: str, config: str, tipo: str = None):
+    """Motor do tipo pedido (ou do OCR_MOTOR). "auto" cai pro subprocesso se não tiver tesserocr."""
+    tipo = (tipo or OCR_MOTOR).strip().lower()
+    if tipo not in MOTORES:
+        raise ValueError(f"OCR_MOTOR desconhecido: {tipo}. Use: {', '.join(MOTORES)}")
+    if tipo == "subprocesso":
+        return MotorSubprocesso(lang, config)
+    try:
+        return MotorPersistente(lang, config)
+    except ImportError:
+        if tipo == "persistente":
+            raise
+        return MotorSubprocesso(lang, config)
@@ -0,0 +1,295 @@
+"""
+Extração de NF-e direto do XML em uma passada só.
+
+Antes o XML era decodificado, copiado pra tirar o namespace e depois vinham
+dezenas de buscas `.//tag` (cada uma varrendo a subárvore de novo). Aqui os
+bytes vão direto pro parser em C (namespace mantido) e a árvore é percorrida
+uma única vez. Um "plano" compilado diz quais tags interessam em cada escopo
+(ide, emit, det, ICMSTot...) e vira uma tabela tag -> ação por combinação de
+escopos abertos, então cada elemento custa praticamente um `dict.get`.
+
+A saída é a mesma do `process_xml_content` antigo (mesmas regras de "primeira
+ocorrência" do `find`), inclusive nas esquisitices dele.
+"""
+import xml.etree.ElementTree as ET
+
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+
+
+class _Escopo:
+    """Um nó do plano: quais campos coletar e quais sub-escopos abrir dentro dele."""
+    __slots__ = ("campos", "filhos", "repetidos", "filho_direto")
+
+    def __init__(self, campos=(), filhos=None, repetidos=(), filho_direto=None):
+        self.campos = frozenset(campos)      # texto da 1a ocorrência (qualquer profundidade)
+        self.filhos = filhos or {}           # tag -> _Escopo (1a ocorrência)
+        self.repetidos = frozenset(repetidos)  # tags de `filhos` que abrem um escopo por ocorrência (det)
+        self.filho_direto = filho_direto     # (predicado, _Escopo) só pros filhos diretos
+
+
+# --- Plano de extração (compilado uma vez no import) ---
+_ENDERECO = _Escopo(campos=("xLgr", "nro", "xBairro", "xMun", "UF"))
+
+_PARTICIPANTE = _Escopo(
+    campos=("CNPJ", "CPF", "xNome", "IE"),
+    filhos={"enderEmit": _ENDERECO, "enderDest": _ENDERECO},
+)
+
+# o codigo antigo procurava 'CST'/'CSOSN' no nome dos filhos diretos de ICMS
+_ICMS = _Escopo(
+    filho_direto=(lambda tag: "CST" in tag or "CSOSN" in tag, _Escopo(campos=("CST", "CSOSN"))),
+)
+
+_DET = _Escopo(
+    filhos={
+        "prod": _Escopo(campos=("xProd", "qCom", "vUnCom", "vProd", "CFOP")),
+        "imposto": _Escopo(
+            filhos={
+                "ICMS": _ICMS,
+                "impostoTrib": _Escopo(campos=("vTotTrib",)),
+            }
+        ),
+    }
+)
+
+_RAIZ = _Escopo(
+    campos=("chNFe", "Id", "dhEmi", "dEmi", "mod", "natOp"),
+    filhos={
+        "ICMSTot": _Escopo(campos=("vNF", "vBC", "vICMS", "vIPI", "vPIS", "vCOFINS", "vOutro", "vTotTrib")),
+        "emit": _PARTICIPANTE,
+        "dest": _PARTICIPANTE,
+        "det": _DET,
+    },
+    repetidos=("det",),
+)
+
+
+class _Quadro:
+    """Estado de um escopo aberto durante a varredura."""
+    __slots__ = ("escopo", "tag", "valores", "filhos", "n_filhos", "direto")
+
+    def __init__(self, escopo, tag, n_filhos=0):
+        self.escopo = escopo
+        self.tag = tag
+        self.valores = {}   # campo -> texto (None se a tag veio vazia, igual ao ET)
+        self.filhos = {}    # tag -> _Quadro (ou lista de _Quadro nos repetidos)
+        self.n_filhos = n_filhos  # qtd de filhos diretos (o `or` do enderEmit dependia disso)
+        self.direto = None  # quadro aberto pelo filho_direto
+
+
+# tabela compilada por "caminho" de escopos abertos: tag completa -> ações
+# acao = (indice do quadro, nome, sub-escopo ou None, repetido)
+_TABELAS = {}
+_PROXIMO = {}  # (caminho, escopo) -> caminho + (escopo,), pra nao remontar tupla
+
+
+def _tabela(caminho):
+    tabela = _TABELAS.get(caminho)
+    if tabela is None:
+        tabela = {}
+        for i, escopo in enumerate(caminho):
+            acoes = [(nome, (i, nome, None, False)) for nome in escopo.campos]
+            acoes += [(nome, (i, nome, sub, nome in escopo.repetidos)) for nome, sub in escopo.filhos.items()]
+            for nome, acao in acoes:
+                # casa com e sem o namespace da nfe, sem precisar tirar ele do texto
+                for tag in (nome, f"{{{NS_NFE}}}{nome}"):
+                    tabela.setdefault(tag, []).append(acao)
+        _TABELAS[caminho] = tabela
+    return tabela
+
+
+def _entrar(caminho, escopo):
+    chave = (caminho, escopo)
+    proximo = _PROXIMO.get(chave)
+    if proximo is None:
+        proximo = _PROXIMO[chave] = caminho + (escopo,)
+    return proximo
+
+
+def _nome_local(tag):
+    if tag[0] == "{":
+        uri, _, local = tag[1:].partition("}")
+        return local if uri == NS_NFE else None
+    return tag
+
+
+def _ultimo_descendente(elem):
+    # em pre-ordem a subarvore de `elem` termina no descendente mais a direita
+    while len(elem):
+        elem = elem[-1]
+    return elem
+
+
+def _varrer(root, raiz):
+    """
+    Percorre `root.iter()` (loop em C) uma vez só. Os escopos abertos ficam numa
+    pilha junto com o elemento onde a subárvore deles acaba, então dá pra saber
+    em que escopo cada elemento está sem recursão nem ponteiro pro pai.
+    """
+    quadros = [raiz]
+    caminho = (raiz.escopo,)
+    acoes_da_tag = _tabela(caminho).get
+    fim = _ultimo_descendente(root)
+    pilha = []  # (fim, caminho, acoes_da_tag) de quem estava aberto antes
+    especial = None  # filho direto que abre o escopo do filho_direto (ICMS -> ICMS00/ICMSSN...)
+    especial_de = None
+
+    iterador = root.iter()
+    next(iterador)  # o `.//` do find nunca casava com a propria raiz
+    for elem in iterador:
+        acoes = acoes_da_tag(elem.tag)
+        if acoes is not None or elem is especial:
+            novos = []
+            for i, nome, sub, repetido in acoes or ():
+                quadro = quadros[i]
+                if sub is None:
+                    if nome not in quadro.valores:
+                        quadro.valores[nome] = elem.text
+                elif repetido or nome not in quadro.filhos:
+                    novo = _Quadro(sub, nome, len(elem))
+                    if repetido:
+                        quadro.filhos.setdefault(nome, []).append(novo)
+                    else:
+                        quadro.filhos[nome] = novo
+                    novos.append(novo)
+
+            if elem is especial:
+                especial_de.direto = _Quadro(especial_de.escopo.filho_direto[1], _nome_local(elem.tag), len(elem))
+                novos.append(especial_de.direto)
+                especial = especial_de = None
+
+            if novos:
+                pilha.append((fim, caminho, acoes_da_tag, len(novos)))
+                fim = _ultimo_descendente(elem)
+                for novo in novos:
+                    quadros.append(novo)
+                    caminho = _entrar(caminho, novo.escopo)
+                    if novo.escopo.filho_direto is not None:
+                        predicado = novo.escopo.filho_direto[0]
+                        for filho in elem:
+                            local = _nome_local(filho.tag)
+                            if local is not None and predicado(local):
+                                especial, especial_de = filho, novo
+                                break
+                acoes_da_tag = _tabela(caminho).get
+
+        # fecha todos os escopos cuja subarvore acabou aqui
+        while elem is fim and pilha:
+            fim, caminho, acoes_da_tag, n = pilha.pop()
+            del quadros[-n:]
+
+
+def _float_xml(text):
+    """Mesmo comportamento do safe_float_xml antigo."""
+    try:
+        if isinstance(text, str):
+            text = text.replace(',', '.')
+        return float(text)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _data_br(data_emissao_raw):
+    # AAAA-MM-DD(Thh:mm...) -> DD-MM-AAAA
+    if not data_emissao_raw:
+        return ""
+    data_emissao_iso = data_emissao_raw[:10]
+    parts = data_emissao_iso.split('-')
+    if len(parts) == 3:
+        return f"{parts[2]}-{parts[1]}-{parts[0]}"
+    return data_emissao_iso
+
+
+def _vazio():
+    return _Quadro(_Escopo(), "")
+
+
+def _montar_participante(quadro):
+    if quadro is None:
+        return {}
+    v = quadro.valores
+
+    # enderEmit "vazio" (sem filhos) caia pro enderDest no codigo antigo
+    ender = quadro.filhos.get("enderEmit")
+    if ender is None or not ender.n_filhos:
+        ender = quadro.filhos.get("enderDest")
+
+    endereco_completo = ""
+    if ender is not None:
+        e = ender.valores
+        logradouro, numero, bairro = e.get("xLgr", ""), e.get("nro", ""), e.get("xBairro", "")
+        municipio, uf = e.get("xMun", ""), e.get("UF", "")
+        if all([logradouro, numero, municipio, uf]):
+            endereco_completo = f"{logradouro}, {numero} - {bairro} - {municipio}/{uf}".strip()
+
+    return {
+        'id_fiscal': v.get("CNPJ", "") or v.get("CPF", ""),
+        'nome_completo': v.get("xNome", ""),
+        'endereco_completo': endereco_completo,
+        'inscricao_estadual': v.get("IE", ""),
+    }
+
+
+def _montar_item(det):
+    prod = det.filhos.get("prod") or _vazio()
+    imposto = det.filhos.get("imposto") or _vazio()
+    p = prod.valores
+
+    codigo_tributario = ""
+    icms = imposto.filhos.get("ICMS")
+    if icms is not None and icms.direto is not None:
+        sub = icms.direto
+        campo = "CST" if "CST" in sub.tag else "CSOSN"
+        codigo_tributario = sub.valores.get(campo, "")
+
+    v_aprox_taxas = 0.0
+    imposto_trib = imposto.filhos.get("impostoTrib")
+    if imposto_trib is not None:
+        v_aprox_taxas = _float_xml(imposto_trib.valores.get("vTotTrib", ""))
+
+    return {
+        'descricao': p.get("xProd", ""),
+        'quantidade': _float_xml(p.get("qCom", "")),
+        'valor_unitario': _float_xml(p.get("vUnCom", "")),
+        'valor_total': _float_xml(p.get("vProd", "")),
+        'codigo_operacao': p.get("CFOP", ""),
+        'codigo_tributario': codigo_tributario,
+        'valor_aprox_taxas': v_aprox_taxas,
+    }
+
+
+def extrair_nfe(xml_content) -> dict:
+    """
+    Extrai a NF-e (bytes ou str) para o dicionário compatível com DocumentoProcessado.
+    Levanta `xml.etree.ElementTree.ParseError` se o XML estiver quebrado.
+    """
+    root = ET.fromstring(xml_content)
+    raiz = _Quadro(_RAIZ, root.tag, len(root))
+    _varrer(root, raiz)
+    v = raiz.valores
+
+    numero_controle = v.get("chNFe", "") or (v.get("Id", "") or "").replace('NFe', '')
+
+    tot = raiz.filhos.get("ICMSTot") or _vazio()
+    t = tot.valores
+    totais_valores = {
+        'base_calculo_principal': _float_xml(t.get("vBC", "")),
+        'valor_total_principal': _float_xml(t.get("vICMS", "")),
+        'valor_total_adicional': _float_xml(t.get("vIPI", "")),
+        'valor_total_contribuicao_a': _float_xml(t.get("vPIS", "")),
+        'valor_total_contribuicao_b': _float_xml(t.get("vCOFINS", "")),
+        'valor_outras_despesas': _float_xml(t.get("vOutro", "")),
+        'valor_aprox_taxas_total': _float_xml(t.get("vTotTrib", "")),
+    }
+
+    return {
+        'numero_controle': numero_controle,
+        'modelo_documento': v.get("mod", ""),
+        'data_emissao': _data_br(v.get("dhEmi", "") or v.get("dEmi", "")),
+        'valor_total_nota': _float_xml(t.get("vNF", "")),
+        'tipo_operacao': v.get("natOp", ""),
+        'remetente': _montar_participante(raiz.filhos.get("emit")),
+        'receptor': _montar_participante(raiz.filhos.get("dest")),
+        'totais_valores': totais_valores,
+        'itens': [_montar_item(det) for det in raiz.filhos.get("det", [])],
+    }
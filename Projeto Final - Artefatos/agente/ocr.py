@@ -0,0 +1,276 @@
+"""
+OCR das páginas com Tesseract, em paralelo, e leitura do texto nativo de PDFs.
+
+Cada `pytesseract.image_to_string` sobe um processo `tesseract` separado, então um
+pool de threads já basta pra ocupar todos os núcleos (a thread só fica esperando o
+subprocesso; no motor persistente o tesserocr solta o GIL). A ordem das páginas é
+mantida e a falha de uma página vira uma marcação só naquela página, em vez de
+derrubar o documento inteiro.
+
+PDFs gerados digitalmente (a maioria das DANFEs de fornecedor) já trazem a camada
+de texto: ela é lida direto com o PyMuPDF, e só as páginas sem texto utilizável
+(scans) são rasterizadas e passam pelo Tesseract.
+
+A rasterização é em streaming: as páginas são renderizadas uma a uma (em tons de
+cinza por padrão) e só uma janela pequena fica na memória enquanto o OCR roda,
+limitada por RASTER_MEMORIA_MB. O pico de memória não depende do nº de páginas.
+
+O texto de cada página fica num cache em disco chaveado pelo hash exato dos pixels
++ idioma + config do Tesseract: página repetida (capa, termos, reenvio do mesmo
+scan, mesma página em PDFs diferentes) não roda OCR de novo.
+
+O Tesseract em si roda pelo motor do motor_ocr.py: um processo por página
+(pytesseract) ou, com o tesserocr instalado, APIs persistentes com o modelo já
+carregado, sem subir processo nem gravar arquivo temporário (OCR_MOTOR).
+
+Antes do Tesseract cada página pode passar pelo pré-processamento do OpenCV
+(preprocessamento.py: cinza, recorte, deskew, escala...), ligado pelo
+OCR_PREPROCESSAMENTO (desligado por padrão). Em acerto de cache ele nem roda.
+"""
+import hashlib
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pymupdf
+import pytesseract
+from PIL import Image
+
+from cache import CacheDisco
+from metricas import contar, etapa, medido, no_contexto
+from motor_ocr import criar_motor
+from preprocessamento import preprocessar, assinatura
+
+OCR_CONFIG = '--oem 1 --psm 3'
+OCR_LANG = 'por'
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+# o tesseract abre varias threads OpenMP por pagina; com varias paginas ao mesmo tempo isso so
+# disputa CPU. So limita com mais de um worker: com OCR_WORKERS=1 (ou 1 CPU) cada pagina fica com
+# as threads dela. Vai no import, antes de subir qualquer tesseract: o processo filho herda o
+# ambiente e o OpenMP do libtesseract so le a variavel quando carrega, entao vale pro processo
+# todo (um `workers=1` por chamada nao desfaz). Quem definiu OMP_THREAD_LIMIT continua mandando
+if OCR_WORKERS > 1:
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))  # 200 = padrao do rasterizador antigo (pdf2image)
+OCR_CINZA = os.getenv("OCR_CINZA", "1") != "0"  # tesseract converte pra cinza de qualquer jeito
+RASTER_MEMORIA_MB = float(os.getenv("RASTER_MEMORIA_MB", "256"))  # teto das paginas rasterizadas em voo
+PREVIEW_LADO_MAX = 1200  # a previa da tela nao precisa de resolucao de OCR
+OCR_CACHE = os.getenv("OCR_CACHE", "1") != "0"
+
+# texto nativo do PDF: liga/desliga e o minimo pra considerar a pagina "com texto"
+PDF_TEXTO_NATIVO = os.getenv("PDF_TEXTO_NATIVO", "1") != "0"
+MIN_CARACTERES_PAGINA = 40
+
+### IMPORTANTE, adicione o caminho do tesseract ela pode ser achada aqui
+#https://github.com/UB-Mannheim/tesseract/wiki
+# Config do Tesseract //mudar para o seu caminho
+TESSERACT_PATH = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
+if 'TESSERACT_PATH' in os.environ:
+    pytesseract.pytesseract.tesseract_cmd = os.environ['TESSERACT_PATH']
+elif os.path.exists(TESSERACT_PATH):
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+else:
+    pass # se nao achar, vai tentar usar o do PATH
+
+
+def marcador_pagina(numero: int) -> str:
+    return f"\n--- INÍCIO PÁGINA {numero} ---\n\n"
+
+
+_cache_paginas = None
+
+
+def cache_ocr():
+    """Cache de páginas (um por processo, criado só quando precisa)."""
+    global _cache_paginas
+    if _cache_paginas is None:
+        _cache_paginas = CacheDisco("ocr_paginas")
+    return _cache_paginas
+
+
+_motor = None
+
+
+def motor_ocr():
+    """Motor de OCR do processo (criado na 1a página e reaproveitado, ver motor_ocr.py)."""
+    global _motor
+    if _motor is None:
+        _motor = criar_motor(OCR_LANG, OCR_CONFIG)
+    return _motor
+
+
+def chave_pagina(imagem) -> str:
+    """Hash exato dos pixels (antes do pré-processamento) + tudo que muda o resultado do Tesseract."""
+    h = hashlib.sha256(f"{imagem.mode}:{imagem.size}".encode())
+    h.update(imagem.tobytes())
+    chave = f"{h.hexdigest()}:{OCR_LANG}:{OCR_CONFIG}"
+    preprocessamento = assinatura()
+    return f"{chave}:{preprocessamento}" if preprocessamento else chave
+
+
+def _tesseract(imagem, tempos: dict = None, max_bytes: int = None) -> str:
+    with etapa("preprocessamento"):
+        imagem, tempos_etapas = preprocessar(imagem, max_bytes=max_bytes)
+    inicio = time.perf_counter()
+    with etapa("tesseract"):
+        texto = motor_ocr().texto(imagem)
+    contar("ocr_paginas")
+    tempos_etapas["tesseract"] = round((time.perf_counter() - inicio) * 1000, 1)
+    if tempos is not None:
+        tempos.update(tempos_etapas)
+    return texto
+
+
+def ocr_pagina(imagem, tempos: dict = None, max_bytes: int = None) -> str:
+    """
+    OCR de uma imagem PIL (uma página), passando pelo cache de páginas.
+    Se `tempos` for um dict, recebe os ms de cada etapa do pré-processamento + "tesseract".
+    `max_bytes` limita a ampliação do pré-processamento (a fatia da página no RASTER_MEMORIA_MB).
+    """
+    if not OCR_CACHE:
+        return _tesseract(imagem, tempos, max_bytes)
+
+    cache = cache_ocr()
+    chave = chave_pagina(imagem)
+    texto = cache.get(chave)
+    contar("ocr_cache_acertos" if texto is not None else "ocr_cache_faltas")
+    if texto is None:
+        texto = _tesseract(imagem, tempos, max_bytes)
+        cache.set(chave, texto) # so guarda se deu certo
+    return texto
+
+
+def _ocr_pagina_seguro(imagem, tempos=None, max_bytes=None):
+    # devolve (texto, erro). Tesseract ausente nao e problema da pagina, entao sobe
+    try:
+        return ocr_pagina(imagem, tempos, max_bytes), None
+    except pytesseract.TesseractNotFoundError:
+        raise
+    except Exception as e:
+        contar("ocr_paginas_erro")
+        return "", e
+
+
+def ocr_paginas(imagens, workers: int = None, janela: int = None, tempos: list = None,
+                max_bytes: int = None) -> list:
+    """
+    Roda o OCR de várias páginas em paralelo e devolve [(texto, erro), ...] na mesma ordem.
+    `imagens` pode ser um gerador: no máximo `janela` imagens ficam vivas ao mesmo tempo,
+    cada uma com no máximo `max_bytes` depois do pré-processamento.
+    Se `tempos` for uma lista, ganha um {etapa: ms} por página (vazio = veio do cache).
+    Levanta `pytesseract.TesseractNotFoundError` se o Tesseract não existir.
+    """
+    workers = max(1, workers or OCR_WORKERS)
+
+    def tempos_pagina():
+        if tempos is None:
+            return None
+        tempos.append({})
+        return tempos[-1]
+
+    if workers == 1:
+        return [_ocr_pagina_seguro(img, tempos_pagina(), max_bytes) for img in imagens]
+
+    janela = max(1, janela or workers)
+    resultados = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pendentes = deque()
+        for img in imagens:
+            pendentes.append(pool.submit(no_contexto(_ocr_pagina_seguro), img, tempos_pagina(), max_bytes))
+            del img  # so o future segura a imagem ate o OCR terminar
+            if len(pendentes) >= janela:
+                resultados.append(pendentes.popleft().result())
+        while pendentes:
+            resultados.append(pendentes.popleft().result())
+    return resultados
+
+
+def montar_texto_ocr(resultados) -> str:
+    """Junta [(texto, erro), ...] no formato com os marcadores `--- INÍCIO PÁGINA n ---`."""
+    partes = []
+    for i, (texto, erro) in enumerate(resultados):
+        if erro is not None:
+            texto = f"[ERRO_PAGINA: Falha no OCR desta página. Detalhes: {erro}]"
+        partes.append(marcador_pagina(i + 1) + texto)
+    return "\n".join(partes)
+
+
+def texto_utilizavel(texto: str) -> bool:
+    """A camada de texto da página serve? (scan puro vem vazio, fonte sem ToUnicode vem lixo)"""
+    limpo = texto.strip()
+    if len(limpo) < MIN_CARACTERES_PAGINA:
+        return False
+    ruins = sum(1 for c in limpo if c == '\ufffd' or (ord(c) < 32 and c not in '\n\r\t'))
+    alfanumericos = sum(1 for c in limpo if c.isalnum())
+    return ruins / len(limpo) < 0.05 and alfanumericos / len(limpo) > 0.3
+
+
+def _bytes_raster(pagina, dpi: int, cinza: bool) -> int:
+    canais = 1 if cinza else 3
+    return int(pagina.rect.width / 72 * dpi) * int(pagina.rect.height / 72 * dpi) * canais
+
+
+@medido("rasterizacao")
+def renderizar_pagina(pagina, dpi: int = OCR_DPI, cinza: bool = OCR_CINZA, max_bytes: int = None):
+    """
+    Rasteriza uma página do PyMuPDF para imagem PIL ("L" ou "RGB").
+    Se a página for gigante e passar de `max_bytes`, o DPI é reduzido só pra ela.
+    """
+    if max_bytes:
+        estimado = _bytes_raster(pagina, dpi, cinza)
+        if estimado > max_bytes:
+            dpi = max(72, int(dpi * math.sqrt(max_bytes / estimado)))
+    pix = pagina.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY if cinza else pymupdf.csRGB, alpha=False)
+    return Image.frombytes("L" if cinza else "RGB", (pix.width, pix.height), pix.samples)
+
+
+def renderizar_preview(pagina):
+    """Prévia pequena (RGB) da página pra mostrar na tela."""
+    maior_lado_pol = max(pagina.rect.width, pagina.rect.height) / 72 or 1
+    dpi = max(20, min(OCR_DPI, int(PREVIEW_LADO_MAX / maior_lado_pol)))
+    return renderizar_pagina(pagina, dpi=dpi, cinza=False)
+
+
+def processar_pdf(pdf_bytes: bytes, workers: int = None, tempos: list = None):
+    """
+    Texto por página de um PDF: camada nativa quando existe, OCR só no resto.
+    Devolve ([(texto, erro), ...], prévia da 1a página, qtd de páginas com texto nativo).
+    `tempos` como no `ocr_paginas` (só as páginas que foram pro OCR).
+    """
+    workers = max(1, workers or OCR_WORKERS)
+    teto_bytes = int(RASTER_MEMORIA_MB * 1024 * 1024)
+
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        total_paginas = doc.page_count
+        if total_paginas == 0:
+            return [], None, 0
+
+        resultados = [None] * total_paginas
+        sem_texto = []
+        with etapa("pdf_texto_nativo"):
+            for i, pagina in enumerate(doc):
+                texto = pagina.get_text("text", sort=True) if PDF_TEXTO_NATIVO else ""
+                if texto_utilizavel(texto):
+                    resultados[i] = (texto, None)
+                else:
+                    sem_texto.append(i)
+        contar("pdf_paginas_texto_nativo", total_paginas - len(sem_texto))
+
+        preview = renderizar_preview(doc[0])
+
+        if sem_texto:
+            # quantas paginas cabem no teto ao mesmo tempo (estimando pela 1a pagina escaneada)
+            por_pagina = _bytes_raster(doc[sem_texto[0]], OCR_DPI, OCR_CINZA)
+            janela = max(1, min(workers, teto_bytes // max(por_pagina, 1)))
+            # cada pagina da janela fica com a sua fatia do teto (na rasterizacao e na ampliacao
+            # do pre-processamento), senao janela paginas gigantes chegariam a janela x teto
+            por_vaga = teto_bytes // janela
+            # gerador: cada pagina so e renderizada quando tem vaga na janela
+            imagens = (renderizar_pagina(doc[i], max_bytes=por_vaga) for i in sem_texto)
+            for i, resultado in zip(sem_texto, ocr_paginas(imagens, workers, janela=janela, tempos=tempos,
+                                                           max_bytes=por_vaga)):
+                resultados[i] = resultado
+
+    return resultados, preview, total_paginas - len(sem_texto)
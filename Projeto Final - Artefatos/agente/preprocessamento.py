@@ -0,0 +1,217 @@
+"""
+Pré-processamento das páginas com OpenCV antes do Tesseract.
+
+Scan torto, borda preta do scanner, foto de cupom pequena demais ou uma página de
+300 DPI com letra enorme deixam o OCR lento e cheio de erro (que depois o LLM tem
+que adivinhar). As etapas, sempre nesta ordem:
+
+- cinza:     converte pra tons de cinza;
+- recortar:  corta a margem branca e as faixas escuras da borda do scanner;
+- deskew:    endireita a página (ângulo pelo perfil de projeção das linhas de texto);
+- ruido:     tira ruído com non-local means (lento, bom pra foto granulada);
+- escala:    redimensiona pra altura de letra que o Tesseract lê melhor (~OCR_ALTURA_TEXTO px);
+- binarizar: limiar adaptativo (sombra / iluminação desigual em foto).
+
+Quais rodam vem do OCR_PREPROCESSAMENTO (lista separada por vírgula, vazio = nenhuma).
+O padrão é nenhuma: sem Tesseract na máquina do benchmark ainda não há número de
+acerto em scan real que pague o custo (o deskew sozinho é ~120 ms por página).
+Meça com `python -m benchmarks.bench_preprocessamento` antes de ligar.
+O tempo de cada etapa é devolvido junto com a imagem.
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ORDEM_ETAPAS = ("cinza", "recortar", "deskew", "ruido", "escala", "binarizar")
+OCR_PREPROCESSAMENTO = os.getenv("OCR_PREPROCESSAMENTO", "")  # opt-in, ver docstring
+ETAPAS_SUGERIDAS = ("cinza", "recortar", "deskew", "escala")  # o candidato pra scan, que o benchmark compara
+OCR_ALTURA_TEXTO = int(os.getenv("OCR_ALTURA_TEXTO", "30"))  # px da letra maiuscula/digito
+
+ANGULO_MAX = 10.0  # deskew procura entre -10 e +10 graus
+ANGULO_MIN = 0.2  # abaixo disso nao vale girar (so borra)
+LARGURA_ANALISE = 800  # deskew e altura do texto sao medidos numa copia reduzida
+MARGEM_RECORTE = 10  # px de branco deixados em volta do conteudo
+ESCALA_TOLERANCIA = (0.8, 1.25)  # fator de escala dentro disso = deixa como esta
+ESCALA_LIMITES = (0.4, 4.0)
+MAX_PIXELS = 40_000_000  # teto pra ampliacao nao estourar a memoria
+BLOCO_BINARIZACAO = 31  # vizinhanca (px) do limiar adaptativo
+C_BINARIZACAO = 15
+
+
+def etapas_configuradas(config: str = None) -> tuple:
+    """Etapas do OCR_PREPROCESSAMENTO (ou de `config`), na ordem fixa do pipeline."""
+    pedidas = {e.strip().lower() for e in (OCR_PREPROCESSAMENTO if config is None else config).split(",") if e.strip()}
+    desconhecidas = pedidas - set(ORDEM_ETAPAS)
+    if desconhecidas:
+        raise ValueError(f"Etapa(s) de pré-processamento desconhecida(s): {', '.join(sorted(desconhecidas))}. "
+                         f"Use: {', '.join(ORDEM_ETAPAS)}")
+    return tuple(e for e in ORDEM_ETAPAS if e in pedidas)
+
+
+def assinatura(etapas: tuple = None) -> str:
+    """Entra na chave do cache de OCR: outra configuração = outro texto."""
+    etapas = etapas_configuradas() if etapas is None else etapas
+    if not etapas:
+        return ""
+    partes = list(etapas)
+    if "escala" in etapas:
+        partes.append(f"h{OCR_ALTURA_TEXTO}")
+    return "+".join(partes)
+
+
+def _cinza(img: np.ndarray) -> np.ndarray:
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+
+def _tinta(cinza: np.ndarray) -> np.ndarray:
+    """Máscara do que é escuro (texto, linha, borda): 255 = tinta."""
+    _, tinta = cv2.threshold(cinza, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return tinta
+
+
+def _reduzida(cinza: np.ndarray) -> tuple:
+    fator = min(1.0, LARGURA_ANALISE / cinza.shape[1])
+    if fator < 1.0:
+        cinza = cv2.resize(cinza, None, fx=fator, fy=fator, interpolation=cv2.INTER_AREA)
+    return cinza, fator
+
+
+def _faixa_util(contagem: np.ndarray, comprimento: int) -> tuple:
+    # linha/coluna com tinta, mas sem ser quase toda escura (borda do scanner, sombra da dobra)
+    uteis = np.flatnonzero((contagem > 1) & (contagem < 0.9 * comprimento))
+    if len(uteis) == 0:
+        return 0, len(contagem)
+    return uteis[0], uteis[-1] + 1
+
+
+def recortar(img: np.ndarray, cinza: np.ndarray) -> np.ndarray:
+    tinta = _tinta(cinza) > 0
+    altura, largura = tinta.shape
+    x0, x1 = _faixa_util(tinta.sum(axis=0), altura)
+    y0, y1 = _faixa_util(tinta[:, x0:x1].sum(axis=1), x1 - x0)
+    x0, y0 = max(0, x0 - MARGEM_RECORTE), max(0, y0 - MARGEM_RECORTE)
+    x1, y1 = min(largura, x1 + MARGEM_RECORTE), min(altura, y1 + MARGEM_RECORTE)
+    return img[y0:y1, x0:x1]
+
+
+def angulo_inclinacao(cinza: np.ndarray) -> float:
+    """
+    Ângulo (graus) que endireita a página: o que deixa as linhas de texto mais
+    "horizontais", ou seja, maximiza a variação entre somas de linhas vizinhas.
+    """
+    tinta = _tinta(_reduzida(cinza)[0])
+    altura, largura = tinta.shape
+    centro = (largura / 2, altura / 2)
+
+    def nitidez(angulo):
+        m = cv2.getRotationMatrix2D(centro, angulo, 1.0)
+        girada = cv2.warpAffine(tinta, m, (largura, altura), flags=cv2.INTER_NEAREST)
+        perfil = girada.sum(axis=1, dtype=np.float64)
+        return float(np.square(np.diff(perfil)).sum())
+
+    # grosso (0.5 grau) e depois fino (0.1) em volta do melhor
+    melhor = max(np.arange(-ANGULO_MAX, ANGULO_MAX + 0.01, 0.5), key=nitidez)
+    melhor = max(np.arange(melhor - 0.5, melhor + 0.51, 0.1), key=nitidez)
+    return round(float(melhor), 2)
+
+
+def girar(img: np.ndarray, angulo: float) -> np.ndarray:
+    """Gira sem cortar os cantos (a tela cresce e o fundo novo é branco)."""
+    altura, largura = img.shape[:2]
+    m = cv2.getRotationMatrix2D((largura / 2, altura / 2), angulo, 1.0)
+    cos, sen = abs(m[0, 0]), abs(m[0, 1])
+    nova_largura, nova_altura = int(altura * sen + largura * cos), int(altura * cos + largura * sen)
+    m[0, 2] += nova_largura / 2 - largura / 2
+    m[1, 2] += nova_altura / 2 - altura / 2
+    branco = 255 if img.ndim == 2 else (255,) * img.shape[2]
+    return cv2.warpAffine(img, m, (nova_largura, nova_altura), flags=cv2.INTER_CUBIC,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=branco)
+
+
+def altura_texto(cinza: np.ndarray):
+    """Altura mediana (px) dos caracteres, pelos componentes conexos; None se não tem texto suficiente."""
+    reduzida, fator = _reduzida(cinza)
+    # limiar local + mediana: em foto com sombra/granulado o Otsu devolve mais sujeira que letra
+    tinta = cv2.adaptiveThreshold(cv2.medianBlur(reduzida, 3), 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                  cv2.THRESH_BINARY_INV, BLOCO_BINARIZACAO, C_BINARIZACAO)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(tinta, connectivity=8)
+    larguras, alturas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]
+    # tamanho de letra: nem ponto de sujeira, nem linha de tabela, nem palavra grudada
+    letras = (alturas >= 5) & (larguras <= 2 * alturas) & (alturas <= 0.1 * reduzida.shape[0])
+    if letras.sum() < 20:
+        return None
+    return float(np.median(alturas[letras])) / fator
+
+
+def escalar(img: np.ndarray, cinza: np.ndarray, max_bytes: int = None) -> np.ndarray:
+    altura = altura_texto(cinza)
+    if not altura:
+        return img
+    fator = OCR_ALTURA_TEXTO / altura
+    if ESCALA_TOLERANCIA[0] <= fator <= ESCALA_TOLERANCIA[1]:
+        return img
+    fator = min(max(fator, ESCALA_LIMITES[0]), ESCALA_LIMITES[1])
+    max_pixels = MAX_PIXELS
+    if max_bytes:
+        # ampliar nao pode passar da fatia de memoria que a pagina tem (RASTER_MEMORIA_MB)
+        max_pixels = min(max_pixels, max_bytes // (img.shape[2] if img.ndim == 3 else 1))
+    fator = min(fator, (max_pixels / (img.shape[0] * img.shape[1])) ** 0.5)
+    interpolacao = cv2.INTER_AREA if fator < 1 else cv2.INTER_CUBIC
+    return cv2.resize(img, None, fx=fator, fy=fator, interpolation=interpolacao)
+
+
+def tirar_ruido(img: np.ndarray) -> np.ndarray:
+    if img.ndim == 2:
+        return cv2.fastNlMeansDenoising(img, None, h=10, templateWindowSize=7, searchWindowSize=11)
+    return cv2.fastNlMeansDenoisingColored(img, None, 10, 10, 7, 11)
+
+
+def binarizar(cinza: np.ndarray) -> np.ndarray:
+    return cv2.adaptiveThreshold(cinza, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                 BLOCO_BINARIZACAO, C_BINARIZACAO)
+
+
+def preprocessar(imagem, etapas: tuple = None, max_bytes: int = None) -> tuple:
+    """
+    Roda as etapas numa imagem PIL. Devolve (imagem PIL, {etapa: ms}).
+    Sem etapas a imagem volta como veio (nem converte pra numpy).
+    `max_bytes` é o teto da imagem ampliada pela etapa "escala".
+    """
+    etapas = etapas_configuradas() if etapas is None else etapas
+    tempos = {}
+    if not etapas:
+        return imagem, tempos
+
+    img = np.asarray(imagem if imagem.mode in ("L", "RGB") else imagem.convert("RGB"))
+    for etapa in etapas:
+        inicio = time.perf_counter()
+        if etapa == "cinza":
+            img = _cinza(img)
+        elif etapa == "recortar":
+            img = recortar(img, _cinza(img))
+        elif etapa == "deskew":
+            angulo = angulo_inclinacao(_cinza(img))
+            if abs(angulo) >= ANGULO_MIN:
+                img = girar(img, angulo)
+        elif etapa == "ruido":
+            img = tirar_ruido(img)
+        elif etapa == "escala":
+            img = escalar(img, _cinza(img), max_bytes)
+        elif etapa == "binarizar":
+            img = binarizar(_cinza(img))
+        tempos[etapa] = round((time.perf_counter() - inicio) * 1000, 1)
+    return Image.fromarray(img), tempos
+
+
+def somar_tempos(tempos_paginas: list) -> dict:
+    """Soma os {etapa: ms} de várias páginas."""
+    total = {}
+    for tempos in tempos_paginas:
+        for etapa, ms in tempos.items():
+            total[etapa] = round(total.get(etapa, 0.0) + ms, 1)
+    return total
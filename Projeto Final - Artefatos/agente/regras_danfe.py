@@ -0,0 +1,556 @@
+"""
+Leitura da DANFE por regras, antes do LLM.
+
+Boa parte do que o Gemini extrai tem formato fixo no layout padrão da DANFE: chave
+de acesso de 44 dígitos com dígito verificador, CNPJ/CPF com DV, data de emissão,
+o quadro "CÁLCULO DO IMPOSTO" (rótulos numa linha, valores na de baixo) e a tabela
+de produtos com NCM/CST/CFOP. Aqui esses campos saem do texto do OCR por rótulo +
+regex, cada um com uma confiança (0 a 1) que sobe quando uma checagem cruzada fecha:
+- DV da chave e dos CNPJs/CPFs;
+- CNPJ do emitente igual ao de dentro da chave; AAMM da chave igual à data de emissão;
+- qtd x unitário = total em cada item e soma dos itens = "VALOR TOTAL DOS PRODUTOS";
+- total da nota = produtos - desconto + frete + seguro + outras despesas + IPI + ICMS ST.
+
+Se todos os campos obrigatórios (os que a auditoria cobra) saem com confiança >=
+REGRAS_CONFIANCA_MIN, o documento nem vai pro Gemini. Senão só os campos que
+faltaram vão, com o resto já preenchido (`Extracao.complementar` do llm_reparo).
+
+Rótulos de layouts de fornecedor fora do padrão entram por um JSON no
+REGRAS_LAYOUTS: {"valor_total_nota": ["TOTAL A PAGAR"], "data_emissao": [...]},
+com as chaves de ROTULOS ou os campos do quadro de totais (TOTAIS).
+"""
+import json
+import os
+import re
+from datetime import date
+from itertools import cycle
+
+from llm import linhas_compactadas
+from metricas import etapa
+from modelos import TotaisValores
+
+REGRAS_DANFE = os.getenv("REGRAS_DANFE", "1") != "0"
+REGRAS_CONFIANCA_MIN = float(os.getenv("REGRAS_CONFIANCA_MIN", "0.8"))
+REGRAS_LAYOUTS = os.getenv("REGRAS_LAYOUTS", "")
+
+# campo do 1o nivel -> leituras que precisam ter confianca (o resto fica vazio/0 se nao achar, como o LLM faz)
+OBRIGATORIOS = {
+    "numero_controle": ("numero_controle",),
+    "data_emissao": ("data_emissao",),
+    "valor_total_nota": ("valor_total_nota",),
+    "remetente": ("remetente.id_fiscal", "remetente.nome_completo"),
+    "receptor": ("receptor.id_fiscal", "receptor.nome_completo"),
+    "itens": ("itens",),
+}
+CONSUMIDOR = "CONSUMIDOR NAO INFORMADO"  # mesma regra 1 do system_prompt
+MODELOS_CHAVE = {"55": "NF-e", "65": "NFC-e"}
+UFS = "AC AL AP AM BA CE DF ES GO MA MT MS MG PA PB PR PE PI RJ RN RS RO RR SC SP SE TO".split()
+
+# rotulos avulsos (valor na mesma linha depois do rotulo ou na linha de baixo), ja sem acento e em maiusculas
+ROTULOS = {
+    "chave": [r"CHAVE DE ACESSO"],
+    "data_emissao": [r"DATA DA EMISSAO", r"DATA DE EMISSAO", r"DT\.? ?EMISSAO"],
+    "emissao": [r"\bEMISSAO\b"],  # fallback fora do quadro do destinatario (NFC-e: "Emissão: ...")
+    "tipo_operacao": [r"NATUREZA DA OPERACAO", r"NAT\.? ?(?:DA )?OPERACAO"],
+    "nome": [r"NOME ?/ ?RAZAO SOCIAL", r"RAZAO SOCIAL", r"\bNOME\b"],
+    "id_fiscal": [r"CNPJ ?/ ?CPF", r"CPF ?/ ?CNPJ", r"\bCNPJ\b", r"\bCPF\b"],
+    "inscricao_estadual": [r"INSCRICAO ESTADUAL(?! DO SUBST)", r"INSC\.? ?ESTADUAL(?! DO SUBST)", r"\bI\.? ?E\.?(?=[ :]|$)"],
+    "endereco": [r"ENDERECO"],
+    "municipio": [r"MUNICIPIO"],
+}
+
+# quadro "CALCULO DO IMPOSTO", na ordem de prioridade (o mais especifico antes: "ICMS ST" antes de "ICMS").
+# campo None = rotulo que existe no quadro mas nao vai pro modelo (so conta pra posicao dos valores)
+_V = r"(?:VALOR|VLR\.?|V\.)\s?(?:TOTAL\s|TOT\.\s?)?(?:D[OA]S?\s)?"
+_ST = r"\s?(?:S\.?\s?T\.?|SUBST\w*\.?)"
+TOTAIS = [
+    ("_base_st", r"BASE DE CALC(?:ULO|\.)?\s?(?:DO\s)?ICMS" + _ST),
+    ("base_calculo_principal", r"BASE DE CALC(?:ULO|\.)?\s?(?:DO\s)?ICMS"),
+    ("_icms_st", _V + r"ICMS" + _ST),
+    (None, _V + r"ICMS\s?UF\s?(?:REMET|DEST)\w*\.?"),
+    (None, _V + r"FCP(?:\s?UF\s?DEST\w*\.?|" + _ST + r")?"),
+    ("valor_total_principal", _V + r"ICMS"),
+    ("_importacao", _V + r"IMP(?:OSTO|\.)?\s?(?:DE\s)?IMPORT\w*\.?"),
+    ("_produtos", _V + r"PRODUTOS"),
+    ("valor_total_nota", _V + r"(?:NOTA(?:\sFISCAL)?|NF-?E)"),
+    ("_frete", _V + r"FRETE"),
+    ("_seguro", _V + r"SEGURO"),
+    ("_desconto", r"(?:" + _V + r")?DESCONTOS?"),
+    ("valor_outras_despesas", r"OUTRAS\sDESP(?:ESAS)?\.?(?:\sACESS\w*\.?)?"),
+    ("valor_total_adicional", _V + r"IPI"),
+    ("valor_aprox_taxas_total", r"(?:" + _V + r"|V\.?\s?TOT\.?\s?)(?:APROX\w*\.?\s?)?(?:DOS\s)?TRIB\w*\.?"),
+    ("valor_total_contribuicao_a", _V + r"PIS"),
+    ("valor_total_contribuicao_b", _V + r"COFINS"),
+]
+_N_TOTAIS = len(TOTAIS)  # os do REGRAS_LAYOUTS entram antes destes
+
+_SEM_ACENTO = str.maketrans("ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇáàâãäéèêëíìîïóòôõöúùûüçºª°", "AAAAAEEEEIIIIOOOOOUUUUCaaaaaeeeeiiiiooooouuuucOAO")
+
+_CHAVE = re.compile(r"(?<!\d)((?:\d{4}[ .]?){10}\d{4})(?!\d)")
+_CNPJ = re.compile(r"(?<![\d./-])(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})(?![\d/-])")
+_CPF = re.compile(r"(?<![\d./-])(\d{3}\.?\d{3}\.?\d{3}-?\d{2})(?![\d/-])")
+_DATA = re.compile(r"(?<!\d)(\d{2})[/.-](\d{2})[/.-](\d{4})(?!\d)")
+_VALOR = re.compile(r"(?<![\d.,])(?:\d{1,3}(?:\.\d{3})+|\d+),\d{2}(?![\d,])")
+_IE = re.compile(r"(?<![\d(./-])(\d[\d.]{6,16}\d)(?![\d)/-])|\bISENTO\b")
+_UF = re.compile(r"\b(" + "|".join(UFS) + r")\b")
+# onde comeca CNPJ, data, CEP, telefone... ou o proximo "ROTULO:" na mesma linha
+_CORTE = re.compile(r"\s+(?=\(?\d[\d.\-/() ]{4,})|\s+(?=(?:UF|CEP|FONE|BAIRRO|IE|CNPJ|CPF|INSC\w*\.?(?: ESTADUAL)?)\s?:)")
+_SUFIXO_EMPRESA = re.compile(r"\b(?:LTDA|S\.? ?A\.?|S/A|EIRELI|ME|EPP|MEI|COMERCIO|INDUSTRIA|CIA)\b")
+_CANHOTO = re.compile(r"RECEBEMOS DE (.+?) OS? (?:PRODUTOS|SERVICOS|MERCADORIAS)")
+_CONSUMIDOR = re.compile(r"CONSUMIDOR NAO (?:IDENTIFICADO|INFORMADO)")
+_SECAO_DEST = re.compile(r"DESTINATARIO ?/ ?REMETENTE|^(?:DADOS DO )?DESTINATARIO\b")
+_FIM_DEST = re.compile(r"^(?:FATURA|DUPLICATA|CALCULO DO IMPOSTO|TRANSPORTADOR|DADOS D[OE]S? PRODUTOS?|LOCAL DE)")
+_ROTULO_SEGUINTE = re.compile(r"^[\s:|-]*(?:PROTOCOLO|INSC|CNPJ|CPF|DATA|FONE|CEP|BAIRRO|UF\b|HORA|MUNICIPIO|ENDERECO|NOME|RAZAO)")
+_NAO_NOME = re.compile(r"RECEBEMOS|DANFE|DOCUMENTO AUXILIAR|CHAVE|NF-?E\b|IDENTIFICACAO|EMITENTE|DATA DE RECEB|SERIE|FOLHA")
+_ITEM = re.compile(
+    r"^(?P<codigo>\S+)\s+(?P<descricao>.+?)\s+(?P<ncm>\d{8}|\d{4}\.\d{2}\.\d{2})\s+(?P<cst>\d{2,4})\s+"
+    r"(?P<cfop>[1-7]\d{3})\s+(?P<un>[A-Z][A-Z0-9]{0,5})\s+(?P<qtd>\d[\d.]*(?:,\d{1,4})?)\s+"
+    r"(?P<unit>\d[\d.]*,\d{2,10})\s+(?P<total>\d[\d.]*,\d{2})(?![\d,])")
+
+
+def _carregar_layouts():
+    """Rótulos extras do REGRAS_LAYOUTS (entram antes dos padrão)."""
+    global _REGEX_TOTAIS, _CAMPOS_TOTAIS, _TEM_TOTAL
+    if REGRAS_LAYOUTS:
+        with open(REGRAS_LAYOUTS, encoding="utf-8") as f:
+            extras = json.load(f)
+        campos_totais = {campo for campo, _ in TOTAIS}
+        for chave, padroes in extras.items():
+            padroes = [p.translate(_SEM_ACENTO).upper() for p in padroes]
+            if chave in ROTULOS:
+                ROTULOS[chave] = padroes + ROTULOS[chave]
+            elif chave in campos_totais:
+                TOTAIS[:0] = [(chave, p) for p in padroes]
+            else:
+                raise ValueError(f"REGRAS_LAYOUTS: rótulo desconhecido {chave!r}")
+    # uma regex so com um grupo por rotulo: na mesma posicao a alternativa que vem antes ganha.
+    # _TEM_TOTAL e o filtro barato: toda linha com algum rotulo do quadro tem uma dessas palavras
+    _REGEX_TOTAIS = re.compile("|".join(f"(?P<t{i}>{padrao})" for i, (_, padrao) in enumerate(TOTAIS)))
+    _CAMPOS_TOTAIS = {f"t{i}": campo for i, (campo, _) in enumerate(TOTAIS)}
+    extras = [padrao for _, padrao in TOTAIS[:len(TOTAIS) - _N_TOTAIS]]
+    _TEM_TOTAL = re.compile("|".join([r"VALOR|VLR|V\.|BASE|DESC|OUTRAS|TRIB"] + extras))
+
+
+_carregar_layouts()
+_REGEX_ROTULOS = {nome: re.compile("|".join(padroes)) for nome, padroes in ROTULOS.items()}
+
+
+# --- digitos verificadores ---
+
+def _dv_mod11(digitos: str, pesos) -> int:
+    resto = sum(int(d) * p for d, p in zip(digitos, pesos)) % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def digito_chave(base: str) -> str:
+    """DV da chave de acesso a partir dos 43 primeiros dígitos (pesos 2..9 da direita pra esquerda)."""
+    return str(_dv_mod11(base[::-1], cycle(range(2, 10))))
+
+
+def digitos_cnpj(base: str) -> str:
+    """Os 2 DVs do CNPJ a partir dos 12 primeiros dígitos."""
+    d1 = _dv_mod11(base, (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+    d2 = _dv_mod11(base + str(d1), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+    return f"{d1}{d2}"
+
+
+def chave_valida(chave: str) -> bool:
+    return len(chave) == 44 and chave.isdigit() and digito_chave(chave[:43]) == chave[43]
+
+
+def cnpj_valido(cnpj: str) -> bool:
+    return len(cnpj) == 14 and cnpj.isdigit() and cnpj != cnpj[0] * 14 and digitos_cnpj(cnpj[:12]) == cnpj[12:]
+
+
+def cpf_valido(cpf: str) -> bool:
+    if len(cpf) != 11 or not cpf.isdigit() or cpf == cpf[0] * 11:
+        return False
+    d1 = _dv_mod11(cpf[:9], range(10, 1, -1))
+    return cpf[9:] == f"{d1}{_dv_mod11(cpf[:9] + str(d1), range(11, 1, -1))}"
+
+
+def chave_no_texto(texto: str) -> str:
+    """1a chave de acesso com DV válido no texto (sem a leitura inteira: é o que o repositório usa pra achar duplicata)."""
+    for m in _CHAVE.finditer(texto):
+        chave = _digitos(m.group(1))
+        if chave_valida(chave):
+            return chave
+    return None
+
+
+# --- leitura ---
+
+def _digitos(texto: str) -> str:
+    return re.sub(r"\D", "", texto)
+
+
+def _numero_br(texto: str) -> float:
+    return float(texto.replace(".", "").replace(",", "."))
+
+
+class _Texto:
+    """Linhas compactadas do OCR + a versão sem acento/maiúscula (mesmo tamanho) onde as regex rodam."""
+
+    def __init__(self, texto: str):
+        self.linhas = linhas_compactadas(texto)
+        self.norm = [linha.translate(_SEM_ACENTO).upper() for linha in self.linhas]
+
+    def original(self, i: int, inicio: int, fim: int = None) -> str:
+        # upper() pode mudar o tamanho de algum caractere raro; ai fica o normalizado mesmo
+        linha = self.linhas[i] if len(self.linhas[i]) == len(self.norm[i]) else self.norm[i]
+        return linha[inicio:fim].strip(" :-|")
+
+    def achar(self, padrao, inicio: int = 0, fim: int = None) -> int:
+        """Índice da 1a linha em [inicio, fim) onde `padrao` casa, ou None."""
+        for i in range(inicio, len(self.norm) if fim is None else min(fim, len(self.norm))):
+            if padrao.search(self.norm[i]):
+                return i
+        return None
+
+    def valor(self, rotulo: str, regex, inicio: int = 0, fim: int = None, grupo: int = 0):
+        """
+        (texto, i da linha, posição) do 1o `regex` depois do rótulo, na mesma linha ou
+        na de baixo. Na linha de baixo só vale se tiver um valor só daquele tipo
+        (linha de valores de um quadro com vários rótulos). None se não achar.
+        """
+        padrao = _REGEX_ROTULOS[rotulo]
+        fim = len(self.norm) if fim is None else min(fim, len(self.norm))
+        for i in range(inicio, fim):
+            m = padrao.search(self.norm[i])
+            if not m:
+                continue
+            v = regex.search(self.norm[i], m.end())
+            if v:
+                return v.group(grupo), i, v.start(grupo)
+            if i + 1 < len(self.norm):
+                achados = list(regex.finditer(self.norm[i + 1]))
+                if len(achados) == 1:
+                    return achados[0].group(grupo), i + 1, achados[0].start(grupo)
+        return None
+
+    def texto_rotulo(self, rotulo: str, inicio: int = 0, fim: int = None):
+        """Texto livre depois do rótulo (mesma linha) ou o começo da linha de baixo, até o 1o número longo."""
+        padrao = _REGEX_ROTULOS[rotulo]
+        fim = len(self.norm) if fim is None else min(fim, len(self.norm))
+        for i in range(inicio, fim):
+            m = padrao.search(self.norm[i])
+            if not m:
+                continue
+            resto = self.norm[i][m.end():]
+            if re.search(r"[A-Z]{2}", _CORTE.split(resto, 1)[0]) and not _ROTULO_SEGUINTE.match(resto):
+                return self.original(i, m.end(), m.end() + len(_CORTE.split(resto, 1)[0]))
+            if i + 1 < len(self.norm):
+                corte = _CORTE.split(self.norm[i + 1], 1)[0]
+                if re.search(r"[A-Z]{2}", corte):
+                    return self.original(i + 1, 0, len(corte))
+        return None
+
+
+def _chave(t: _Texto):
+    achado = t.valor("chave", _CHAVE)
+    candidatos = [achado[0]] if achado else []
+    if not candidatos:
+        candidatos = [m.group(1) for linha in t.norm for m in _CHAVE.finditer(linha)]
+    for candidato in candidatos:
+        chave = _digitos(candidato)
+        if chave_valida(chave):
+            return chave, 1.0
+    # 44 digitos com DV errado: o OCR trocou algum digito, melhor o LLM olhar
+    return (_digitos(candidatos[0]), 0.4) if candidatos else (None, 0.0)
+
+
+def _ids_fiscais(linha: str) -> list:
+    """CNPJs/CPFs da linha: [(digitos, DV confere)] na ordem em que aparecem."""
+    achados = sorted([(m.start(), _digitos(m.group(1)), cnpj_valido) for m in _CNPJ.finditer(linha)] +
+                     [(m.start(), _digitos(m.group(1)), cpf_valido) for m in _CPF.finditer(linha)])
+    return [(digitos, valido(digitos)) for _, digitos, valido in achados]
+
+
+def _id_fiscal(t: _Texto, inicio: int, fim: int):
+    """(id, confiança) do participante no trecho: o do rótulo CNPJ/CPF, senão o 1o com DV certo."""
+    achado = t.valor("id_fiscal", re.compile(f"{_CNPJ.pattern}|{_CPF.pattern}"), inicio, fim)
+    if achado:
+        digitos = _digitos(achado[0])
+        if cnpj_valido(digitos) or cpf_valido(digitos):
+            return digitos, 1.0
+    for i in range(inicio, min(fim, len(t.norm))):
+        for digitos, valido in _ids_fiscais(t.norm[i]):
+            if valido:
+                return digitos, 0.9
+    return (_digitos(achado[0]), 0.4) if achado else (None, 0.0)
+
+
+def _emitente(t: _Texto, fim: int, chave: str, conf_chave: float) -> tuple:
+    """(participante, confianças) do emitente, no trecho antes do quadro do destinatário."""
+    conf = {}
+    ids = [(d, ok) for i in range(fim) for d, ok in _ids_fiscais(t.norm[i])]
+    cnpj_chave = chave[6:20] if chave and conf_chave == 1.0 else None
+    if cnpj_chave and any(d == cnpj_chave for d, _ in ids):
+        id_fiscal, conf["id_fiscal"] = cnpj_chave, 1.0
+    elif cnpj_chave and cnpj_valido(cnpj_chave):
+        id_fiscal, conf["id_fiscal"] = cnpj_chave, 0.9  # a chave tem o CNPJ do emitente dentro
+    elif cnpj_chave and cnpj_chave.startswith("000") and cpf_valido(cnpj_chave[3:]):
+        id_fiscal, conf["id_fiscal"] = cnpj_chave[3:], 0.9  # emitente pessoa fisica
+    else:
+        validos = [d for d, ok in ids if ok]
+        id_fiscal, conf["id_fiscal"] = (validos[0], 0.85) if validos else ((ids[0][0], 0.4) if ids else ("", 0.0))
+
+    # nome: o canhoto ("RECEBEMOS DE ... OS PRODUTOS") tem a razao social inteira; senao a 1a linha de empresa
+    nome, linha_nome = "", None
+    for i, linha in enumerate(t.norm):
+        m = _CANHOTO.search(linha)
+        if m:
+            nome, conf["nome_completo"] = t.original(i, m.start(1), m.end(1)), 0.9
+            break
+    for i in range(fim):
+        linha = t.norm[i]
+        if (re.search(r"[A-Z]{3}", linha) and not _NAO_NOME.search(linha) and not _REGEX_TOTAIS.search(linha)
+                and not any(p.search(linha) for p in _REGEX_ROTULOS.values())):
+            linha_nome = i
+            if not nome:
+                nome = t.original(i, 0)
+                conf["nome_completo"] = 0.9 if _SUFIXO_EMPRESA.search(linha) else 0.6
+            break
+
+    # endereco: as linhas logo depois do nome, ate o quadro da DANFE
+    endereco = []
+    if linha_nome is not None:
+        for i in range(linha_nome + 1, min(linha_nome + 3, fim)):
+            if _NAO_NOME.search(t.norm[i]) or any(p.search(t.norm[i]) for p in _REGEX_ROTULOS.values()):
+                break
+            endereco.append(t.original(i, 0))
+    if endereco:
+        conf["endereco_completo"] = 0.7
+
+    ie = t.valor("inscricao_estadual", _IE, 0, fim)
+    if ie and ie[0] != "ISENTO" and _digitos(ie[0]) == id_fiscal:
+        ie = None
+    if ie:
+        conf["inscricao_estadual"] = 0.8
+    participante = {"id_fiscal": id_fiscal, "nome_completo": nome, "endereco_completo": " - ".join(endereco),
+                    "inscricao_estadual": ie[0] if ie else ""}
+    return participante, conf
+
+
+def _destinatario(t: _Texto, inicio: int, fim: int) -> tuple:
+    """(participante, confianças) do quadro DESTINATÁRIO / REMETENTE."""
+    conf = {}
+    id_fiscal, conf["id_fiscal"] = _id_fiscal(t, inicio, fim)
+    nome = t.texto_rotulo("nome", inicio, fim) or ""
+    if nome:
+        conf["nome_completo"] = 0.9
+
+    endereco = t.texto_rotulo("endereco", inicio, fim) or ""
+    municipio = t.texto_rotulo("municipio", inicio, fim) or ""
+    uf = t.valor("municipio", _UF, inicio, fim)
+    if uf and municipio.upper().endswith(" " + uf[0]):
+        municipio = municipio[:-3].rstrip(" -/")  # "SAO PAULO SP" quando a UF vem antes do telefone
+    local = "/".join(p for p in (municipio, uf[0] if uf else "") if p)
+    endereco_completo = " - ".join(p for p in (endereco, local) if p)
+    if endereco_completo:
+        conf["endereco_completo"] = 0.7
+
+    ie = t.valor("inscricao_estadual", _IE, inicio, fim)
+    if ie:
+        conf["inscricao_estadual"] = 0.8
+    participante = {"id_fiscal": id_fiscal or "", "nome_completo": nome, "endereco_completo": endereco_completo,
+                    "inscricao_estadual": ie[0] if ie else ""}
+    return participante, conf
+
+
+def _data(texto: str):
+    dia, mes, ano = (int(p) for p in _DATA.search(texto).groups())
+    try:
+        return date(ano, mes, dia)
+    except ValueError:
+        return None
+
+
+def _data_emissao(t: _Texto, inicio: int, fim: int, chave: str) -> tuple:
+    achado = t.valor("data_emissao", _DATA, inicio, fim) if inicio is not None else None
+    conf = 0.9
+    if not achado:
+        achado = t.valor("data_emissao", _DATA) or t.valor("emissao", _DATA)
+        conf = 0.85
+    data = _data(achado[0]) if achado else None
+    if data is None:
+        return "", 0.0
+    if chave:
+        # a chave tem AAMM da emissao nas posicoes 3-6
+        conf = 1.0 if chave[2:6] == data.strftime("%y%m") else 0.5
+    return data.strftime("%d-%m-%Y"), conf
+
+
+def _totais(t: _Texto) -> dict:
+    """
+    {campo: valor} do quadro de totais. Cada rótulo pega o valor que vem logo depois
+    dele na mesma linha; se a linha for só de rótulos, os valores da linha de baixo
+    são distribuídos na ordem, e só se a quantidade bater com a de rótulos.
+    """
+    totais = {}
+    for i, linha in enumerate(t.norm):
+        if not _TEM_TOTAL.search(linha):
+            continue  # a regex grande custa caro linha a linha (tabela de itens de 1000 linhas)
+        rotulos = [(m.start(), m.end(), _CAMPOS_TOTAIS[m.lastgroup]) for m in _REGEX_TOTAIS.finditer(linha)]
+        if not rotulos:
+            continue
+        fins = [r[0] for r in rotulos[1:]] + [len(linha)]
+        na_linha = [_VALOR.search(linha, r[1], f) for r, f in zip(rotulos, fins)]
+        if all(na_linha):
+            valores = [v.group(0) for v in na_linha]
+        elif not any(na_linha) and i + 1 < len(t.norm) and not _REGEX_TOTAIS.search(t.norm[i + 1]):
+            valores = [v.group(0) for v in _VALOR.finditer(t.norm[i + 1])]
+            if len(valores) != len(rotulos):
+                continue  # coluna que nao reconheci: sem saber a posicao, melhor nao chutar
+        else:
+            valores = [v.group(0) if v else None for v in na_linha]
+        for (_, _, campo), valor in zip(rotulos, valores):
+            if campo and valor is not None and campo not in totais:
+                totais[campo] = _numero_br(valor)
+    return totais
+
+
+def _itens(t: _Texto) -> tuple:
+    """(itens, confiança de cada um) das linhas da tabela de produtos."""
+    cabecalho = t.achar(re.compile(r"CFOP"))
+    itens, confs = [], []
+    if cabecalho is None:
+        return itens, confs
+    for i in range(cabecalho + 1, len(t.norm)):
+        m = _ITEM.match(t.norm[i])
+        if not m:
+            continue
+        qtd, unit, total = _numero_br(m["qtd"]), _numero_br(m["unit"]), _numero_br(m["total"])
+        casas = len(m["unit"].rsplit(",", 1)[1])
+        # o unitario impresso e arredondado: qtd x unit pode errar ate qtd x meia casa
+        confs.append(1.0 if abs(qtd * unit - total) <= 0.011 + qtd * 0.5 * 10 ** -casas else 0.5)
+        itens.append({
+            "descricao": t.original(i, m.start("descricao"), m.end("descricao")).rstrip(" .-_|"),
+            "quantidade": qtd, "valor_unitario": unit, "valor_total": total,
+            "codigo_operacao": m["cfop"], "codigo_tributario": m["cst"], "valor_aprox_taxas": 0.0,
+        })
+    return itens, confs
+
+
+def _perto(a: float, b: float, tolerancia: float = 0.011) -> bool:
+    return abs(a - b) <= tolerancia
+
+
+def extrair_por_regras(texto: str, minimo: float = None) -> dict:
+    """
+    Lê o texto OCR de uma DANFE por regras. Devolve:
+    - "documento": dict no formato DocumentoProcessado (o que não achou fica vazio/0);
+    - "confianca": {"numero_controle": 1.0, "remetente.id_fiscal": 0.9, ..., "itens": 1.0};
+    - "faltando": {campo do 1o nível: motivo} dos obrigatórios abaixo de `minimo`;
+    - "completo": nada faltando (o documento pode ir direto, sem LLM).
+    """
+    minimo = REGRAS_CONFIANCA_MIN if minimo is None else minimo
+    t = _Texto(texto)
+    conf = {}
+
+    chave, conf["numero_controle"] = _chave(t)
+    inicio_dest = t.achar(_SECAO_DEST)
+    fim_dest = t.achar(_FIM_DEST, inicio_dest + 1) if inicio_dest is not None else None
+    cabecalho_itens = t.achar(re.compile(r"CFOP"))
+    fim_emitente = next((i for i in (inicio_dest, cabecalho_itens) if i is not None), len(t.norm))
+
+    remetente, conf_rem = _emitente(t, fim_emitente, chave, conf["numero_controle"])
+    conf.update({f"remetente.{k}": v for k, v in conf_rem.items()})
+
+    if inicio_dest is not None:
+        fim_dest = fim_dest if fim_dest is not None else min(inicio_dest + 15, len(t.norm))
+        receptor, conf_rec = _destinatario(t, inicio_dest + 1, fim_dest)
+    else:
+        receptor, conf_rec = {"id_fiscal": "", "nome_completo": "", "endereco_completo": "",
+                              "inscricao_estadual": ""}, {}
+    if not receptor["id_fiscal"] and any(_CONSUMIDOR.search(linha) for linha in t.norm):
+        receptor.update(id_fiscal=CONSUMIDOR, nome_completo=CONSUMIDOR)
+        conf_rec.update(id_fiscal=1.0, nome_completo=1.0)
+    conf.update({f"receptor.{k}": v for k, v in conf_rec.items()})
+
+    data_emissao, conf["data_emissao"] = _data_emissao(t, inicio_dest, fim_dest, chave if conf["numero_controle"] == 1.0 else None)
+
+    natureza = t.texto_rotulo("tipo_operacao")
+    if natureza:
+        conf["tipo_operacao"] = 0.9
+
+    totais = _totais(t)
+    itens, conf_itens = _itens(t)
+    soma_itens = round(sum(item["valor_total"] for item in itens), 2)
+
+    # itens: a soma bater com o total dos produtos (ou da nota) garante que nenhuma linha se perdeu
+    if not itens:
+        conf["itens"] = 0.0
+    elif "_produtos" in totais and _perto(soma_itens, totais["_produtos"]):
+        conf["itens"] = 1.0
+    elif "_produtos" not in totais and "valor_total_nota" in totais and _perto(soma_itens, totais["valor_total_nota"]):
+        conf["itens"] = 0.95
+    else:
+        conf["itens"] = min(0.5, sum(conf_itens) / len(conf_itens))
+
+    if "valor_total_nota" in totais:
+        # total = produtos - desconto + frete + seguro + outras + IPI + ICMS ST (+ II)
+        produtos = totais.get("_produtos", soma_itens if conf["itens"] >= minimo else None)
+        if produtos is not None:
+            calculado = (produtos - totais.get("_desconto", 0.0) + totais.get("_frete", 0.0) + totais.get("_seguro", 0.0)
+                         + totais.get("valor_outras_despesas", 0.0) + totais.get("valor_total_adicional", 0.0)
+                         + totais.get("_icms_st", 0.0) + totais.get("_importacao", 0.0))
+            conf["valor_total_nota"] = 1.0 if _perto(calculado, totais["valor_total_nota"]) else 0.85
+        else:
+            conf["valor_total_nota"] = 0.85
+    else:
+        conf["valor_total_nota"] = 0.0
+
+    modelo = MODELOS_CHAVE.get(chave[20:22], "") if chave and conf["numero_controle"] == 1.0 else ""
+    if not modelo and any("DANFE" in linha for linha in t.norm[:fim_emitente + 1]):
+        modelo = "NF-e"
+    documento = {
+        "numero_controle": chave or "",
+        "modelo_documento": modelo,
+        "data_emissao": data_emissao,
+        "valor_total_nota": totais.get("valor_total_nota", 0.0),
+        "tipo_operacao": natureza or "",
+        "remetente": remetente,
+        "receptor": receptor,
+        "totais_valores": {c: totais.get(c, 0.0) for c in TotaisValores.model_fields},
+        "itens": itens,
+    }
+
+    faltando = {}
+    for campo, leituras in OBRIGATORIOS.items():
+        pior = min(conf.get(leitura, 0.0) for leitura in leituras)
+        if pior < minimo:
+            faltando[campo] = "não encontrado pela leitura por regras" if pior == 0.0 else \
+                f"leitura por regras com confiança baixa ({pior:.2f})"
+    return {"documento": documento, "confianca": {k: round(v, 2) for k, v in conf.items()},
+            "faltando": faltando, "completo": not faltando}
+
+
+def ler_por_regras(text_to_analyze: str):
+    """`extrair_por_regras` medido na etapa "regras"; None com REGRAS_DANFE=0."""
+    if not REGRAS_DANFE:
+        return None
+    with etapa("regras"):
+        return extrair_por_regras(text_to_analyze)
+
+
+def campos_para_llm(resultado, text_to_analyze: str):
+    """
+    O que ainda tem que ir pro LLM depois da leitura por regras:
+    {} = nada (documento completo); {campo: [motivo]} = só esses campos, por cima do
+    documento das regras (`Extracao.complementar`); None = extração inteira (regras
+    desligadas, não parece DANFE, faltou mais da metade dos obrigatórios, ou faltam os
+    itens de um documento que iria em blocos).
+    """
+    from llm_blocos import precisa_blocos
+
+    if resultado is None:
+        return None
+    faltando = resultado["faltando"]
+    if not faltando:
+        return {}
+    if not resultado["documento"]["modelo_documento"] or len(faltando) > len(OBRIGATORIOS) // 2:
+        return None  # leu pouca coisa: nao da pra confiar que e DANFE no layout esperado
+    if "itens" in faltando and precisa_blocos(text_to_analyze):
+        return None  # os blocos em paralelo ganham de um pedido unico com a lista inteira
+    return {campo: [motivo] for campo, motivo in faltando.items()}
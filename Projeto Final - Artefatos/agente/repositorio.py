@@ -0,0 +1,414 @@
+"""
+Repositório persistente dos documentos processados (SQLite), com os itens.
+
+O cache de resultados (cache.py) só responde "esse mesmo arquivo já passou?" e
+despeja por LRU. Aqui fica o acervo: um registro por documento, indexado pela
+chave de acesso (44 dígitos), CNPJ/CPF do emitente e do destinatário, data de
+emissão e CFOP dos itens, pra consulta filtrada em centenas de milhares de notas.
+
+Deduplicação antes do trabalho caro:
+- o sha256 de cada arquivo recebido fica ligado ao documento (`por_arquivo`):
+  reenvio do mesmo arquivo não roda OCR nem LLM;
+- a chave de acesso (`por_chave`): a mesma NF-e que chega como XML e depois como
+  PDF (ou o contrário) é um documento só. Do PDF a chave sai do texto (nativo ou
+  OCR) antes do LLM.
+Os dois atalhos levam a versão do pipeline + modelo (o fim da `chave_documento`
+do cache): documento lido por uma versão anterior do prompt/parser ou por outro
+modelo não volta, o arquivo é processado de novo e o registro é atualizado. O
+documento do XML não depende do LLM e vale pela chave em qualquer versão.
+
+O XML vale mais que a leitura de PDF/imagem: se a mesma chave chega pelos dois,
+fica o documento do XML (PRIORIDADE_ORIGEM) e o outro arquivo só é ligado a ele.
+
+Datas ficam em ISO (AAAA-MM-DD) e CNPJ/CPF só com dígitos nas colunas de
+consulta; o documento inteiro (e o texto do OCR, pra auditoria) vai compactado.
+
+Consulta pela linha de comando (da pasta agente):
+    python repositorio.py --emitente 12.345.678/0001-99 --de 01-01-2024 --ate 31-03-2024
+    python repositorio.py --cfop 5405 --limite 20 --completo
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from cache import CACHE_DIR
+
+REPOSITORIO = os.getenv("REPOSITORIO", "1") != "0"
+REPOSITORIO_ARQUIVO = os.getenv("REPOSITORIO_ARQUIVO", "") or os.path.join(CACHE_DIR, "documentos.sqlite3")
+
+PRIORIDADE_ORIGEM = {"XML": 2, "LLM/OCR": 1}
+LIMITE_CONSULTA = 100
+_COLUNAS_RESUMO = ("id", "chave_acesso", "origem", "modelo", "data_emissao", "emitente", "emitente_nome",
+                   "destinatario", "destinatario_nome", "valor_total", "qtd_itens", "atualizado")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    chave_acesso TEXT UNIQUE,
+    origem TEXT NOT NULL,
+    modelo TEXT,
+    data_emissao TEXT,
+    emitente TEXT,
+    emitente_nome TEXT,
+    destinatario TEXT,
+    destinatario_nome TEXT,
+    valor_total REAL,
+    qtd_itens INTEGER NOT NULL,
+    documento BLOB NOT NULL,
+    texto BLOB,
+    versao TEXT,
+    criado REAL NOT NULL,
+    atualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documentos_emitente ON documentos(emitente, data_emissao);
+CREATE INDEX IF NOT EXISTS documentos_destinatario ON documentos(destinatario, data_emissao);
+CREATE INDEX IF NOT EXISTS documentos_data ON documentos(data_emissao);
+CREATE TABLE IF NOT EXISTS itens (
+    documento_id INTEGER NOT NULL,
+    indice INTEGER NOT NULL,
+    cfop TEXT,
+    cst TEXT,
+    descricao TEXT,
+    quantidade REAL,
+    valor_unitario REAL,
+    valor_total REAL,
+    PRIMARY KEY (documento_id, indice)
+) WITHOUT ROWID;
+-- CFOPs distintos de cada documento, na ordem da listagem: "notas com CFOP x" anda
+-- no indice ja na ordem de data, seja o CFOP raro ou presente em metade das notas.
+-- Tabela com rowid (e nao WITHOUT ROWID com a data na chave primaria) porque a data
+-- pode ser NULL: o LLM as vezes devolve data vazia ou num formato que nao reconhecemos
+CREATE TABLE IF NOT EXISTS cfops (
+    cfop TEXT NOT NULL,
+    data_emissao TEXT,
+    documento_id INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS cfops_data ON cfops(cfop, data_emissao, documento_id);
+CREATE TABLE IF NOT EXISTS arquivos (
+    hash TEXT PRIMARY KEY,
+    documento_id INTEGER NOT NULL,
+    nome TEXT,
+    recebido REAL NOT NULL,
+    versao TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS arquivos_documento ON arquivos(documento_id);
+"""
+
+
+def hash_arquivo(conteudo: bytes) -> str:
+    """sha256 dos bytes (o mesmo do começo da `chave_documento` do cache)."""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def chave_acesso(numero_controle) -> str:
+    """Os 44 dígitos da chave de acesso, ou None se o número de controle não for uma."""
+    digitos = re.sub(r"\D", "", str(numero_controle or ""))
+    return digitos if len(digitos) == 44 else None
+
+
+def id_fiscal(valor) -> str:
+    """CNPJ/CPF só com dígitos (o resto, tipo CONSUMIDOR NAO INFORMADO, fica como veio)."""
+    valor = str(valor or "").strip()
+    digitos = re.sub(r"\D", "", valor)
+    return digitos if len(digitos) in (11, 14) else valor or None
+
+
+def data_iso(data) -> str:
+    """DD-MM-AAAA / DD/MM/AAAA / AAAA-MM-DD -> AAAA-MM-DD (None se não reconhecer)."""
+    data = str(data or "").strip()
+    m = re.match(r"(\d{4})-(\d{2})-(\d{2})", data)
+    if m:
+        return m.group(0)
+    m = re.match(r"(\d{2})[-/.](\d{2})[-/.](\d{4})", data)
+    return f"{m.group(3)}-{m.group(2)}-{m.group(1)}" if m else None
+
+
+def _numero(valor):
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def _compactar(valor) -> bytes:
+    return zlib.compress(json.dumps(valor, ensure_ascii=False).encode("utf-8"), 3)
+
+
+def _descompactar(dados: bytes):
+    return json.loads(zlib.decompress(dados)) if dados is not None else None
+
+
+class Repositorio:
+    """Documentos + itens + arquivos recebidos num SQLite (WAL, uma conexão por thread)."""
+
+    def __init__(self, caminho: str = None):
+        self.caminho = caminho or REPOSITORIO_ARQUIVO
+        self._local = threading.local()
+        conn = self._conexao()
+        self._migrar(conn)
+        conn.executescript(_ESQUEMA)
+
+    @staticmethod
+    def _pendencias(conn) -> list:
+        """O que falta num banco criado por uma versão anterior do esquema."""
+        pendencias = []
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cfops'").fetchone()
+        if row is not None and "WITHOUT ROWID" in row[0]:
+            pendencias.append("cfops")  # data NOT NULL pela chave primaria
+        for tabela in ("documentos", "arquivos"):
+            colunas = {c[1] for c in conn.execute(f"PRAGMA table_info({tabela})")}
+            if colunas and "versao" not in colunas:
+                pendencias.append(tabela)
+        return pendencias
+
+    def _migrar(self, conn):
+        """Bancos antigos: cfops WITHOUT ROWID vira a tabela nova e documentos/arquivos ganham a versão."""
+        if not self._pendencias(conn):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # confere de novo com a trava: outro processo pode ter migrado enquanto isso
+            for pendencia in self._pendencias(conn):
+                if pendencia == "cfops":
+                    conn.execute("ALTER TABLE cfops RENAME TO cfops_antiga")
+                    conn.execute("CREATE TABLE cfops (cfop TEXT NOT NULL, data_emissao TEXT,"
+                                 " documento_id INTEGER NOT NULL)")
+                    conn.execute("INSERT INTO cfops SELECT cfop, data_emissao, documento_id FROM cfops_antiga")
+                    conn.execute("DROP TABLE cfops_antiga")
+                else:
+                    # linha antiga fica sem versao: nao serve de atalho e e refeita no proximo envio
+                    conn.execute(f"ALTER TABLE {pendencia} ADD COLUMN versao TEXT")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # depois de um fork o filho precisa abrir a propria conexao
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- deduplicacao ---
+
+    def _registro(self, where: str, *parametros) -> dict:
+        row = self._conexao().execute(
+            f"SELECT d.id, d.chave_acesso, d.origem, d.documento, d.texto FROM documentos d {where}", parametros
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "chave_acesso": row[1], "origem": row[2], "documento": _descompactar(row[3]),
+                "texto": zlib.decompress(row[4]).decode("utf-8") if row[4] is not None else None}
+
+    def por_arquivo(self, hash_conteudo: str, versao: str) -> dict:
+        """
+        {"id", "chave_acesso", "origem", "documento", "texto"} do arquivo já recebido
+        nesta `versao` do pipeline, ou None.
+        """
+        return self._registro("JOIN arquivos a ON a.documento_id = d.id WHERE a.hash = ? AND a.versao = ?",
+                              hash_conteudo, versao)
+
+    def por_chave(self, chave: str, versao: str) -> dict:
+        """Mesmo formato do `por_arquivo`, pela chave de acesso (documento do XML ou desta `versao`)."""
+        chave = chave_acesso(chave)
+        if not chave:
+            return None
+        return self._registro("WHERE d.chave_acesso = ? AND (d.origem = 'XML' OR d.versao = ?)", chave, versao)
+
+    def vincular(self, hash_conteudo: str, documento_id: int, nome: str = None, versao: str = None):
+        """Liga mais um arquivo (ex.: o PDF de uma NF-e que já veio em XML) a um documento."""
+        self._conexao().execute(
+            "INSERT OR REPLACE INTO arquivos (hash, documento_id, nome, recebido, versao) VALUES (?, ?, ?, ?, ?)",
+            (hash_conteudo, documento_id, nome, time.time(), versao))
+
+    # --- gravacao ---
+
+    def _gravar(self, conn, documento: dict, origem: str, hash_conteudo, nome, texto, versao=None) -> int:
+        chave = chave_acesso(documento.get("numero_controle"))
+        existente = conn.execute("SELECT id, origem FROM documentos WHERE chave_acesso = ?",
+                                 (chave,)).fetchone() if chave else None
+        agora = time.time()
+        if existente and PRIORIDADE_ORIGEM.get(origem, 0) < PRIORIDADE_ORIGEM.get(existente[1], 0):
+            documento_id = existente[0]  # ja tem a versao do XML: so liga o arquivo
+        else:
+            remetente, receptor = documento.get("remetente") or {}, documento.get("receptor") or {}
+            itens = documento.get("itens") or []
+            colunas = (chave, origem, documento.get("modelo_documento"), data_iso(documento.get("data_emissao")),
+                       id_fiscal(remetente.get("id_fiscal")), remetente.get("nome_completo"),
+                       id_fiscal(receptor.get("id_fiscal")), receptor.get("nome_completo"),
+                       _numero(documento.get("valor_total_nota")), len(itens), _compactar(documento),
+                       zlib.compress(texto.encode("utf-8"), 3) if texto else None, versao)
+            if existente:
+                documento_id = existente[0]
+                conn.execute(
+                    "UPDATE documentos SET chave_acesso=?, origem=?, modelo=?, data_emissao=?, emitente=?, emitente_nome=?,"
+                    " destinatario=?, destinatario_nome=?, valor_total=?, qtd_itens=?, documento=?, texto=?, versao=?, atualizado=?"
+                    " WHERE id=?", colunas + (agora, documento_id))
+                conn.execute("DELETE FROM itens WHERE documento_id = ?", (documento_id,))
+                conn.execute("DELETE FROM cfops WHERE documento_id = ?", (documento_id,))
+            else:
+                documento_id = conn.execute(
+                    "INSERT INTO documentos (chave_acesso, origem, modelo, data_emissao, emitente, emitente_nome,"
+                    " destinatario, destinatario_nome, valor_total, qtd_itens, documento, texto, versao, criado, atualizado)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", colunas + (agora, agora)).lastrowid
+            conn.executemany(
+                "INSERT INTO itens (documento_id, indice, cfop, cst, descricao, quantidade, valor_unitario, valor_total)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(documento_id, i, item.get("codigo_operacao") or None, item.get("codigo_tributario") or None,
+                  item.get("descricao"), _numero(item.get("quantidade")), _numero(item.get("valor_unitario")),
+                  _numero(item.get("valor_total"))) for i, item in enumerate(itens)])
+            cfops = {item.get("codigo_operacao") for item in itens} - {None, ""}
+            conn.executemany("INSERT INTO cfops (cfop, data_emissao, documento_id) VALUES (?, ?, ?)",
+                             [(str(cfop), colunas[3], documento_id) for cfop in cfops])
+        if hash_conteudo:
+            conn.execute("INSERT OR REPLACE INTO arquivos (hash, documento_id, nome, recebido, versao)"
+                         " VALUES (?, ?, ?, ?, ?)", (hash_conteudo, documento_id, nome, agora, versao))
+        return documento_id
+
+    def salvar(self, documento: dict, origem: str, hash_conteudo: str = None, nome: str = None,
+               texto: str = None, versao: str = None) -> int:
+        """
+        Grava (ou atualiza, pela chave de acesso) um documento e devolve o id. Se a
+        chave já existe com origem de prioridade maior, o existente fica e o arquivo
+        só é ligado a ele. `versao` é a do pipeline que leu o documento (ver `por_arquivo`).
+        """
+        return self.salvar_lote([(documento, origem, hash_conteudo, nome, texto, versao)])[0]
+
+    def salvar_lote(self, registros) -> list:
+        """`salvar` de vários (documento, origem, hash, nome, texto[, versao]) numa transação só. Devolve os ids."""
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [self._gravar(conn, *registro) for registro in registros]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    # --- consulta ---
+
+    @staticmethod
+    def _filtros(chave=None, emitente=None, destinatario=None, data_de=None, data_ate=None, cfop=None,
+                 contagem: bool = False) -> tuple:
+        """(FROM ... WHERE ..., parâmetros, coluna da data) da consulta filtrada."""
+        condicoes, parametros = [], []
+        if chave:
+            condicoes.append("d.chave_acesso = ?")
+            parametros.append(chave_acesso(chave))
+        if emitente:
+            condicoes.append("d.emitente = ?")
+            parametros.append(id_fiscal(emitente))
+        if destinatario:
+            condicoes.append("d.destinatario = ?")
+            parametros.append(id_fiscal(destinatario))
+        seletivo = bool(condicoes)
+        origem, data = "documentos d", "d.data_emissao"
+        if cfop and seletivo:
+            # poucos documentos pelos indices acima: confere o CFOP de cada um pela chave primaria
+            condicoes.append("EXISTS (SELECT 1 FROM cfops c WHERE c.cfop = ? AND c.data_emissao IS d.data_emissao"
+                             " AND c.documento_id = d.id)")
+            parametros.append(str(cfop))
+        elif cfop:
+            # o CFOP e o filtro principal: parte da tabela cfops, que ja esta na ordem de data
+            # (pra so contar nem precisa do join: cada linha de cfops e um documento distinto)
+            origem = "cfops c" if contagem else "cfops c JOIN documentos d ON d.id = c.documento_id"
+            data = "c.data_emissao"
+            condicoes.append("c.cfop = ?")
+            parametros.append(str(cfop))
+        for valor, operador in ((data_de, ">="), (data_ate, "<=")):
+            if not valor:
+                continue
+            iso = data_iso(valor)
+            if iso is None:
+                # senao vira "data >= NULL" e a consulta volta vazia sem dizer por que
+                raise ValueError(f"Data não reconhecida: {valor!r} (use DD-MM-AAAA)")
+            condicoes.append(f"{data} {operador} ?")
+            parametros.append(iso)
+        where = " WHERE " + " AND ".join(condicoes) if condicoes else ""
+        return f"FROM {origem}{where}", parametros, data
+
+    def buscar(self, limite: int = LIMITE_CONSULTA, deslocamento: int = 0, **filtros) -> list:
+        """
+        Resumo dos documentos (sem o JSON) que passam nos filtros, mais recentes primeiro.
+        Filtros: chave, emitente, destinatario (CNPJ/CPF com ou sem pontuação),
+        data_de / data_ate (DD-MM-AAAA ou ISO) e cfop (algum item com esse CFOP).
+        """
+        consulta, parametros, data = self._filtros(**filtros)
+        colunas = ", ".join(f"d.{c}" for c in _COLUNAS_RESUMO)
+        linhas = self._conexao().execute(
+            f"SELECT {colunas} {consulta} ORDER BY {data} DESC, d.id DESC LIMIT ? OFFSET ?",
+            parametros + [limite, deslocamento]).fetchall()
+        return [dict(zip(_COLUNAS_RESUMO, linha)) for linha in linhas]
+
+    def contar(self, **filtros) -> int:
+        consulta, parametros, _ = self._filtros(**filtros, contagem=True)
+        return self._conexao().execute(f"SELECT COUNT(*) {consulta}", parametros).fetchone()[0]
+
+    def documento(self, documento_id: int) -> dict:
+        """O documento completo (formato DocumentoProcessado) pelo id, ou None."""
+        return (self._registro("WHERE d.id = ?", documento_id) or {}).get("documento")
+
+    def estatisticas(self) -> dict:
+        conn = self._conexao()
+        documentos, = conn.execute("SELECT COUNT(*) FROM documentos").fetchone()
+        arquivos, = conn.execute("SELECT COUNT(*) FROM arquivos").fetchone()
+        itens, = conn.execute("SELECT COUNT(*) FROM itens").fetchone()
+        return {"documentos": documentos, "arquivos": arquivos, "itens": itens}
+
+
+_repositorio = None
+_trava = threading.Lock()
+
+
+def repositorio():
+    """Repositório do processo (criado só quando precisa), ou None com REPOSITORIO=0."""
+    global _repositorio
+    if not REPOSITORIO:
+        return None
+    with _trava:
+        if _repositorio is None:
+            _repositorio = Repositorio()
+    return _repositorio
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chave", help="Chave de acesso (44 dígitos)")
+    ap.add_argument("--emitente", help="CNPJ/CPF do emitente")
+    ap.add_argument("--destinatario", help="CNPJ/CPF do destinatário")
+    ap.add_argument("--de", dest="data_de", help="Data de emissão inicial (DD-MM-AAAA)")
+    ap.add_argument("--ate", dest="data_ate", help="Data de emissão final (DD-MM-AAAA)")
+    ap.add_argument("--cfop", help="Documentos com algum item nesse CFOP")
+    ap.add_argument("--limite", type=int, default=LIMITE_CONSULTA)
+    ap.add_argument("--completo", action="store_true", help="Imprime o documento inteiro em vez do resumo")
+    args = ap.parse_args()
+
+    repo = Repositorio()
+    filtros = {k: v for k, v in vars(args).items() if k not in ("limite", "completo") and v}
+    try:
+        encontrados = repo.buscar(args.limite, **filtros)
+    except ValueError as e:
+        ap.error(str(e))
+    for resumo in encontrados:
+        print(json.dumps(repo.documento(resumo["id"]) if args.completo else resumo, ensure_ascii=False))
+    print(f"{repo.contar(**filtros)} documento(s) no filtro | {repo.estatisticas()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()